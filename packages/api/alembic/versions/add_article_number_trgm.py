@@ -0,0 +1,25 @@
+"""Add trigram index on products.article_number for substring search
+
+Revision ID: add_article_number_trgm
+Revises: partial_reset_token_index
+"""
+from alembic import op
+
+revision = 'add_article_number_trgm'
+down_revision = 'partial_reset_token_index'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Lets ILIKE '%q%' on article_number use an index, so the search OR can
+    # be answered with a BitmapOr over GIN indexes instead of a seq scan
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    op.execute("""
+        CREATE INDEX idx_products_article_number_trgm
+        ON products USING GIN (article_number gin_trgm_ops)
+    """)
+
+
+def downgrade():
+    op.execute("DROP INDEX IF EXISTS idx_products_article_number_trgm")
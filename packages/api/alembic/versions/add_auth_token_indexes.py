@@ -0,0 +1,44 @@
+"""Add unique indexes on auth_accounts token lookup columns
+
+Revision ID: add_auth_token_indexes
+Revises: 3fe40ab00958
+"""
+from alembic import op
+
+revision = 'add_auth_token_indexes'
+down_revision = '3fe40ab00958'
+branch_labels = None
+depends_on = None
+
+
+# Each token column with the expiry that goes with it. Tokens are single-use and
+# short-lived, so any value shared by several accounts is cleared rather than kept:
+# those accounts just request a new code or log in again.
+_TOKEN_COLUMNS = (
+    ('password_reset_token', 'password_reset_expires'),
+    ('otp_session_token', 'otp_code_expires_at'),
+    ('refresh_token_hash', 'refresh_token_expires_at'),
+)
+
+
+def upgrade():
+    for column, expires_column in _TOKEN_COLUMNS:
+        op.execute(
+            f"""
+            UPDATE auth_accounts SET {column} = NULL, {expires_column} = NULL
+            WHERE {column} IN (
+                SELECT {column} FROM auth_accounts
+                WHERE {column} IS NOT NULL
+                GROUP BY {column} HAVING count(*) > 1
+            )
+            """
+        )
+    op.create_index(op.f('ix_auth_accounts_password_reset_token'), 'auth_accounts', ['password_reset_token'], unique=True)
+    op.create_index(op.f('ix_auth_accounts_otp_session_token'), 'auth_accounts', ['otp_session_token'], unique=True)
+    op.create_index(op.f('ix_auth_accounts_refresh_token_hash'), 'auth_accounts', ['refresh_token_hash'], unique=True)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_auth_accounts_refresh_token_hash'), table_name='auth_accounts')
+    op.drop_index(op.f('ix_auth_accounts_otp_session_token'), table_name='auth_accounts')
+    op.drop_index(op.f('ix_auth_accounts_password_reset_token'), table_name='auth_accounts')
@@ -0,0 +1,32 @@
+"""Unique index on the unordered friendship pair
+
+Revision ID: add_friendship_canonical_pair_index
+Revises: add_user_search_trgm
+"""
+from alembic import op
+
+revision = 'add_friendship_canonical_pair_index'
+down_revision = 'add_user_search_trgm'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # A pair may have been stored in both directions; keep the older row.
+    # created_at is nullable, so NULLs sort first and id breaks ties.
+    op.execute("""
+        DELETE FROM friendships f
+        USING friendships g
+        WHERE f.user_id = g.friend_id
+          AND f.friend_id = g.user_id
+          AND (COALESCE(f.created_at, '-infinity'), f.id)
+              > (COALESCE(g.created_at, '-infinity'), g.id)
+    """)
+    op.execute("""
+        CREATE UNIQUE INDEX ix_friendships_pair_canonical
+        ON friendships (LEAST(user_id, friend_id), GREATEST(user_id, friend_id))
+    """)
+
+
+def downgrade():
+    op.execute("DROP INDEX IF EXISTS ix_friendships_pair_canonical")
@@ -0,0 +1,26 @@
+"""Add (friend_id, user_id) index on friendships
+
+Revision ID: add_friendship_reverse_pair_index
+Revises: add_article_number_trgm
+"""
+from alembic import op
+
+revision = 'add_friendship_reverse_pair_index'
+down_revision = 'add_article_number_trgm'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # uq_friendship_pair already covers (user_id, friend_id); the reverse pair
+    # lets "friend_id = me" lookups read the counterpart id from the index alone
+    op.create_index(
+        'ix_friendships_friend_id_user_id',
+        'friendships',
+        ['friend_id', 'user_id'],
+        unique=False,
+    )
+
+
+def downgrade():
+    op.drop_index('ix_friendships_friend_id_user_id', table_name='friendships')
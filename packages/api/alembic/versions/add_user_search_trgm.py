@@ -0,0 +1,29 @@
+"""Add trigram indexes for user search on username and email
+
+Revision ID: add_user_search_trgm
+Revises: add_friendship_reverse_pair_index
+"""
+from alembic import op
+
+revision = 'add_user_search_trgm'
+down_revision = 'add_friendship_reverse_pair_index'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # gin_trgm_ops serves ILIKE '%q%' directly, so no lower() expression index
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    op.execute("""
+        CREATE INDEX idx_users_username_trgm
+        ON users USING GIN (username gin_trgm_ops)
+    """)
+    op.execute("""
+        CREATE INDEX idx_auth_accounts_email_trgm
+        ON auth_accounts USING GIN (email gin_trgm_ops)
+    """)
+
+
+def downgrade():
+    op.execute("DROP INDEX IF EXISTS idx_auth_accounts_email_trgm")
+    op.execute("DROP INDEX IF EXISTS idx_users_username_trgm")
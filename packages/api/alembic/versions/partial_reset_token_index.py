@@ -0,0 +1,28 @@
+"""Make the password reset token index partial (non-NULL tokens only)
+
+Revision ID: partial_reset_token_index
+Revises: add_auth_token_indexes
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = 'partial_reset_token_index'
+down_revision = 'add_auth_token_indexes'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.drop_index(op.f('ix_auth_accounts_password_reset_token'), table_name='auth_accounts')
+    op.create_index(
+        'ix_auth_accounts_password_reset_token',
+        'auth_accounts',
+        ['password_reset_token'],
+        unique=True,
+        postgresql_where=sa.text('password_reset_token IS NOT NULL'),
+    )
+
+
+def downgrade():
+    op.drop_index('ix_auth_accounts_password_reset_token', table_name='auth_accounts')
+    op.create_index(op.f('ix_auth_accounts_password_reset_token'), 'auth_accounts', ['password_reset_token'], unique=True)
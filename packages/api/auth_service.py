@@ -1,8 +1,10 @@
 """
 Authentication service for user operations and OAuth integration
 """
-from typing import Optional, Dict, Any
-from sqlalchemy.orm import Session
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Dict, Any, Sequence
+from sqlalchemy import exists
+from sqlalchemy.orm import Session, contains_eager, joinedload, load_only
 from models import User, OAuthAccount, UserProfile, Gender, AuthAccount
 from oauth_service import oauth_service
 from config import settings
@@ -12,6 +14,28 @@ import jwt
 from datetime import datetime, timedelta, timezone
 import uuid
 import secrets
+import time
+
+# Hash with the same cost as real passwords, checked when an account doesn't exist
+# so unknown and known logins take the same time.
+_DUMMY_PASSWORD_HASH = bcrypt.hashpw(secrets.token_bytes(16), bcrypt.gensalt())
+
+# Decoded access-token payloads keyed by the raw token. Access tokens can't be
+# revoked before they expire, so a cached payload stays good until its own exp.
+_token_payload_cache: Dict[str, Dict[str, Any]] = {}
+_TOKEN_PAYLOAD_CACHE_MAX = 10_000
+
+# Provider userinfo keyed by sha256 of the OAuth access token, so a client retrying
+# the login with the same token doesn't pay another round trip to the provider.
+# Entries live 15 minutes, or less when the token itself says it expires sooner.
+_oauth_user_info_cache: Dict[str, tuple] = {}
+_OAUTH_USER_INFO_CACHE_MAX = 10_000
+_OAUTH_USER_INFO_TTL_SECONDS = 15 * 60
+
+# bcrypt releases the GIL, so reuse checks against the current password and the
+# last five history hashes can run side by side instead of one after another.
+_bcrypt_executor = ThreadPoolExecutor(max_workers=6, thread_name_prefix="bcrypt")
+
 
 class AuthService:
     """Authentication service for user operations"""
@@ -25,12 +49,40 @@ class AuthService:
     def verify_password(password: str, hashed: str) -> bool:
         """Verify password against hash"""
         return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
+
+    @staticmethod
+    def find_matching_hash(password: str, hashes: Sequence[str]) -> Optional[int]:
+        """Index of the first hash the password matches, checking all hashes concurrently"""
+        if not hashes:
+            return None
+        encoded = password.encode('utf-8')
+        matches = _bcrypt_executor.map(
+            lambda h: bcrypt.checkpw(encoded, h.encode('utf-8')), hashes
+        )
+        for i, matched in enumerate(matches):
+            if matched:
+                return i
+        return None
+
+    @staticmethod
+    def verify_password_timing_safe(password: str, hashed: Optional[str]) -> bool:
+        """Verify password, spending one bcrypt check even when there is no hash"""
+        if not hashed:
+            bcrypt.checkpw(password.encode('utf-8'), _DUMMY_PASSWORD_HASH)
+            return False
+        return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
     
     @staticmethod
-    def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
-        """Create JWT access token"""
+    def create_access_token(
+        data: dict,
+        expires_delta: Optional[timedelta] = None,
+        expires_at: Optional[datetime] = None,
+    ) -> str:
+        """Create JWT access token. Pass expires_at to reuse an expiry the caller already computed."""
         to_encode = data.copy()
-        if expires_delta:
+        if expires_at:
+            expire = expires_at
+        elif expires_delta:
             expire = datetime.now(timezone.utc) + expires_delta
         else:
             expire = datetime.now(timezone.utc) + timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
@@ -41,11 +93,20 @@ class AuthService:
     @staticmethod
     def verify_token_payload(token: str) -> Optional[Dict[str, Any]]:
         """Verify JWT token and return its payload"""
+        cached = _token_payload_cache.get(token)
+        if cached is not None:
+            if cached["exp"] > time.time():
+                return cached
+            _token_payload_cache.pop(token, None)
         try:
             payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
-            return payload
         except jwt.PyJWTError:
             return None
+        if isinstance(payload.get("exp"), (int, float)):
+            if len(_token_payload_cache) >= _TOKEN_PAYLOAD_CACHE_MAX:
+                _token_payload_cache.clear()
+            _token_payload_cache[token] = payload
+        return payload
     
     @staticmethod
     def create_user(
@@ -102,6 +163,59 @@ class AuthService:
             User.deleted_at.is_(None),
         ).first()
 
+    @staticmethod
+    def get_user_for_login(db: Session, identifier: str, by_email: bool) -> Optional[User]:
+        """Get a user for password login, loading only the columns login reads or writes.
+
+        Skips wide columns such as password_history and pulls avatar_url in the same query.
+        """
+        account_columns = (
+            AuthAccount.id,
+            AuthAccount.email,
+            AuthAccount.password_hash,
+            AuthAccount.is_email_verified,
+            AuthAccount.failed_login_attempts,
+            AuthAccount.login_locked_until,
+        )
+        query = db.query(User).options(
+            load_only(
+                User.id,
+                User.username,
+                User.auth_account_id,
+                User.is_active,
+                User.created_at,
+                User.updated_at,
+            ),
+            joinedload(User.profile).load_only(UserProfile.id, UserProfile.avatar_url),
+        )
+        if by_email:
+            query = query.join(User.auth_account).options(
+                contains_eager(User.auth_account).load_only(*account_columns)
+            ).filter(AuthAccount.email == identifier)
+        else:
+            query = query.options(
+                joinedload(User.auth_account).load_only(*account_columns)
+            ).filter(User.username == identifier)
+        return query.filter(User.deleted_at.is_(None)).first()
+
+    @staticmethod
+    def email_exists(db: Session, email: str) -> bool:
+        """Check whether a non-deleted user owns this email without loading the row"""
+        return db.query(
+            exists().where(
+                User.auth_account_id == AuthAccount.id,
+                AuthAccount.email == email,
+                User.deleted_at.is_(None),
+            )
+        ).scalar()
+
+    @staticmethod
+    def username_exists(db: Session, username: str) -> bool:
+        """Check whether a non-deleted user has this username without loading the row"""
+        return db.query(
+            exists().where(User.username == username, User.deleted_at.is_(None))
+        ).scalar()
+
     @staticmethod
     def get_user_by_id(db: Session, user_id: str) -> Optional[User]:
         """Get user by ID (excludes deleted accounts)"""
@@ -168,19 +282,35 @@ class AuthService:
     async def handle_oauth_login(db: Session, provider: str, token: str) -> Optional[Dict[str, Any]]:
         """Handle OAuth login for a specific provider"""
         user_info = None
-        
+        cache_key = f"{provider}:{hashlib.sha256(token.encode()).hexdigest()}"
+        cached = _oauth_user_info_cache.get(cache_key)
+        if cached is not None:
+            if cached[0] > time.time():
+                user_info = cached[1]
+            else:
+                _oauth_user_info_cache.pop(cache_key, None)
+
         # Get user info from provider
-        if provider == 'google':
-            user_info = await oauth_service.get_google_user_info(token)
-        elif provider == 'facebook':
-            user_info = await oauth_service.get_facebook_user_info(token)
-        elif provider == 'github':
-            user_info = await oauth_service.get_github_user_info(token)
-        elif provider == 'apple':
-            user_info = await oauth_service.verify_apple_token(token)
-        
-        if not user_info:
-            return None
+        if user_info is None:
+            if provider == 'google':
+                user_info = await oauth_service.get_google_user_info(token)
+            elif provider == 'facebook':
+                user_info = await oauth_service.get_facebook_user_info(token)
+            elif provider == 'github':
+                user_info = await oauth_service.get_github_user_info(token)
+            elif provider == 'apple':
+                user_info = await oauth_service.verify_apple_token(token)
+
+            if not user_info:
+                return None
+            cache_until = time.time() + _OAUTH_USER_INFO_TTL_SECONDS
+            token_exp = user_info.get('token_exp')
+            if isinstance(token_exp, (int, float)):
+                cache_until = min(cache_until, token_exp)
+            if cache_until > time.time():
+                if len(_oauth_user_info_cache) >= _OAUTH_USER_INFO_CACHE_MAX:
+                    _oauth_user_info_cache.clear()
+                _oauth_user_info_cache[cache_key] = (cache_until, user_info)
         
         # Check if OAuth account already exists
         oauth_account = AuthService.get_oauth_account(
@@ -216,16 +346,16 @@ class AuthService:
                 )
         
         # Create access token
-        access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
+        expires_at = datetime.now(timezone.utc) + timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
         access_token = AuthService.create_access_token(
-            data={"sub": user.id}, expires_delta=access_token_expires
+            data={"sub": user.id}, expires_at=expires_at
         )
         
         # Get avatar_url from profile if it exists
         avatar_url = user.profile.avatar_url if user.profile else None
         return {
             "token": access_token,
-            "expires_at": datetime.now(timezone.utc) + access_token_expires,
+            "expires_at": expires_at,
             "user": {
                 "id": user.id,
                 "username": user.username,
@@ -249,7 +379,7 @@ class AuthService:
         username = base_username
         counter = 1
         
-        while AuthService.get_user_by_username(db, username):
+        while AuthService.username_exists(db, username):
             username = f"{base_username}{counter}"
             counter += 1
         
@@ -270,10 +400,10 @@ class AuthService:
         return code
 
     def create_password_reset_token(self, db: Session, principal):
-        """Generate and store a password reset token (principal is User or Brand with auth_account)."""
+        """Generate a password reset token, store it hashed, return raw (principal is User or Brand)."""
         token = self._generate_secure_token()
         acc = principal.auth_account
-        acc.password_reset_token = token
+        acc.password_reset_token = hashlib.sha256(token.encode()).hexdigest()
         acc.password_reset_expires = datetime.now(timezone.utc) + timedelta(minutes=15)
         db.commit()
         return token
@@ -342,12 +472,19 @@ class AuthService:
 
     @staticmethod
     def verify_refresh_token(db: Session, raw_token: str) -> Optional[AuthAccount]:
-        """Verify refresh token; return AuthAccount or None."""
+        """Verify refresh token; return AuthAccount or None.
+
+        The linked user (with profile) or brand is loaded in the same query, since
+        the refresh endpoint reads both to build its response.
+        """
         token_hash = hashlib.sha256(raw_token.encode()).hexdigest()
-        acc = db.query(AuthAccount).filter(AuthAccount.refresh_token_hash == token_hash).first()
-        if not acc or not acc.refresh_token_expires_at or acc.refresh_token_expires_at < datetime.now(timezone.utc):
-            return None
-        return acc
+        return db.query(AuthAccount).options(
+            joinedload(AuthAccount.user).joinedload(User.profile),
+            joinedload(AuthAccount.brand),
+        ).filter(
+            AuthAccount.refresh_token_hash == token_hash,
+            AuthAccount.refresh_token_expires_at >= datetime.now(timezone.utc),
+        ).first()
 
     @staticmethod
     def revoke_refresh_token(db: Session, auth_account: AuthAccount) -> None:
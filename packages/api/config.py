@@ -39,6 +39,12 @@ class Settings:
     
     # Database Configuration
     DATABASE_URL: str = os.getenv("DATABASE_URL")
+    DB_POOL_SIZE: int = int(os.getenv("DB_POOL_SIZE", "20"))
+    DB_MAX_OVERFLOW: int = int(os.getenv("DB_MAX_OVERFLOW", "40"))
+    DB_POOL_TIMEOUT: int = int(os.getenv("DB_POOL_TIMEOUT", "30"))
+    # Compiled SQL cache entries per engine; the default 500 is too small for
+    # the number of distinct statements the endpoints issue
+    DB_QUERY_CACHE_SIZE: int = int(os.getenv("DB_QUERY_CACHE_SIZE", "1200"))
     
     @property
     def get_database_url(self) -> str:
@@ -93,6 +99,10 @@ class Settings:
     MAX_USERNAME_LENGTH: int = 50
     MAX_EMAIL_LENGTH: int = 255
     
+    # Rate limiting storage shared across workers/replicas (e.g. redis://host:6379/0).
+    # Defaults to per-process memory, which is only suitable for a single worker.
+    RATE_LIMIT_STORAGE_URI: str = os.getenv("RATE_LIMIT_STORAGE_URI", "memory://")
+
     # Logging
     LOG_LEVEL: str = os.getenv("LOG_LEVEL", "INFO" if ENVIRONMENT == "production" else "DEBUG")
     
@@ -11,6 +11,10 @@ from models import Base
 # Create database engine
 engine = create_engine(
     settings.get_database_url,
+    pool_size=settings.DB_POOL_SIZE,
+    max_overflow=settings.DB_MAX_OVERFLOW,
+    pool_timeout=settings.DB_POOL_TIMEOUT,
+    query_cache_size=settings.DB_QUERY_CACHE_SIZE,
     pool_pre_ping=True,
     pool_recycle=3600,
     echo=settings.DEBUG
@@ -1,3 +1,4 @@
+import hashlib
 import json
 import logging
 import random
@@ -6,10 +7,12 @@ import secrets
 import time
 import uuid
 from contextlib import asynccontextmanager
+from functools import lru_cache
 from datetime import datetime, timedelta, timezone
-from typing import List, Literal, Optional
+from typing import Iterable, List, Literal, Optional, Set
 
 import notification_service
+import orjson
 import payment_service
 import profanity
 import recommendation_service
@@ -21,10 +24,11 @@ from auth_service import auth_service
 # Import our modules
 from config import settings
 from database import get_db, init_db, SessionLocal
-from fastapi import Depends, FastAPI, HTTPException, Query, Request, status
+from fastapi import BackgroundTasks, Depends, FastAPI, HTTPException, Query, Request, status
+from fastapi.concurrency import run_in_threadpool
 from fastapi.exceptions import RequestValidationError
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse, RedirectResponse
+from fastapi.responses import JSONResponse, ORJSONResponse, RedirectResponse, Response
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
 from mail_service import mail_service
 from models import (
@@ -61,15 +65,24 @@ from models import (
     Payment as PaymentModel,
 )
 from oauth_service import oauth_service
-from pydantic import BaseModel, Field, ValidationError, field_validator
+from pydantic import (
+    BaseModel,
+    Field,
+    PrivateAttr,
+    TypeAdapter,
+    ValidationError,
+    field_validator,
+    model_validator,
+)
 from schemas import UserCreate
 from slowapi import Limiter, _rate_limit_exceeded_handler
 from slowapi.errors import RateLimitExceeded
 from slowapi.util import get_remote_address
-from sqlalchemy import case, func, or_, text
-from sqlalchemy.orm import Session, joinedload, subqueryload
+from sqlalchemy import and_, bindparam, case, delete, exists, func, insert, literal, or_, select, text, union, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session, contains_eager, joinedload, lazyload, load_only, selectinload
+from sqlalchemy.orm.attributes import flag_modified
 from starlette.middleware.base import BaseHTTPMiddleware
-from starlette.responses import Response
 from storage_service import generate_key, generate_presigned_upload_url
 from storage_service import is_configured as s3_configured
 
@@ -85,7 +98,7 @@ CONTENT_TYPE_TO_EXTENSION = {
 
 
 # Size ordering utility — delegates to size_config for category-aware sorting
-from size_config import get_size_sort_key, validate_size, validate_size_consistency, normalize_size, get_size_types, STANDARD_SIZES, WAIST_VALUES, LENGTH_VALUES
+from size_config import get_size_sort_key, validate_size, validate_size_consistency, normalize_size, get_size_types, EU_SHOE_SIZES, STANDARD_SIZES, WAIST_VALUES, LENGTH_VALUES
 
 
 def sort_variants_by_size(variants, category_id=""):
@@ -131,18 +144,88 @@ def determine_file_extension(content_type: str, filename: Optional[str] = None)
     return CONTENT_TYPE_TO_EXTENSION.get(normalized_content_type, ".jpg")
 
 
-def _product_eager_options():
-    """Standard eager-load options for Product queries feeding product_to_schema()."""
+def _product_eager_options(brand_joined: bool = False):
+    """Standard eager-load options for Product queries feeding product_to_schema().
+
+    Only the columns product_to_schema() reads are loaded (no search_vector tsvector,
+    no brand AuthAccount). Collections use selectinload so styles x colors x sizes
+    don't multiply into one wide joined result. Pass brand_joined=True when the
+    query already does .join(Brand): Product.brand is then filled from that join
+    via contains_eager instead of a second, aliased LEFT JOIN to brands.
+    """
+    brand_loader = contains_eager if brand_joined else joinedload
     return [
-        joinedload(Product.brand),
-        joinedload(Product.styles),
-        joinedload(Product.color_variants).joinedload(ProductColorVariant.variants),
+        load_only(
+            Product.id,
+            Product.name,
+            Product.description,
+            Product.price,
+            Product.material,
+            Product.country_of_manufacture,
+            Product.article_number,
+            Product.delivery_time_min,
+            Product.delivery_time_max,
+            Product.sale_price,
+            Product.sale_type,
+            Product.sizing_table_image,
+            Product.brand_id,
+            Product.category_id,
+            Product.general_images,
+        ),
+        brand_loader(Product.brand).options(
+            load_only(
+                Brand.id,
+                Brand.name,
+                Brand.return_policy,
+                Brand.delivery_time_min,
+                Brand.delivery_time_max,
+                Brand.is_inactive,
+            ),
+            lazyload(Brand.auth_account),
+        ),
+        selectinload(Product.styles),
+        selectinload(Product.color_variants).selectinload(ProductColorVariant.variants),
     ]
 
 
+# Hot-path lookups built once at import and bound per call, so requests skip
+# rebuilding the Query and hit the same compiled-statement cache entry.
+_PRODUCT_BY_ID_STMT = (
+    select(Product)
+    .options(*_product_eager_options())
+    .where(Product.id == bindparam("product_id"))
+)
+_ORDER_BY_ID_STMT = select(Order).where(Order.id == bindparam("order_id"))
+_PRODUCT_LIKED_STMT = select(
+    exists().where(
+        UserLikedProduct.user_id == bindparam("user_id"),
+        UserLikedProduct.product_id == bindparam("product_id"),
+    )
+)
+
+
+def _liked_product_ids(db: Session, user_id: str, product_ids: Iterable[str]) -> Set[str]:
+    """Return which of product_ids the user has liked, fetching only the id column."""
+    product_ids = list(product_ids)
+    if not product_ids:
+        return set()
+    return set(
+        db.execute(
+            select(UserLikedProduct.product_id).where(
+                UserLikedProduct.user_id == user_id,
+                UserLikedProduct.product_id.in_(product_ids),
+            )
+        ).scalars()
+    )
+
+
 def product_to_schema(product, is_liked=None):
-    """Build schemas.Product from Product model with color_variants."""
-    return schemas.Product(
+    """Build schemas.Product from Product model with color_variants.
+
+    Values come straight from typed DB columns, so the models are built with
+    model_construct() and skip per-field validation on every list row.
+    """
+    return schemas.Product.model_construct(
         id=product.id,
         name=product.name,
         description=product.description,
@@ -151,13 +234,13 @@ def product_to_schema(product, is_liked=None):
         category_id=product.category_id,
         styles=[ps.style_id for ps in product.styles],
         color_variants=[
-            schemas.ProductColorVariantSchema(
+            schemas.ProductColorVariantSchema.model_construct(
                 id=cv.id,
                 color_name=cv.color_name,
                 color_hex=cv.color_hex,
                 images=cv.images or [],
                 variants=[
-                    schemas.ProductVariantSchema(
+                    schemas.ProductVariantSchema.model_construct(
                         id=v.id, size=v.size, stock_quantity=v.stock_quantity
                     )
                     for v in sort_variants_by_size(cv.variants, product.category_id)
@@ -187,7 +270,27 @@ def product_to_schema(product, is_liked=None):
 
 logger = logging.getLogger(__name__)
 
-limiter = Limiter(key_func=get_remote_address)
+def _rate_limit_key(request: Request) -> str:
+    """Bucket authenticated calls per account and anonymous ones per client IP.
+
+    Keying on the token's subject keeps users behind a shared NAT or carrier IP
+    from draining each other's limits. Invalid or missing tokens fall back to IP.
+    """
+    authorization = request.headers.get("authorization", "")
+    scheme, _, token = authorization.partition(" ")
+    if scheme.lower() == "bearer" and token:
+        payload = auth_service.verify_token_payload(token)
+        if payload and payload.get("sub"):
+            kind = "brand" if payload.get("is_brand") else "user"
+            return f"{kind}:{payload['sub']}"
+    return get_remote_address(request)
+
+
+limiter = Limiter(
+    key_func=_rate_limit_key,
+    storage_uri=settings.RATE_LIMIT_STORAGE_URI,
+    strategy="moving-window",
+)
 
 _is_production = settings.ENVIRONMENT == "production"
 
@@ -212,6 +315,7 @@ app = FastAPI(
     docs_url=None if _is_production else "/docs",
     redoc_url=None if _is_production else "/redoc",
     lifespan=lifespan,
+    default_response_class=ORJSONResponse,
 )
 app.state.limiter = limiter
 app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
@@ -307,10 +411,19 @@ security = HTTPBearer()
 # Pydantic Models
 
 
+EMAIL_RE = re.compile(r"^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$")
+# Username pattern: alphanumeric, underscores, hyphens, #, $, !
+USERNAME_RE = re.compile(r"^[a-zA-Z0-9_\-#$!]+$")
+
+
 class UserLogin(BaseModel):
     identifier: str  # Can be either email or username
     password: str
 
+    _identifier_kind: Literal["email", "username", "invalid"] = PrivateAttr(
+        default="invalid"
+    )
+
     @field_validator("identifier", mode="before")
     @classmethod
     def validate_identifier(cls, v):
@@ -318,16 +431,28 @@ class UserLogin(BaseModel):
             raise ValueError("Identifier cannot be empty")
         return v.strip()
 
+    @model_validator(mode="after")
+    def classify_identifier(self):
+        if EMAIL_RE.match(self.identifier):
+            self._identifier_kind = "email"
+        elif USERNAME_RE.match(self.identifier):
+            self._identifier_kind = "username"
+        else:
+            self._identifier_kind = "invalid"
+        return self
+
+    @property
+    def identifier_kind(self) -> str:
+        """'email', 'username' or 'invalid' — classified once during validation"""
+        return self._identifier_kind
+
     def is_email(self) -> bool:
         """Check if the identifier is an email address"""
-        email_pattern = r"^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$"
-        return bool(re.match(email_pattern, self.identifier))
+        return self._identifier_kind == "email"
 
     def is_username(self) -> bool:
         """Check if the identifier is a username"""
-        # Username pattern: alphanumeric, underscores, hyphens, #, $, !
-        username_pattern = r"^[a-zA-Z0-9_\-#$!]+$"
-        return bool(re.match(username_pattern, self.identifier)) and not self.is_email()
+        return self._identifier_kind == "username"
 
 
 class OAuthLogin(BaseModel):
@@ -461,6 +586,50 @@ class OAuthProviderResponse(BaseModel):
     scope: str
 
 
+# Provider config only changes with the environment, so build the list once at import
+_OAUTH_PROVIDERS: List[OAuthProviderResponse] = [
+    OAuthProviderResponse(
+        provider=provider,
+        client_id=client_id,
+        redirect_url=f"{settings.OAUTH_REDIRECT_URL}/{provider}",
+        scope=scope,
+    )
+    for provider, client_id, scope in (
+        ("google", settings.GOOGLE_CLIENT_ID, "openid email profile"),
+        ("facebook", settings.FACEBOOK_CLIENT_ID, "email public_profile"),
+        ("github", settings.GITHUB_CLIENT_ID, "read:user user:email"),
+        ("apple", settings.APPLE_CLIENT_ID, "name email"),
+    )
+    if client_id
+]
+_OAUTH_PROVIDERS_JSON = orjson.dumps([p.model_dump(mode="json") for p in _OAUTH_PROVIDERS])
+
+
+def _etag_response(request: Request, body: bytes, cache_control: str) -> Response:
+    """Return body with an ETag, or an empty 304 if the client's If-None-Match already matches."""
+    etag = f'"{hashlib.blake2b(body, digest_size=8).hexdigest()}"'
+    headers = {"ETag": etag, "Cache-Control": cache_control}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+@lru_cache(maxsize=None)
+def _list_adapter(model: type) -> TypeAdapter:
+    return TypeAdapter(List[model])
+
+
+def _model_list_response(model: type, items: list) -> Response:
+    """Encode already-built response models in a single pydantic-core call.
+
+    Returning a Response skips FastAPI's response_model re-validation and
+    jsonable_encoder pass; the route's response_model still documents the schema.
+    """
+    return Response(
+        content=_list_adapter(model).dump_json(items), media_type="application/json"
+    )
+
+
 # Dependency to get current user (can be User or Brand)
 def get_current_user(
     credentials: HTTPAuthorizationCredentials = Depends(security),
@@ -513,16 +682,34 @@ def get_current_brand_user(
     return current_user
 
 
+_PAYMENT_SETTLED_STATUSES = frozenset(
+    {
+        OrderStatus.PAID,
+        OrderStatus.SHIPPED,
+        OrderStatus.RETURNED,
+        OrderStatus.PARTIALLY_RETURNED,
+        OrderStatus.CANCELED,
+    }
+)
+
+
 @app.get("/api/v1/payments/status", response_model=PaymentStatusResponse)
 @limiter.limit("30/minute")
-async def get_payment_status(
+def get_payment_status(
     request: Request,
     payment_id: str,
     current_user=Depends(get_current_user),
     db: Session = Depends(get_db),
 ):
     """Get the status of a payment by its ID and update it from YooKassa"""
-    order = db.query(Order).filter(Order.id == payment_id).first()
+    # The order and its YooKassa payment id in one round-trip
+    row = (
+        db.query(Order, PaymentModel.id)
+        .outerjoin(PaymentModel, PaymentModel.order_id == Order.id)
+        .filter(Order.id == payment_id)
+        .first()
+    )
+    order, yookassa_payment_id = row if row else (None, None)
     if not order:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="Платёж не найден"
@@ -541,26 +728,31 @@ async def get_payment_status(
                 status_code=status.HTTP_403_FORBIDDEN, detail="Нет доступа к этому заказу"
             )
 
-    # Fetch real-time status from YooKassa
-    payment_record = db.query(PaymentModel).filter(PaymentModel.order_id == payment_id).first()
+    # Orders past payment can't be changed by YooKassa any more; skip the upstream call
+    if order.status in _PAYMENT_SETTLED_STATUSES:
+        return PaymentStatusResponse(status=order.status.value)
+
+    # Fetch real-time status from YooKassa (cached for a couple of seconds)
     yookassa_status = (
-        payment_service.get_yookassa_payment_status(payment_record.id)
-        if payment_record
+        payment_service.get_yookassa_payment_status(yookassa_payment_id)
+        if yookassa_payment_id
         else None
     )
     if yookassa_status:
         # Update local order status if different
         if order.status.value.lower() != yookassa_status.lower():
-            print(
-                f"Updating order {order.id} status from {order.status.value} to {yookassa_status} based on YooKassa."
+            logger.debug(
+                "Updating order %s status from %s to %s based on YooKassa",
+                order.id, order.status.value, yookassa_status,
             )
-            order.status = OrderStatus(
+            new_status = OrderStatus(
                 yookassa_status.upper()
             )  # Assuming YooKassa status matches OrderStatus enum
+            order.status = new_status
             db.commit()
-            db.refresh(order)
+            return PaymentStatusResponse(status=new_status.value)
     else:
-        print(f"Could not fetch real-time status for order {order.id} from YooKassa.")
+        logger.warning("Could not fetch real-time status for order %s from YooKassa", order.id)
 
     return PaymentStatusResponse(status=order.status.value)
 
@@ -603,7 +795,7 @@ def generate_brand_slug(name: str, db) -> str:
 
 @app.get("/api/v1/brands/profile", response_model=schemas.BrandResponse)
 @limiter.limit("30/minute")
-async def get_brand_profile(
+def get_brand_profile(
     request: Request,
     current_brand_user: User = Depends(get_current_brand_user),
     db: Session = Depends(get_db),
@@ -611,43 +803,9 @@ async def get_brand_profile(
     """Get the authenticated brand user's profile"""
     brand = current_brand_user
 
-    return schemas.BrandResponse(
-        id=str(brand.id),
-        name=str(brand.name),  # type: ignore
-        email=brand.auth_account.email,
-        slug=str(brand.slug),  # type: ignore
-        logo=str(brand.logo) if brand.logo else None,  # type: ignore
-        description=str(brand.description) if brand.description else None,  # type: ignore
-        return_policy=str(brand.return_policy) if brand.return_policy else None,  # type: ignore
-        min_free_shipping=int(brand.min_free_shipping)
-        if brand.min_free_shipping
-        else None,  # type: ignore
-        shipping_price=float(brand.shipping_price) if brand.shipping_price else None,  # type: ignore
-        shipping_provider=str(brand.shipping_provider)
-        if brand.shipping_provider
-        else None,  # type: ignore
-        amount_withdrawn=float(brand.amount_withdrawn),  # type: ignore
-        inn=str(brand.inn) if brand.inn else None,  # type: ignore
-        official_name=str(brand.official_name) if brand.official_name else None,  # type: ignore
-        contact_phone=str(brand.contact_phone) if brand.contact_phone else None,  # type: ignore
-        tax_system=str(brand.tax_system) if brand.tax_system else None,  # type: ignore
-        vat_payer=brand.vat_payer,  # type: ignore
-        vat_rate=str(brand.vat_rate) if brand.vat_rate else None,  # type: ignore
-        registration_address=str(brand.registration_address)
-        if brand.registration_address
-        else None,  # type: ignore
-        payout_account=str(brand.payout_account) if brand.payout_account else None,  # type: ignore
-        delivery_time_min=int(brand.delivery_time_min)
-        if brand.delivery_time_min
-        else None,  # type: ignore
-        delivery_time_max=int(brand.delivery_time_max)
-        if brand.delivery_time_max
-        else None,  # type: ignore
-        is_inactive=bool(brand.is_inactive),
-        scheduled_deletion_at=brand.scheduled_deletion_at,  # type: ignore
-        two_factor_enabled=bool(brand.auth_account.two_factor_enabled),
-        created_at=brand.created_at,  # type: ignore
-        updated_at=brand.updated_at,  # type: ignore
+    payload = schemas.BrandResponse.model_validate(brand)
+    return _etag_response(
+        request, orjson.dumps(payload.model_dump(mode="json")), "private, no-cache"
     )
 
 
@@ -680,13 +838,25 @@ _REVENUE_STATUSES = [
 
 @app.get("/api/v1/brands/stats", response_model=BrandStatsResponse)
 @limiter.limit("60/minute")
-async def get_brand_stats(
+def get_brand_stats(
     request: Request,
     current_brand_user: Brand = Depends(get_current_brand_user),
     db: Session = Depends(get_db),
 ):
     """Get statistics for the authenticated brand user"""
 
+    # Shipping revenue (Order.brand_id exists directly), folded into the item
+    # aggregate below as a scalar subquery so the stats take one round-trip
+    shipping_total = (
+        select(func.coalesce(func.sum(Order.shipping_cost), 0.0))
+        .where(
+            Order.brand_id == current_brand_user.id,
+            Order.status.in_(_REVENUE_STATUSES),
+        )
+        .correlate(None)
+        .scalar_subquery()
+    )
+
     # Item-level revenue aggregation (only paid+ orders)
     row = (
         db.query(
@@ -705,7 +875,9 @@ async def get_brand_stats(
                 ),
                 0.0,
             ).label("returned"),
+            shipping_total.label("shipping"),
         )
+        .select_from(OrderItem)
         .join(Order, OrderItem.order_id == Order.id)
         .join(ProductVariant, OrderItem.product_variant_id == ProductVariant.id)
         .join(
@@ -720,32 +892,25 @@ async def get_brand_stats(
         .one()
     )
 
-    # Shipping revenue (Order.brand_id exists directly)
-    shipping_total = (
-        db.query(func.coalesce(func.sum(Order.shipping_cost), 0.0))
-        .filter(
-            Order.brand_id == current_brand_user.id,
-            Order.status.in_(_REVENUE_STATUSES),
-        )
-        .scalar()
-    ) or 0.0
-
-    total_sold = float(row.gross) + float(shipping_total)
+    total_sold = float(row.gross) + float(row.shipping or 0.0)
     total_returned = float(row.returned)
     total_withdrawn = float(current_brand_user.amount_withdrawn or 0)
     current_balance = total_sold - total_withdrawn
 
-    return BrandStatsResponse(
-        total_sold=total_sold,
-        total_returned=total_returned,
-        total_withdrawn=total_withdrawn,
-        current_balance=current_balance,
+    # Dict is already BrandStatsResponse-shaped; skip response_model re-validation
+    return ORJSONResponse(
+        {
+            "total_sold": total_sold,
+            "total_returned": total_returned,
+            "total_withdrawn": total_withdrawn,
+            "current_balance": current_balance,
+        }
     )
 
 
 @app.get("/api/v1/user/stats", response_model=UserStatsResponse)
 @limiter.limit("60/minute")
-async def get_user_stats(
+def get_user_stats(
     request: Request,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db),
@@ -754,49 +919,52 @@ async def get_user_stats(
     if isinstance(current_user, Brand):
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not a user account")
 
-    # Items purchased: from PAID/SHIPPED orders (via Order.user_id or Checkout)
-    items_purchased = (
-        db.query(func.count(OrderItem.id))
-        .join(Order)
-        .filter(
-            Order.user_id == str(current_user.id),
-            Order.status.in_([OrderStatus.PAID, OrderStatus.SHIPPED]),
-        )
-        .scalar()
-        or 0
-    )
-
+    user_id = str(current_user.id)
+    # All counts as scalar subqueries of one SELECT: a single round-trip
+    stats = db.execute(
+        select(
+            # Items purchased: from PAID/SHIPPED orders (via Order.user_id or Checkout)
+            select(func.count(OrderItem.id))
+            .join(Order)
+            .where(
+                Order.user_id == user_id,
+                Order.status.in_([OrderStatus.PAID, OrderStatus.SHIPPED]),
+            )
+            .scalar_subquery()
+            .label("items_purchased"),
+            select(func.count(Checkout.id))
+            .where(Checkout.user_id == user_id)
+            .scalar_subquery()
+            .label("checkouts"),
+            select(func.count(Order.id))
+            .where(Order.user_id == user_id)
+            .scalar_subquery()
+            .label("orders"),
+        )
+    ).one()
+
+    items_purchased = stats.items_purchased or 0
     items_swiped = current_user.items_swiped or 0
-
     # Total orders: Checkouts (purchases) for user, fallback to Order count for legacy
-    total_orders = (
-        db.query(func.count(Checkout.id))
-        .filter(Checkout.user_id == str(current_user.id))
-        .scalar()
-        or 0
-    )
-    if total_orders == 0:
-        total_orders = (
-            db.query(func.count(Order.id))
-            .filter(Order.user_id == str(current_user.id))
-            .scalar()
-            or 0
-        )
+    total_orders = stats.checkouts or stats.orders or 0
 
     # Calculate account age in days
     account_age_days = (datetime.now(timezone.utc) - current_user.created_at).days
 
-    return UserStatsResponse(
-        items_purchased=items_purchased,
-        items_swiped=items_swiped,
-        total_orders=total_orders,
-        account_age_days=account_age_days,
+    # Dict is already UserStatsResponse-shaped; skip response_model re-validation
+    return ORJSONResponse(
+        {
+            "items_purchased": items_purchased,
+            "items_swiped": items_swiped,
+            "total_orders": total_orders,
+            "account_age_days": account_age_days,
+        }
     )
 
 
 @app.post("/api/v1/user/swipe", response_model=MessageResponse)
 @limiter.limit("60/minute")
-async def track_user_swipe(
+def track_user_swipe(
     request: Request,
     swipe_data: SwipeTrackingRequest,
     current_user: User = Depends(get_current_user),
@@ -806,19 +974,34 @@ async def track_user_swipe(
     if isinstance(current_user, Brand):
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not a user account")
 
-    # Verify product exists (ID-only check)
-    if not db.query(Product.id).filter(Product.id == swipe_data.product_id).first():
+    # Record the swipe and bump the counter in one statement:
+    # WITH swipe AS (INSERT ... SELECT FROM products ... RETURNING) UPDATE users ...
+    # Selecting the product row makes the insert a no-op for unknown ids, so no
+    # separate existence check is needed. The increment is done in SQL so rapid
+    # concurrent swipes don't overwrite each other's count.
+    swipe = (
+        insert(UserSwipe)
+        .from_select(
+            ["user_id", "product_id", "created_at"],
+            select(
+                literal(current_user.id),
+                Product.id,
+                literal(datetime.now(timezone.utc)),
+            ).where(Product.id == swipe_data.product_id),
+        )
+        .returning(UserSwipe.user_id)
+        .cte("swipe")
+    )
+    counted = db.execute(
+        update(User)
+        .where(User.id == select(swipe.c.user_id).scalar_subquery())
+        .values(items_swiped=func.coalesce(User.items_swiped, 0) + 1)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    if not counted:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="Product not found"
         )
-
-    # Create swipe record and increment counter (Option 2)
-    user_swipe = UserSwipe(
-        user_id=current_user.id,
-        product_id=swipe_data.product_id,
-    )
-    db.add(user_swipe)
-    current_user.items_swiped = (current_user.items_swiped or 0) + 1
     db.commit()
 
     return {"message": "Swipe tracked successfully"}
@@ -826,7 +1009,7 @@ async def track_user_swipe(
 
 @app.put("/api/v1/brands/profile", response_model=schemas.BrandResponse)
 @limiter.limit("30/minute")
-async def update_brand_profile(
+def update_brand_profile(
     request: Request,
     brand_data: schemas.BrandUpdate,
     current_brand_user: User = Depends(get_current_brand_user),
@@ -835,79 +1018,37 @@ async def update_brand_profile(
     """Update the authenticated brand user's delivery settings"""
     brand = current_brand_user
 
-    if brand_data.official_name is not None:
-        brand.official_name = brand_data.official_name  # type: ignore
-    if brand_data.shipping_price is not None:
-        brand.shipping_price = brand_data.shipping_price  # type: ignore
-    if brand_data.shipping_provider is not None:
-        brand.shipping_provider = brand_data.shipping_provider  # type: ignore
-    if brand_data.delivery_time_min is not None:
-        brand.delivery_time_min = brand_data.delivery_time_min
-    if brand_data.delivery_time_max is not None:
-        brand.delivery_time_max = brand_data.delivery_time_max
-    if brand_data.return_policy is not None:
-        brand.return_policy = brand_data.return_policy  # type: ignore
-    if brand_data.min_free_shipping is not None:
-        brand.min_free_shipping = brand_data.min_free_shipping  # type: ignore
+    # Only fields the client actually sent with a value; null keeps the stored value
+    for field, value in brand_data.model_dump(exclude_none=True).items():
+        setattr(brand, field, value)
 
     brand.updated_at = datetime.now(timezone.utc)  # type: ignore
+    response = schemas.BrandResponse.model_validate(brand)
     db.commit()
-    db.refresh(brand)
+    invalidate_reference_cache("brands")
 
-    return schemas.BrandResponse(
-        id=str(brand.id),
-        name=str(brand.name),  # type: ignore
-        email=brand.auth_account.email,
-        slug=str(brand.slug),  # type: ignore
-        logo=str(brand.logo) if brand.logo else None,  # type: ignore
-        description=str(brand.description) if brand.description else None,  # type: ignore
-        return_policy=str(brand.return_policy) if brand.return_policy else None,  # type: ignore
-        min_free_shipping=int(brand.min_free_shipping)
-        if brand.min_free_shipping
-        else None,  # type: ignore
-        shipping_price=float(brand.shipping_price) if brand.shipping_price else None,  # type: ignore
-        shipping_provider=str(brand.shipping_provider)
-        if brand.shipping_provider
-        else None,  # type: ignore
-        amount_withdrawn=float(brand.amount_withdrawn),  # type: ignore
-        inn=str(brand.inn) if brand.inn else None,  # type: ignore
-        official_name=str(brand.official_name) if brand.official_name else None,  # type: ignore
-        contact_phone=str(brand.contact_phone) if brand.contact_phone else None,  # type: ignore
-        tax_system=str(brand.tax_system) if brand.tax_system else None,  # type: ignore
-        vat_payer=brand.vat_payer,  # type: ignore
-        vat_rate=str(brand.vat_rate) if brand.vat_rate else None,  # type: ignore
-        registration_address=str(brand.registration_address)
-        if brand.registration_address
-        else None,  # type: ignore
-        payout_account=str(brand.payout_account) if brand.payout_account else None,  # type: ignore
-        delivery_time_min=brand.delivery_time_min,
-        delivery_time_max=brand.delivery_time_max,
-        created_at=brand.created_at,  # type: ignore
-        updated_at=brand.updated_at,  # type: ignore
-    )
+    return response
 
 
 # API Endpoints
 @app.get("/api/v1/auth/check-username/{username}")
 @limiter.limit("20/minute")
-async def check_username_availability(
+def check_username_availability(
     request: Request, username: str, db: Session = Depends(get_db)
 ):
     """Check if username is available"""
     if profanity.contains_profanity(username):
         return {"available": False, "reason": "inappropriate"}
-    existing_user = auth_service.get_user_by_username(db, username)
-    return {"available": existing_user is None}
+    return {"available": not auth_service.username_exists(db, username)}
 
 
 @app.get("/api/v1/auth/check-email/{email}")
 @limiter.limit("20/minute")
-async def check_email_availability(
+def check_email_availability(
     request: Request, email: str, db: Session = Depends(get_db)
 ):
     """Check if email is available"""
-    existing_user = auth_service.get_user_by_email(db, email)
-    return {"available": existing_user is None}
+    return {"available": not auth_service.email_exists(db, email)}
 
 
 @app.post(
@@ -916,18 +1057,34 @@ async def check_email_availability(
     status_code=status.HTTP_201_CREATED,
 )
 @limiter.limit("5/minute")
-async def register(
-    request: Request, user_data: UserCreate, db: Session = Depends(get_db)
+def register(
+    request: Request,
+    user_data: UserCreate,
+    background_tasks: BackgroundTasks,
+    db: Session = Depends(get_db),
 ):
     """Register a new user"""
-    # Check if user already exists
-    if auth_service.get_user_by_email(db, user_data.email):
+    # Check email and username uniqueness in a single query
+    collisions = (
+        db.query(AuthAccount.email, User.username)
+        .join(User, User.auth_account_id == AuthAccount.id)
+        .filter(
+            or_(
+                AuthAccount.email == user_data.email,
+                User.username == user_data.username,
+            ),
+            User.deleted_at.is_(None),
+        )
+        .limit(2)
+        .all()
+    )
+    if any(email == user_data.email for email, _ in collisions):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Пользователь с таким email уже существует. Используйте другой email или войдите в систему.",
         )
 
-    if auth_service.get_user_by_username(db, user_data.username):
+    if collisions:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Имя пользователя уже занято. Выберите другое имя пользователя.",
@@ -945,26 +1102,30 @@ async def register(
         avatar_url=user_data.avatar_url,
     )
 
-    # Send verification email
+    # Send verification email after the response is returned
     code = auth_service.create_verification_code(db, user)
-    mail_service.send_email(
+    background_tasks.add_task(
+        mail_service.send_email,
         to_email=user.auth_account.email,
         subject="Подтверждение email",
         html_content=f"Ваш код подтверждения email: <b>{code}</b>. Он действителен {settings.EMAIL_VERIFICATION_CODE_EXPIRE_MINUTES} минут. пожалуйста, введите этот код в приложении для подтверждения email.",
     )
 
     # Create access token
-    access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
+    expires_at = datetime.now(timezone.utc) + timedelta(
+        minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES
+    )
     access_token = auth_service.create_access_token(
-        data={"sub": user.id}, expires_delta=access_token_expires
+        data={"sub": user.id}, expires_at=expires_at
     )
 
-    # Get avatar_url from profile if it exists
-    avatar_url = user.profile.avatar_url if user.profile else None
+    # create_user only makes a profile when profile data was given, so the
+    # avatar is whatever the request sent; no need to load the profile back
+    avatar_url = user_data.avatar_url or None
     refresh_token = auth_service.create_refresh_token(db, user.auth_account)
     return AuthResponse(
         token=access_token,
-        expires_at=datetime.now(timezone.utc) + access_token_expires,
+        expires_at=expires_at,
         refresh_token=refresh_token,
         user=schemas.UserProfileResponse(
             id=user.id,
@@ -981,33 +1142,34 @@ async def register(
 
 @app.post("/api/v1/auth/login", response_model=AuthResponse)
 @limiter.limit("10/minute")
-async def login(request: Request, user_data: UserLogin, db: Session = Depends(get_db)):
+def login(
+    request: Request,
+    user_data: UserLogin,
+    background_tasks: BackgroundTasks,
+    db: Session = Depends(get_db),
+):
     """Login user with email or username and password"""
 
     # Determine if the identifier is an email or username
-    if user_data.is_email():
-        user = auth_service.get_user_by_email(db, user_data.identifier)
-    elif user_data.is_username():
-        user = auth_service.get_user_by_username(db, user_data.identifier)
+    if user_data.identifier_kind in ("email", "username"):
+        user = auth_service.get_user_for_login(
+            db, user_data.identifier, by_email=user_data.identifier_kind == "email"
+        )
     else:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="неверный формат идентификатора. пожалуйста, введите действительный email или имя пользователя.",
         )
 
-    if not user or not user.auth_account.password_hash:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Неверный логин или пароль.",
-        )
-
     # Check login lockout
-    auth_service.check_login_lockout(db, user.auth_account)
-
-    if not auth_service.verify_password(
-        user_data.password, user.auth_account.password_hash
-    ):
-        auth_service.record_failed_login(db, user.auth_account)
+    if user:
+        auth_service.check_login_lockout(db, user.auth_account)
+
+    # Always pay for exactly one bcrypt check so unknown identifiers aren't distinguishable by timing
+    password_hash = user.auth_account.password_hash if user else None
+    if not auth_service.verify_password_timing_safe(user_data.password, password_hash):
+        if user and password_hash:
+            auth_service.record_failed_login(db, user.auth_account)
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Неверный логин или пароль.",
@@ -1019,16 +1181,19 @@ async def login(request: Request, user_data: UserLogin, db: Session = Depends(ge
     # Send verification email if not verified
     if not user.auth_account.is_email_verified:
         code = auth_service.create_verification_code(db, user)
-        mail_service.send_email(
+        background_tasks.add_task(
+            mail_service.send_email,
             to_email=user.auth_account.email,
             subject="Подтверждение email",
             html_content=f"Ваш код подтверждения email: <b>{code}</b>. Он действителен {settings.EMAIL_VERIFICATION_CODE_EXPIRE_MINUTES} минут. пожалуйста, введите этот код в приложении для подтверждения email.",
         )
 
     # Create access token
-    access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
+    expires_at = datetime.now(timezone.utc) + timedelta(
+        minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES
+    )
     access_token = auth_service.create_access_token(
-        data={"sub": user.id}, expires_delta=access_token_expires
+        data={"sub": user.id}, expires_at=expires_at
     )
 
     # Get avatar_url from profile if it exists
@@ -1036,7 +1201,7 @@ async def login(request: Request, user_data: UserLogin, db: Session = Depends(ge
     refresh_token = auth_service.create_refresh_token(db, user.auth_account)
     return AuthResponse(
         token=access_token,
-        expires_at=datetime.now(timezone.utc) + access_token_expires,
+        expires_at=expires_at,
         refresh_token=refresh_token,
         user=schemas.UserProfileResponse(
             id=user.id,
@@ -1087,7 +1252,7 @@ class RefreshTokenRequest(BaseModel):
 
 @app.post("/api/v1/auth/refresh", response_model=AuthResponse)
 @limiter.limit("10/minute")
-async def refresh_token(
+def refresh_token(
     request: Request, body: RefreshTokenRequest, db: Session = Depends(get_db)
 ):
     """Exchange a valid refresh token for new access + refresh tokens (rotation)."""
@@ -1141,9 +1306,9 @@ async def refresh_token(
         if acc.brand
         else settings.ACCESS_TOKEN_EXPIRE_MINUTES
     )
-    access_token_expires = timedelta(minutes=expire_minutes)
+    expires_at = datetime.now(timezone.utc) + timedelta(minutes=expire_minutes)
     access_token = auth_service.create_access_token(
-        data=token_data, expires_delta=access_token_expires
+        data=token_data, expires_at=expires_at
     )
 
     # Rotate refresh token
@@ -1151,7 +1316,7 @@ async def refresh_token(
 
     return AuthResponse(
         token=access_token,
-        expires_at=datetime.now(timezone.utc) + access_token_expires,
+        expires_at=expires_at,
         refresh_token=new_refresh_token,
         user=profile,
     )
@@ -1159,17 +1324,19 @@ async def refresh_token(
 
 def _issue_brand_jwt(brand: Brand, db: Session = None) -> AuthResponse:
     """Issue JWT for a successfully authenticated brand."""
-    access_token_expires = timedelta(minutes=settings.BRAND_TOKEN_EXPIRE_MINUTES)
+    expires_at = datetime.now(timezone.utc) + timedelta(
+        minutes=settings.BRAND_TOKEN_EXPIRE_MINUTES
+    )
     access_token = auth_service.create_access_token(
         data={"sub": str(brand.id), "is_brand": True},
-        expires_delta=access_token_expires,
+        expires_at=expires_at,
     )
     refresh_token = (
         auth_service.create_refresh_token(db, brand.auth_account) if db else None
     )
     return AuthResponse(
         token=access_token,
-        expires_at=datetime.now(timezone.utc) + access_token_expires,
+        expires_at=expires_at,
         refresh_token=refresh_token,
         user=schemas.UserProfileResponse(
             id=str(brand.id),
@@ -1186,13 +1353,13 @@ def _issue_brand_jwt(brand: Brand, db: Session = None) -> AuthResponse:
 
 @app.post("/api/v1/admin/auth/login")
 @limiter.limit("10/minute")
-async def admin_login(
+def admin_login(
     request: Request,
     body: schemas.AdminLoginRequest,
+    background_tasks: BackgroundTasks,
     db: Session = Depends(get_db),
 ):
     """Authenticate admin account. Always requires 2FA — returns 202 with session_token."""
-    import secrets as _secrets
 
     acc = auth_service.get_admin_by_email(db, body.email)
     if not acc or not auth_service.verify_password(
@@ -1210,8 +1377,8 @@ async def admin_login(
         )
 
     # Always generate OTP for admin login
-    otp = "".join([str(_secrets.randbelow(10)) for _ in range(6)])
-    session_token = _secrets.token_hex(32)
+    otp = "".join([str(secrets.randbelow(10)) for _ in range(6)])
+    session_token = secrets.token_hex(32)
     acc.otp_code = otp
     acc.otp_code_expires_at = datetime.now(timezone.utc) + timedelta(
         minutes=settings.OTP_EXPIRE_MINUTES
@@ -1221,7 +1388,8 @@ async def admin_login(
     acc.otp_resend_count = 0
     acc.otp_resend_window_start = datetime.now(timezone.utc)
     db.commit()
-    mail_service.send_email(
+    background_tasks.add_task(
+        mail_service.send_email,
         to_email=acc.email,
         subject="Код подтверждения входа (Админ)",
         html_content=f"Ваш код для входа в админ-панель: <b>{otp}</b>. Он действителен {settings.OTP_EXPIRE_MINUTES} минут.",
@@ -1234,7 +1402,7 @@ async def admin_login(
 
 @app.post("/api/v1/admin/auth/2fa/verify", response_model=schemas.AdminLoginResponse)
 @limiter.limit("10/minute")
-async def admin_verify_2fa(
+def admin_verify_2fa(
     request: Request,
     payload: schemas.BrandVerifyOTP,
     db: Session = Depends(get_db),
@@ -1285,25 +1453,25 @@ async def admin_verify_2fa(
     acc.otp_resend_window_start = None
     db.commit()
 
-    expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
+    expires_at = datetime.now(timezone.utc) + timedelta(
+        minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES
+    )
     token = auth_service.create_access_token(
         data={"sub": str(acc.id), "is_admin": True},
-        expires_delta=expires,
-    )
-    return schemas.AdminLoginResponse(
-        token=token, expires_at=datetime.now(timezone.utc) + expires
+        expires_at=expires_at,
     )
+    return schemas.AdminLoginResponse(token=token, expires_at=expires_at)
 
 
 @app.post("/api/v1/admin/auth/2fa/resend")
 @limiter.limit("5/minute")
-async def admin_resend_2fa(
+def admin_resend_2fa(
     request: Request,
     payload: schemas.BrandResendOTP,
+    background_tasks: BackgroundTasks,
     db: Session = Depends(get_db),
 ):
     """Resend admin 2FA OTP."""
-    import secrets as _secrets
 
     acc = (
         db.query(AuthAccount)
@@ -1336,7 +1504,7 @@ async def admin_resend_2fa(
                 detail=f"Подождите {wait} секунд перед повторной отправкой.",
             )
 
-    otp = "".join([str(_secrets.randbelow(10)) for _ in range(6)])
+    otp = "".join([str(secrets.randbelow(10)) for _ in range(6)])
     acc.otp_code = otp
     acc.otp_code_expires_at = datetime.now(timezone.utc) + timedelta(
         minutes=settings.OTP_EXPIRE_MINUTES
@@ -1345,7 +1513,8 @@ async def admin_resend_2fa(
     acc.otp_resend_window_start = datetime.now(timezone.utc)
     db.commit()
 
-    mail_service.send_email(
+    background_tasks.add_task(
+        mail_service.send_email,
         to_email=acc.email,
         subject="Новый код подтверждения входа (Админ)",
         html_content=f"Ваш новый код для входа в админ-панель: <b>{otp}</b>. Он действителен {settings.OTP_EXPIRE_MINUTES} минут.",
@@ -1366,15 +1535,13 @@ async def admin_verify_token(
 
 @app.post("/api/v1/brands/auth/login")
 @limiter.limit("10/minute")
-async def brand_login(
+def brand_login(
     request: Request,
     brand_data: schemas.BrandLogin,
+    background_tasks: BackgroundTasks,
     db: Session = Depends(get_db),
 ):
     """Login brand — returns JWT directly, or 202+session_token if 2FA is enabled."""
-    import secrets as _secrets
-
-    from fastapi.responses import JSONResponse
 
     brand = (
         db.query(Brand)
@@ -1382,8 +1549,8 @@ async def brand_login(
         .filter(AuthAccount.email == brand_data.email)
         .first()
     )
-    if not brand or not auth_service.verify_password(
-        brand_data.password, brand.auth_account.password_hash
+    if not auth_service.verify_password_timing_safe(
+        brand_data.password, brand.auth_account.password_hash if brand else None
     ):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -1399,6 +1566,8 @@ async def brand_login(
             brand.scheduled_deletion_at = None
             brand.is_inactive = False
             db.commit()
+            invalidate_reference_cache("brands")
+            recommendation_service.invalidate_active_product_ids()
         else:
             # Grace period expired — treat as deleted
             raise HTTPException(
@@ -1415,8 +1584,8 @@ async def brand_login(
                 detail="Аккаунт временно заблокирован из-за множества неверных попыток. Попробуйте позже.",
             )
         # Generate OTP and a cryptographically secure session token
-        otp = "".join([str(_secrets.randbelow(10)) for _ in range(6)])
-        session_token = _secrets.token_hex(
+        otp = "".join([str(secrets.randbelow(10)) for _ in range(6)])
+        session_token = secrets.token_hex(
             32
         )  # 64 hex chars — stored in DB, not derivable from email
         acc.otp_code = otp
@@ -1428,7 +1597,8 @@ async def brand_login(
         acc.otp_resend_count = 0
         acc.otp_resend_window_start = datetime.now(timezone.utc)
         db.commit()
-        mail_service.send_email(
+        background_tasks.add_task(
+            mail_service.send_email,
             to_email=acc.email,
             subject="Код подтверждения входа",
             html_content=f"Ваш код для входа: <b>{otp}</b>. Он действителен {settings.OTP_EXPIRE_MINUTES} минут.",
@@ -1444,7 +1614,7 @@ async def brand_login(
 
 @app.post("/api/v1/brands/auth/2fa/verify")
 @limiter.limit("10/minute")
-async def brand_verify_2fa(
+def brand_verify_2fa(
     request: Request,
     payload: schemas.BrandVerifyOTP,
     db: Session = Depends(get_db),
@@ -1505,13 +1675,13 @@ async def brand_verify_2fa(
 
 @app.post("/api/v1/brands/auth/2fa/resend")
 @limiter.limit("5/minute")
-async def brand_resend_2fa(
+def brand_resend_2fa(
     request: Request,
     payload: schemas.BrandResendOTP,
+    background_tasks: BackgroundTasks,
     db: Session = Depends(get_db),
 ):
     """Resend 2FA OTP. Max 3 resends per login attempt, 60s cooldown between resends."""
-    import secrets as _secrets
 
     acc = (
         db.query(AuthAccount)
@@ -1544,7 +1714,7 @@ async def brand_resend_2fa(
             )
 
     # Send new OTP
-    otp = "".join([str(_secrets.randbelow(10)) for _ in range(6)])
+    otp = "".join([str(secrets.randbelow(10)) for _ in range(6)])
     acc.otp_code = otp
     acc.otp_code_expires_at = datetime.now(timezone.utc) + timedelta(
         minutes=settings.OTP_EXPIRE_MINUTES
@@ -1553,7 +1723,8 @@ async def brand_resend_2fa(
     acc.otp_resend_window_start = datetime.now(timezone.utc)
     db.commit()
 
-    mail_service.send_email(
+    background_tasks.add_task(
+        mail_service.send_email,
         to_email=acc.email,
         subject="Новый код подтверждения входа",
         html_content=f"Ваш новый код для входа: <b>{otp}</b>. Он действителен {settings.OTP_EXPIRE_MINUTES} минут.",
@@ -1562,30 +1733,69 @@ async def brand_resend_2fa(
     return {"message": "Код отправлен повторно", "resends_remaining": resends_left}
 
 
+def _check_reset_code(acc: AuthAccount, code: str, invalid_detail: str) -> None:
+    """Raise 400 unless code is the account's current, unexpired verification code."""
+    if acc.email_verification_code != code:
+        raise HTTPException(status_code=400, detail=invalid_detail)
+    if acc.email_verification_code_expires_at < datetime.now(timezone.utc):
+        raise HTTPException(status_code=400, detail="Код подтверждения истёк")
+
+
+def _reject_reused_password(
+    acc: AuthAccount,
+    new_password: str,
+    history_detail: str = "Нельзя использовать предыдущий пароль",
+) -> None:
+    """Raise 400 if new_password matches the current password or one of the last 5."""
+    hashes = ([acc.password_hash] if acc.password_hash else []) + (
+        acc.password_history or []
+    )
+    reused = auth_service.find_matching_hash(new_password, hashes)
+    if reused is None:
+        return
+    if reused == 0 and acc.password_hash:
+        raise HTTPException(status_code=400, detail="Нельзя использовать текущий пароль")
+    raise HTTPException(status_code=400, detail=history_detail)
+
+
+def _rotate_password(acc: AuthAccount, new_password: str) -> None:
+    """Set a new password, keep the old hash in the 5-entry history, revoke the refresh token."""
+    new_password_hash = auth_service.hash_password(new_password)
+    history = list(acc.password_history or [])
+    if acc.password_hash:
+        history.append(acc.password_hash)
+    acc.password_history = history[-5:]
+    flag_modified(acc, "password_history")
+    acc.password_hash = new_password_hash
+    acc.refresh_token_hash = None
+    acc.refresh_token_expires_at = None
+
+
+def _find_brand_by_identifier(db: Session, identifier: str):
+    """Look up a brand by login email or brand name for the reset-code flow."""
+    if EMAIL_RE.match(identifier):
+        return (
+            db.query(Brand)
+            .join(AuthAccount)
+            .filter(AuthAccount.email == identifier)
+            .first()
+        )
+    return db.query(Brand).filter(Brand.name == identifier).first()
+
+
 @app.post("/api/v1/brands/auth/forgot-password")
 @limiter.limit("5/minute")
-async def brand_forgot_password(
+def brand_forgot_password(
     request: Request,
     forgot_password_request: schemas.ForgotPasswordRequest,
+    background_tasks: BackgroundTasks,
     db: Session = Depends(get_db),
 ):
     """Send password reset code to brand email"""
     # Determine if the identifier is an email or brand name
     identifier = forgot_password_request.identifier.strip()
 
-    # Check if it's an email
-    email_pattern = r"^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$"
-    is_email = bool(re.match(email_pattern, identifier))
-
-    if is_email:
-        brand = (
-            db.query(Brand)
-            .join(AuthAccount)
-            .filter(AuthAccount.email == identifier)
-            .first()
-        )
-    else:
-        brand = db.query(Brand).filter(Brand.name == identifier).first()
+    brand = _find_brand_by_identifier(db, identifier)
     if not brand:
         return {
             "message": "If a brand account with that email or name exists, a password reset code has been sent."
@@ -1593,7 +1803,8 @@ async def brand_forgot_password(
 
     # Create verification code for brand password reset
     code = auth_service.create_verification_code(db, brand)
-    mail_service.send_email(
+    background_tasks.add_task(
+        mail_service.send_email,
         to_email=brand.auth_account.email,
         subject="Код сброса пароля бренда",
         html_content=f"Ваш код для сброса пароля бренда: <b>{code}</b>. Он действителен {settings.EMAIL_VERIFICATION_CODE_EXPIRE_MINUTES} минут. пожалуйста, введите этот код для сброса пароля.",
@@ -1606,7 +1817,7 @@ async def brand_forgot_password(
 
 @app.post("/api/v1/brands/auth/validate-password-reset-code")
 @limiter.limit("5/minute")
-async def brand_validate_password_reset_code(
+def brand_validate_password_reset_code(
     request: Request,
     validation_request: schemas.ValidatePasswordResetCodeRequest,
     db: Session = Depends(get_db),
@@ -1614,32 +1825,17 @@ async def brand_validate_password_reset_code(
     """Validate password reset code for brand"""
     identifier = validation_request.identifier.strip()
 
-    # Check if it's an email
-    email_pattern = r"^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$"
-    is_email = bool(re.match(email_pattern, identifier))
-
-    if is_email:
-        brand = (
-            db.query(Brand)
-            .join(AuthAccount)
-            .filter(AuthAccount.email == identifier)
-            .first()
-        )
-    else:
-        brand = db.query(Brand).filter(Brand.name == identifier).first()
+    brand = _find_brand_by_identifier(db, identifier)
     if not brand:
         raise HTTPException(status_code=400, detail="Неверный email/имя бренда или код")
     acc = brand.auth_account
-    if acc.email_verification_code != validation_request.code:
-        raise HTTPException(status_code=400, detail="Неверный email/имя бренда или код")
-    if acc.email_verification_code_expires_at < datetime.now(timezone.utc):
-        raise HTTPException(status_code=400, detail="Код подтверждения истёк")
+    _check_reset_code(acc, validation_request.code, "Неверный email/имя бренда или код")
     return {"message": "Code is valid"}
 
 
 @app.post("/api/v1/brands/auth/reset-password-with-code")
 @limiter.limit("5/minute")
-async def brand_reset_password_with_code(
+def brand_reset_password_with_code(
     request: Request,
     reset_password_request: schemas.ResetPasswordWithCodeRequest,
     db: Session = Depends(get_db),
@@ -1647,55 +1843,15 @@ async def brand_reset_password_with_code(
     """Reset brand password using verification code"""
     identifier = reset_password_request.identifier.strip()
 
-    # Check if it's an email
-    email_pattern = r"^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$"
-    is_email = bool(re.match(email_pattern, identifier))
-
-    if is_email:
-        brand = (
-            db.query(Brand)
-            .join(AuthAccount)
-            .filter(AuthAccount.email == identifier)
-            .first()
-        )
-    else:
-        brand = db.query(Brand).filter(Brand.name == identifier).first()
+    brand = _find_brand_by_identifier(db, identifier)
     if not brand:
         raise HTTPException(status_code=400, detail="Неверный email/имя бренда или код")
     acc = brand.auth_account
-    if acc.email_verification_code != reset_password_request.code:
-        raise HTTPException(status_code=400, detail="Неверный email/имя бренда или код")
-    if acc.email_verification_code_expires_at < datetime.now(timezone.utc):
-        raise HTTPException(status_code=400, detail="Код подтверждения истёк")
-    new_password_hash = auth_service.hash_password(reset_password_request.new_password)
-    if acc.password_hash and auth_service.verify_password(
-        reset_password_request.new_password, acc.password_hash
-    ):
-        raise HTTPException(
-            status_code=400, detail="Нельзя использовать текущий пароль"
-        )
-    if acc.password_history:
-        for historical_hash in acc.password_history:
-            if auth_service.verify_password(
-                reset_password_request.new_password, historical_hash
-            ):
-                raise HTTPException(
-                    status_code=400, detail="Нельзя использовать предыдущий пароль"
-                )
-    if not acc.password_history:
-        acc.password_history = []
-    if acc.password_hash:
-        acc.password_history.append(acc.password_hash)
-    if len(acc.password_history) > 5:
-        acc.password_history = acc.password_history[-5:]
-    from sqlalchemy.orm.attributes import flag_modified
-
-    flag_modified(acc, "password_history")
-    acc.password_hash = new_password_hash
+    _check_reset_code(acc, reset_password_request.code, "Неверный email/имя бренда или код")
+    _reject_reused_password(acc, reset_password_request.new_password)
+    _rotate_password(acc, reset_password_request.new_password)
     acc.email_verification_code = None
     acc.email_verification_code_expires_at = None
-    acc.refresh_token_hash = None
-    acc.refresh_token_expires_at = None
     db.commit()
 
     return {"message": "Brand password has been reset successfully."}
@@ -1706,7 +1862,7 @@ async def brand_reset_password_with_code(
 
 @app.patch("/api/v1/brands/me/inactive")
 @limiter.limit("10/minute")
-async def toggle_brand_inactive(
+def toggle_brand_inactive(
     request: Request,
     payload: schemas.BrandInactiveToggle,
     current_user: Brand = Depends(get_current_brand_user),
@@ -1750,12 +1906,14 @@ async def toggle_brand_inactive(
             )
     current_user.is_inactive = payload.is_inactive
     db.commit()
+    invalidate_reference_cache("brands")
+    recommendation_service.invalidate_active_product_ids()
     return {"is_inactive": current_user.is_inactive}
 
 
 @app.delete("/api/v1/brands/me")
 @limiter.limit("5/minute")
-async def request_brand_deletion(
+def request_brand_deletion(
     request: Request,
     current_user: Brand = Depends(get_current_brand_user),
     db: Session = Depends(get_db),
@@ -1777,6 +1935,8 @@ async def request_brand_deletion(
     current_user.is_inactive = True
     current_user.scheduled_deletion_at = grace_end
     db.commit()
+    invalidate_reference_cache("brands")
+    recommendation_service.invalidate_active_product_ids()
     return schemas.BrandDeleteResponse(
         message=f"Account scheduled for deletion. You have {settings.BRAND_DELETION_GRACE_DAYS} days to reactivate by logging in.",
         scheduled_deletion_at=grace_end,
@@ -1785,7 +1945,7 @@ async def request_brand_deletion(
 
 @app.post("/api/v1/brands/auth/change-password")
 @limiter.limit("5/minute")
-async def brand_change_password(
+def brand_change_password(
     request: Request,
     payload: schemas.BrandChangePassword,
     current_user: Brand = Depends(get_current_brand_user),
@@ -1797,52 +1957,35 @@ async def brand_change_password(
         payload.current_password, acc.password_hash
     ):
         raise HTTPException(status_code=400, detail="Текущий пароль неверный")
-    if auth_service.verify_password(payload.new_password, acc.password_hash):
-        raise HTTPException(
-            status_code=400, detail="Нельзя использовать текущий пароль"
-        )
-    if acc.password_history:
-        for h in acc.password_history:
-            if auth_service.verify_password(payload.new_password, h):
-                raise HTTPException(
-                    status_code=400,
-                    detail="Нельзя использовать ранее использованный пароль",
-                )
-    if not acc.password_history:
-        acc.password_history = []
-    acc.password_history.append(acc.password_hash)
-    if len(acc.password_history) > 5:
-        acc.password_history = acc.password_history[-5:]
-    from sqlalchemy.orm.attributes import flag_modified
-
-    flag_modified(acc, "password_history")
-    acc.password_hash = auth_service.hash_password(payload.new_password)
-    acc.refresh_token_hash = None
-    acc.refresh_token_expires_at = None
+    _reject_reused_password(
+        acc, payload.new_password, "Нельзя использовать ранее использованный пароль"
+    )
+    _rotate_password(acc, payload.new_password)
     db.commit()
     return {"message": "Пароль успешно изменён"}
 
 
 @app.post("/api/v1/brands/auth/2fa/enable")
 @limiter.limit("5/minute")
-async def brand_enable_2fa(
+def brand_enable_2fa(
     request: Request,
+    background_tasks: BackgroundTasks,
     current_user: Brand = Depends(get_current_brand_user),
     db: Session = Depends(get_db),
 ):
     """Initiate 2FA enable — generates OTP and emails it. Brand must confirm with /2fa/confirm."""
-    import secrets as _secrets
 
     acc = current_user.auth_account
     if acc.two_factor_enabled:
         raise HTTPException(status_code=400, detail="2FA уже включена")
-    code = "".join([str(_secrets.randbelow(10)) for _ in range(6)])
+    code = "".join([str(secrets.randbelow(10)) for _ in range(6)])
     acc.otp_code = code
     acc.otp_code_expires_at = datetime.now(timezone.utc) + timedelta(
         minutes=settings.OTP_EXPIRE_MINUTES
     )
     db.commit()
-    mail_service.send_email(
+    background_tasks.add_task(
+        mail_service.send_email,
         to_email=acc.email,
         subject="Код подтверждения двухфакторной аутентификации",
         html_content=f"Ваш код для включения 2FA: <b>{code}</b>. Он действителен {settings.OTP_EXPIRE_MINUTES} минут.",
@@ -1852,7 +1995,7 @@ async def brand_enable_2fa(
 
 @app.post("/api/v1/brands/auth/2fa/confirm")
 @limiter.limit("10/minute")
-async def brand_confirm_2fa(
+def brand_confirm_2fa(
     request: Request,
     payload: schemas.Brand2FAConfirm,
     current_user: Brand = Depends(get_current_brand_user),
@@ -1877,7 +2020,7 @@ async def brand_confirm_2fa(
 
 @app.post("/api/v1/brands/auth/2fa/disable")
 @limiter.limit("5/minute")
-async def brand_disable_2fa(
+def brand_disable_2fa(
     request: Request,
     payload: schemas.Brand2FADisable,
     current_user: Brand = Depends(get_current_brand_user),
@@ -1902,49 +2045,7 @@ async def brand_disable_2fa(
 @limiter.limit("60/minute")
 async def get_oauth_providers(request: Request):
     """Get available OAuth providers"""
-    providers = []
-
-    if settings.GOOGLE_CLIENT_ID:
-        providers.append(
-            OAuthProviderResponse(
-                provider="google",
-                client_id=settings.GOOGLE_CLIENT_ID,
-                redirect_url=f"{settings.OAUTH_REDIRECT_URL}/google",
-                scope="openid email profile",
-            )
-        )
-
-    if settings.FACEBOOK_CLIENT_ID:
-        providers.append(
-            OAuthProviderResponse(
-                provider="facebook",
-                client_id=settings.FACEBOOK_CLIENT_ID,
-                redirect_url=f"{settings.OAUTH_REDIRECT_URL}/facebook",
-                scope="email public_profile",
-            )
-        )
-
-    if settings.GITHUB_CLIENT_ID:
-        providers.append(
-            OAuthProviderResponse(
-                provider="github",
-                client_id=settings.GITHUB_CLIENT_ID,
-                redirect_url=f"{settings.OAUTH_REDIRECT_URL}/github",
-                scope="read:user user:email",
-            )
-        )
-
-    if settings.APPLE_CLIENT_ID:
-        providers.append(
-            OAuthProviderResponse(
-                provider="apple",
-                client_id=settings.APPLE_CLIENT_ID,
-                redirect_url=f"{settings.OAUTH_REDIRECT_URL}/apple",
-                scope="name email",
-            )
-        )
-
-    return providers
+    return _etag_response(request, _OAUTH_PROVIDERS_JSON, "public, max-age=3600")
 
 
 @app.get("/api/v1/auth/oauth/{provider}/authorize")
@@ -2025,8 +2126,9 @@ async def oauth_callback(
 
 @app.post("/api/v1/auth/request-verification")
 @limiter.limit("5/minute")
-async def request_verification(
+def request_verification(
     request: Request,
+    background_tasks: BackgroundTasks,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db),
 ):
@@ -2035,7 +2137,8 @@ async def request_verification(
     if current_user.auth_account.is_email_verified:
         raise HTTPException(status_code=400, detail="Email уже подтверждён")
     code = auth_service.create_verification_code(db, current_user)
-    mail_service.send_email(
+    background_tasks.add_task(
+        mail_service.send_email,
         to_email=current_user.auth_account.email,
         subject="Подтверждение email",
         html_content=f"Ваш код подтверждения email: <b>{code}</b>. Он действителен {settings.EMAIL_VERIFICATION_CODE_EXPIRE_MINUTES} минут. пожалуйста, введите этот код в приложении для подтверждения email.",
@@ -2045,20 +2148,38 @@ async def request_verification(
 
 @app.post("/api/v1/auth/verify-email")
 @limiter.limit("10/minute")
-async def verify_email(
+def verify_email(
     request: Request,
     verification_data: schemas.EmailVerificationRequest,
     db: Session = Depends(get_db),
 ):
-    user = auth_service.get_user_by_email(db, verification_data.email)
-    if not user:
-        raise HTTPException(status_code=400, detail="Неверный email или код")
-
-    acc = user.auth_account
-    if acc.email_verification_code != verification_data.code:
+    # Email, code and expiry are all checked in one query on the success path
+    acc = (
+        db.query(AuthAccount)
+        .join(User, User.auth_account_id == AuthAccount.id)
+        .filter(
+            AuthAccount.email == verification_data.email,
+            AuthAccount.email_verification_code == verification_data.code,
+            AuthAccount.email_verification_code_expires_at >= datetime.now(timezone.utc),
+            User.deleted_at.is_(None),
+        )
+        .first()
+    )
+    if not acc:
+        # Only on a miss: tell an expired code from a wrong one so clients can offer a resend
+        expired = db.execute(
+            select(
+                exists().where(
+                    AuthAccount.email == verification_data.email,
+                    AuthAccount.email_verification_code == verification_data.code,
+                    User.auth_account_id == AuthAccount.id,
+                    User.deleted_at.is_(None),
+                )
+            )
+        ).scalar()
+        if expired:
+            raise HTTPException(status_code=400, detail="Код подтверждения истёк")
         raise HTTPException(status_code=400, detail="Неверный email или код")
-    if acc.email_verification_code_expires_at < datetime.now(timezone.utc):
-        raise HTTPException(status_code=400, detail="Код подтверждения истёк")
     acc.is_email_verified = True
     acc.email_verification_code = None
     acc.email_verification_code_expires_at = None
@@ -2067,25 +2188,22 @@ async def verify_email(
     return {"message": "Email verified successfully"}
 
 
+def _find_user_by_identifier(db: Session, identifier: str):
+    """Look up a user by email or username for the reset-code flow."""
+    if EMAIL_RE.match(identifier):
+        return auth_service.get_user_by_email(db, identifier)
+    return auth_service.get_user_by_username(db, identifier)
+
+
 @app.post("/api/v1/auth/forgot-password")
 @limiter.limit("5/minute")
-async def forgot_password(
+def forgot_password(
     request: Request,
     forgot_password_request: schemas.ForgotPasswordRequest,
+    background_tasks: BackgroundTasks,
     db: Session = Depends(get_db),
 ):
-    # Determine if the identifier is an email or username
-    identifier = forgot_password_request.identifier.strip()
-
-    # Check if it's an email
-    email_pattern = r"^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$"
-    is_email = bool(re.match(email_pattern, identifier))
-
-    if is_email:
-        user = auth_service.get_user_by_email(db, identifier)
-    else:
-        # Treat as username
-        user = auth_service.get_user_by_username(db, identifier)
+    user = _find_user_by_identifier(db, forgot_password_request.identifier.strip())
 
     if not user:
         # Still return a success message to prevent enumeration
@@ -2095,7 +2213,8 @@ async def forgot_password(
 
     # Create verification code instead of token for code-based reset
     code = auth_service.create_verification_code(db, user)
-    mail_service.send_email(
+    background_tasks.add_task(
+        mail_service.send_email,
         to_email=user.auth_account.email,
         subject="Код сброса пароля",
         html_content=f"Ваш код для сброса пароля: <b>{code}</b>. Он действителен {settings.EMAIL_VERIFICATION_CODE_EXPIRE_MINUTES} минут. пожалуйста, введите этот код в приложении для сброса пароля.",
@@ -2108,150 +2227,74 @@ async def forgot_password(
 
 @app.post("/api/v1/auth/reset-password")
 @limiter.limit("5/minute")
-async def reset_password(
+def reset_password(
     request: Request,
     reset_password_request: schemas.ResetPasswordRequest,
     db: Session = Depends(get_db),
 ):
+    # Only the token's hash is stored, so the comparison leaks nothing about the raw token.
+    token_hash = hashlib.sha256(reset_password_request.token.encode()).hexdigest()
     user = (
         db.query(User)
         .join(AuthAccount)
-        .filter(AuthAccount.password_reset_token == reset_password_request.token)
-        .first()
+        .filter(AuthAccount.password_reset_token == token_hash)
+        .one_or_none()
     )
     if not user:
         raise HTTPException(status_code=400, detail="Недействительная ссылка")
-    acc = user.auth_account
-    if acc.password_reset_expires < datetime.now(timezone.utc):
+    if user.auth_account.password_reset_expires < datetime.now(timezone.utc):
         raise HTTPException(status_code=400, detail="Ссылка для сброса пароля истекла")
-    new_password_hash = auth_service.hash_password(reset_password_request.new_password)
-    if acc.password_hash and auth_service.verify_password(
-        reset_password_request.new_password, acc.password_hash
-    ):
-        raise HTTPException(
-            status_code=400, detail="Нельзя использовать текущий пароль"
-        )
-    if acc.password_history:
-        for historical_hash in acc.password_history:
-            if auth_service.verify_password(
-                reset_password_request.new_password, historical_hash
-            ):
-                raise HTTPException(
-                    status_code=400, detail="Нельзя использовать предыдущий пароль"
-                )
-    if not acc.password_history:
-        acc.password_history = []
-    if acc.password_hash:
-        acc.password_history.append(acc.password_hash)
-    if len(acc.password_history) > 5:
-        acc.password_history = acc.password_history[-5:]
-    from sqlalchemy.orm.attributes import flag_modified
-
-    flag_modified(acc, "password_history")
-    acc.password_hash = new_password_hash
+    acc = user.auth_account
+    _reject_reused_password(acc, reset_password_request.new_password)
+    _rotate_password(acc, reset_password_request.new_password)
     acc.password_reset_token = None
     acc.password_reset_expires = None
-    acc.refresh_token_hash = None
-    acc.refresh_token_expires_at = None
     db.commit()
     return {"message": "Password has been reset successfully."}
 
 
 @app.post("/api/v1/auth/validate-password-reset-code")
 @limiter.limit("5/minute")
-async def validate_password_reset_code(
+def validate_password_reset_code(
     request: Request,
     validation_request: schemas.ValidatePasswordResetCodeRequest,
     db: Session = Depends(get_db),
 ):
-    # Determine if the identifier is an email or username
-    identifier = validation_request.identifier.strip()
-
-    # Check if it's an email
-    email_pattern = r"^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$"
-    is_email = bool(re.match(email_pattern, identifier))
-
-    if is_email:
-        user = auth_service.get_user_by_email(db, identifier)
-    else:
-        # Treat as username
-        user = auth_service.get_user_by_username(db, identifier)
+    user = _find_user_by_identifier(db, validation_request.identifier.strip())
 
     if not user:
         raise HTTPException(status_code=400, detail="Неверные данные или код")
 
     acc = user.auth_account
-    if acc.email_verification_code != validation_request.code:
-        raise HTTPException(status_code=400, detail="Неверные данные или код")
-    if acc.email_verification_code_expires_at < datetime.now(timezone.utc):
-        raise HTTPException(status_code=400, detail="Код подтверждения истёк")
+    _check_reset_code(acc, validation_request.code, "Неверные данные или код")
     return {"message": "Code is valid"}
 
 
 @app.post("/api/v1/auth/reset-password-with-code")
 @limiter.limit("5/minute")
-async def reset_password_with_code(
+def reset_password_with_code(
     request: Request,
     reset_password_request: schemas.ResetPasswordWithCodeRequest,
     db: Session = Depends(get_db),
 ):
-    # Determine if the identifier is an email or username
-    identifier = reset_password_request.identifier.strip()
-
-    # Check if it's an email
-    email_pattern = r"^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$"
-    is_email = bool(re.match(email_pattern, identifier))
-
-    if is_email:
-        user = auth_service.get_user_by_email(db, identifier)
-    else:
-        # Treat as username
-        user = auth_service.get_user_by_username(db, identifier)
+    user = _find_user_by_identifier(db, reset_password_request.identifier.strip())
 
     if not user:
         raise HTTPException(status_code=400, detail="Неверные данные или код")
 
     acc = user.auth_account
-    if acc.email_verification_code != reset_password_request.code:
-        raise HTTPException(status_code=400, detail="Неверные данные или код")
-    if acc.email_verification_code_expires_at < datetime.now(timezone.utc):
-        raise HTTPException(status_code=400, detail="Код подтверждения истёк")
-    new_password_hash = auth_service.hash_password(reset_password_request.new_password)
-    if acc.password_hash and auth_service.verify_password(
-        reset_password_request.new_password, acc.password_hash
-    ):
-        raise HTTPException(
-            status_code=400, detail="Нельзя использовать текущий пароль"
-        )
-    if acc.password_history:
-        for historical_hash in acc.password_history:
-            if auth_service.verify_password(
-                reset_password_request.new_password, historical_hash
-            ):
-                raise HTTPException(
-                    status_code=400, detail="Нельзя использовать предыдущий пароль"
-                )
-    if not acc.password_history:
-        acc.password_history = []
-    if acc.password_hash:
-        acc.password_history.append(acc.password_hash)
-    if len(acc.password_history) > 5:
-        acc.password_history = acc.password_history[-5:]
-    from sqlalchemy.orm.attributes import flag_modified
-
-    flag_modified(acc, "password_history")
-    acc.password_hash = new_password_hash
+    _check_reset_code(acc, reset_password_request.code, "Неверные данные или код")
+    _reject_reused_password(acc, reset_password_request.new_password)
+    _rotate_password(acc, reset_password_request.new_password)
     acc.email_verification_code = None
     acc.email_verification_code_expires_at = None
-    acc.refresh_token_hash = None
-    acc.refresh_token_expires_at = None
     db.commit()
     return {"message": "Password has been reset successfully."}
 
 
 @app.post("/api/v1/auth/logout")
 @limiter.limit("10/minute")
-async def logout(
+def logout(
     request: Request,
     current_user=Depends(get_current_user),
     db: Session = Depends(get_db),
@@ -2263,32 +2306,31 @@ async def logout(
 
 @app.post("/api/v1/exclusive-access-signup", status_code=status.HTTP_201_CREATED)
 @limiter.limit("5/minute")
-async def exclusive_access_signup(
+def exclusive_access_signup(
     request: Request,
     signup_data: schemas.ExclusiveAccessSignupRequest,
     db: Session = Depends(get_db),
 ):
     """Store email for exclusive access signup"""
-    existing_email = (
-        db.query(ExclusiveAccessEmail)
-        .filter(ExclusiveAccessEmail.email == signup_data.email)
-        .first()
-    )
-    if existing_email:
+    # Single INSERT ... ON CONFLICT DO NOTHING RETURNING: no row back means the email exists
+    inserted_id = db.execute(
+        pg_insert(ExclusiveAccessEmail)
+        .values(email=signup_data.email)
+        .on_conflict_do_nothing(index_elements=[ExclusiveAccessEmail.email])
+        .returning(ExclusiveAccessEmail.id)
+    ).scalar_one_or_none()
+    if inserted_id is None:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Email уже зарегистрирован для раннего доступа",
         )
-
-    new_signup = ExclusiveAccessEmail(email=signup_data.email)
-    db.add(new_signup)
     db.commit()
     return {"message": "Successfully signed up for exclusive access!"}
 
 
 @app.get("/api/v1/user/profile", response_model=schemas.UserProfileResponse)
 @limiter.limit("60/minute")
-async def get_user_profile(
+def get_user_profile(
     request: Request,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db),
@@ -2296,17 +2338,26 @@ async def get_user_profile(
     """Get current user's complete profile (users only)"""
     if isinstance(current_user, Brand):
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not a user account")
+    payload = _build_user_profile_response(current_user, db)
+    # Clients poll this often; revalidate with If-None-Match and skip the body when unchanged
+    return _etag_response(
+        request, orjson.dumps(payload.model_dump(mode="json")), "private, no-cache"
+    )
+
+
+def _build_user_profile_response(current_user: User, db: Session) -> schemas.UserProfileResponse:
+    """Assemble the full profile (favorites, profile, shipping, preferences) for a user."""
     user_id = str(current_user.id)
 
-    # Single query with eager loading instead of 5 separate queries
+    # One joined query for the 1:1 rows, plus one IN-by-key query per collection
     user = (
         db.query(User)
         .options(
             joinedload(User.profile),
             joinedload(User.shipping_info),
             joinedload(User.preferences),
-            subqueryload(User.favorite_brands).joinedload(UserBrand.brand),
-            subqueryload(User.favorite_styles).joinedload(UserStyle.style),
+            selectinload(User.favorite_brands).joinedload(UserBrand.brand),
+            selectinload(User.favorite_styles).joinedload(UserStyle.style),
         )
         .filter(User.id == user_id)
         .first()
@@ -2396,7 +2447,7 @@ def register_push_token(
     """Store Expo push token for the authenticated user (buyers only)."""
     if not hasattr(current_user, "expo_push_token"):
         raise HTTPException(status_code=400, detail="Not a user account")
-    print(f"push-token - user {current_user.id} registering token: {body.token}")
+    logger.debug("push-token registered for user=%s", current_user.id)
     current_user.expo_push_token = body.token
     db.commit()
     return None
@@ -2404,7 +2455,7 @@ def register_push_token(
 
 @app.delete("/api/v1/users/me", status_code=status.HTTP_200_OK)
 @limiter.limit("5/minute")
-async def delete_my_account(
+def delete_my_account(
     request: Request,
     current_user: any = Depends(get_current_user),
     db: Session = Depends(get_db),
@@ -2501,13 +2552,85 @@ async def get_product_image_presigned_url(
     )
 
 
+# Generate unique article number for the product (Option 5: Brand + Abbreviation + Random)
+def generate_article_number(brand_name: str, product_name: str) -> str:
+    """Generate article number: BRAND-ABBREV-RANDOM (e.g., NIKE-AM270-A3B7)"""
+    # Brand prefix: First 4-6 uppercase letters
+    brand_clean = re.sub(r"[^A-Z0-9]", "", brand_name.upper())
+    brand_prefix = brand_clean[:6]
+
+    # Remove brand name from product name if present
+    product_clean = re.sub(
+        r"\b" + re.escape(brand_name) + r"\b", "", product_name, flags=re.IGNORECASE
+    ).strip()
+    words = product_clean.split() if product_clean else product_name.split()
+
+    # Abbreviation: First letter of each significant word (skip stop words)
+    stop_words = {
+        "the",
+        "a",
+        "an",
+        "and",
+        "or",
+        "of",
+        "in",
+        "on",
+        "at",
+        "to",
+        "for",
+        "with",
+    }
+    significant_words = [w for w in words[:5] if w.lower() not in stop_words]
+
+    if significant_words:
+        # Separate words with numbers from words without
+        words_with_numbers = []
+        words_without_numbers = []
+
+        for word in significant_words[:4]:
+            if re.search(r"\d", word):
+                words_with_numbers.append(word)
+            else:
+                words_without_numbers.append(word)
+
+        abbrev_parts = []
+
+        # Take first letter of words WITHOUT numbers (up to 3 words)
+        for word in words_without_numbers[:3]:
+            first_char = re.sub(r"[^A-Z]", "", word.upper())[0:1]
+            if first_char:
+                abbrev_parts.append(first_char)
+
+        # Extract numbers from words WITH numbers (preserve full number if possible)
+        if words_with_numbers:
+            for word in words_with_numbers[:2]:  # Check first 2 words with numbers
+                number_match = re.search(r"\d+", word)
+                if number_match:
+                    number_str = number_match.group(0)[:3]  # Max 3 digits
+                    abbrev_parts.append(number_str)
+                    break  # Only use first number found
+
+        product_abbrev = "".join(abbrev_parts)[:5]  # Cap at 5 characters total
+    else:
+        product_abbrev = re.sub(r"[^A-Z0-9]", "", product_name.upper())[:5]
+
+    if len(product_abbrev) < 2:
+        product_abbrev = re.sub(r"[^A-Z0-9]", "", product_name.upper())[:5] or "PRD"
+
+    # Random suffix: 4 characters (excludes ambiguous: 0, O, 1, I, L)
+    random_chars = "ABCDEFGHJKLMNPQRSTUVWXYZ23456789"
+    random_suffix = "".join(random.choices(random_chars, k=4))
+
+    return f"{brand_prefix}-{product_abbrev}-{random_suffix}"
+
+
 @app.post(
     "/api/v1/brands/products",
     response_model=schemas.Product,
     status_code=status.HTTP_201_CREATED,
 )
 @limiter.limit("10/minute")
-async def create_product(
+def create_product(
     request: Request,
     product_data: schemas.ProductCreateRequest,
     current_user: User = Depends(get_current_brand_user),
@@ -2515,77 +2638,6 @@ async def create_product(
 ):
     """Create a new product for the authenticated brand user"""
 
-    # Generate unique article number for the product (Option 5: Brand + Abbreviation + Random)
-    def generate_article_number(brand_name: str, product_name: str) -> str:
-        """Generate article number: BRAND-ABBREV-RANDOM (e.g., NIKE-AM270-A3B7)"""
-        # Brand prefix: First 4-6 uppercase letters
-        brand_clean = re.sub(r"[^A-Z0-9]", "", brand_name.upper())
-        brand_prefix = brand_clean[:6]
-
-        # Remove brand name from product name if present
-        product_clean = re.sub(
-            r"\b" + re.escape(brand_name) + r"\b", "", product_name, flags=re.IGNORECASE
-        ).strip()
-        words = product_clean.split() if product_clean else product_name.split()
-
-        # Abbreviation: First letter of each significant word (skip stop words)
-        stop_words = {
-            "the",
-            "a",
-            "an",
-            "and",
-            "or",
-            "of",
-            "in",
-            "on",
-            "at",
-            "to",
-            "for",
-            "with",
-        }
-        significant_words = [w for w in words[:5] if w.lower() not in stop_words]
-
-        if significant_words:
-            # Separate words with numbers from words without
-            words_with_numbers = []
-            words_without_numbers = []
-
-            for word in significant_words[:4]:
-                if re.search(r"\d", word):
-                    words_with_numbers.append(word)
-                else:
-                    words_without_numbers.append(word)
-
-            abbrev_parts = []
-
-            # Take first letter of words WITHOUT numbers (up to 3 words)
-            for word in words_without_numbers[:3]:
-                first_char = re.sub(r"[^A-Z]", "", word.upper())[0:1]
-                if first_char:
-                    abbrev_parts.append(first_char)
-
-            # Extract numbers from words WITH numbers (preserve full number if possible)
-            if words_with_numbers:
-                for word in words_with_numbers[:2]:  # Check first 2 words with numbers
-                    number_match = re.search(r"\d+", word)
-                    if number_match:
-                        number_str = number_match.group(0)[:3]  # Max 3 digits
-                        abbrev_parts.append(number_str)
-                        break  # Only use first number found
-
-            product_abbrev = "".join(abbrev_parts)[:5]  # Cap at 5 characters total
-        else:
-            product_abbrev = re.sub(r"[^A-Z0-9]", "", product_name.upper())[:5]
-
-        if len(product_abbrev) < 2:
-            product_abbrev = re.sub(r"[^A-Z0-9]", "", product_name.upper())[:5] or "PRD"
-
-        # Random suffix: 4 characters (excludes ambiguous: 0, O, 1, I, L)
-        random_chars = "ABCDEFGHJKLMNPQRSTUVWXYZ23456789"
-        random_suffix = "".join(random.choices(random_chars, k=4))
-
-        return f"{brand_prefix}-{product_abbrev}-{random_suffix}"
-
     # Validate sizes for category
     all_sizes = []
     for cv_data in product_data.color_variants:
@@ -2604,43 +2656,29 @@ async def create_product(
     if consistency_err:
         raise HTTPException(status_code=400, detail=consistency_err)
 
-    # Generate unique article number (handle collisions)
-    article_number = None
-    max_attempts = 10
-    for attempt in range(max_attempts):
-        candidate_article = generate_article_number(
-            str(current_user.name), product_data.name
-        )  # type: ignore
-        existing = (
-            db.query(Product)
-            .filter(Product.article_number == candidate_article)
-            .first()
-        )
-        if not existing:
-            article_number = candidate_article
-            break
-        # On collision, modify random suffix
-        if attempt < max_attempts - 1:
-            random_chars = "ABCDEFGHJKLMNPQRSTUVWXYZ23456789"
-            candidate_article = candidate_article[:-4] + "".join(
-                random.choices(random_chars, k=4)
-            )
-
-    if not article_number:
-        # Fallback: use UUID-based (extremely unlikely to need this)
-        product_id_preview = str(uuid.uuid4())[:8].upper()
-        random_chars = "ABCDEFGHJKLMNPQRSTUVWXYZ23456789"
-        brand_prefix = re.sub(r"[^A-Z0-9]", "", current_user.name.upper())[:6]
-        article_number = f"{brand_prefix}-{product_id_preview[:4]}-{''.join(random.choices(random_chars, k=4))}"
+    # Validate all style IDs in one query before anything is written
+    style_ids = list(dict.fromkeys(product_data.styles or []))
+    if style_ids:
+        found_style_ids = {
+            r[0] for r in db.query(Style.id).filter(Style.id.in_(style_ids)).all()
+        }
+        for style_id in style_ids:
+            if style_id not in found_style_ids:
+                raise HTTPException(
+                    status_code=400, detail=f"Стиль с ID {style_id} не найден"
+                )
 
-    # Create product (no images/color; those live on color_variants)
-    product = Product(
+    # Create product (no images/color; those live on color_variants). The unique
+    # constraint on article_number decides collisions, so the common case is a single
+    # INSERT; only a clash on the random suffix costs another attempt.
+    product_id = str(uuid.uuid4())
+    product_values = dict(
+        id=product_id,
         name=product_data.name,
         description=product_data.description,
         price=product_data.price,
         material=product_data.material,
         country_of_manufacture=product_data.country_of_manufacture,
-        article_number=article_number,
         brand_id=current_user.id,  # always the authenticated brand
         category_id=product_data.category_id,
         general_images=product_data.general_images or [],
@@ -2650,61 +2688,74 @@ async def create_product(
         sale_type=product_data.sale_type,
         sizing_table_image=product_data.sizing_table_image,
     )
-    db.add(product)
-    db.commit()
-    db.refresh(product)
+    max_attempts = 10
+    for attempt in range(max_attempts):
+        if attempt < max_attempts - 1:
+            article_number = generate_article_number(
+                str(current_user.name), product_data.name
+            )
+        else:
+            # Fallback: use UUID-based (extremely unlikely to need this)
+            random_chars = "ABCDEFGHJKLMNPQRSTUVWXYZ23456789"
+            brand_prefix = re.sub(r"[^A-Z0-9]", "", current_user.name.upper())[:6]
+            article_number = f"{brand_prefix}-{product_id[:4].upper()}-{''.join(random.choices(random_chars, k=4))}"
+        inserted = db.execute(
+            pg_insert(Product)
+            .values(article_number=article_number, **product_values)
+            .on_conflict_do_nothing(constraint="uq_product_article_number")
+            .returning(Product.id)
+        ).first()
+        if inserted is not None:
+            break
+    else:
+        raise HTTPException(
+            status_code=500, detail="Не удалось сгенерировать артикул, попробуйте ещё раз"
+        )
 
-    # Add color variants (each with its own images and size/stock variants)
+    # Bulk insert color variants, their size/stock variants and styles.
+    # IDs are assigned up front so children can reference parents without a round-trip.
+    color_variants = []
+    variants = []
     for order_index, cv_data in enumerate(product_data.color_variants):
-        color_variant = ProductColorVariant(
-            product_id=product.id,
-            color_name=cv_data.color_name,
-            color_hex=cv_data.color_hex,
-            images=cv_data.images or [],
-            display_order=order_index,
-        )
-        db.add(color_variant)
-    db.commit()
-    db.refresh(product)
-
-    for cv_data in product_data.color_variants:
-        color_variant = (
-            db.query(ProductColorVariant)
-            .filter(
-                ProductColorVariant.product_id == product.id,
-                ProductColorVariant.color_name == cv_data.color_name,
+        color_variant_id = str(uuid.uuid4())
+        color_variants.append(
+            ProductColorVariant(
+                id=color_variant_id,
+                product_id=product_id,
+                color_name=cv_data.color_name,
+                color_hex=cv_data.color_hex,
+                images=cv_data.images or [],
+                display_order=order_index,
             )
-            .first()
         )
-        if not color_variant:
-            continue
-        for v_data in cv_data.variants:
-            variant = ProductVariant(
-                product_color_variant_id=color_variant.id,
+        variants.extend(
+            ProductVariant(
+                id=str(uuid.uuid4()),
+                product_color_variant_id=color_variant_id,
                 size=v_data.size,
                 stock_quantity=v_data.stock_quantity,
             )
-            db.add(variant)
+            for v_data in cv_data.variants
+        )
+    db.bulk_save_objects(color_variants)
+    db.bulk_save_objects(variants)
+    db.bulk_save_objects(
+        [ProductStyle(product_id=product_id, style_id=style_id) for style_id in style_ids]
+    )
     db.commit()
+    recommendation_service.invalidate_active_product_ids()
 
-    # Add styles
-    for style_id in product_data.styles or []:
-        style = db.query(Style).filter(Style.id == style_id).first()
-        if not style:
-            raise HTTPException(
-                status_code=400, detail=f"Стиль с ID {style_id} не найден"
-            )
-        product_style = ProductStyle(product_id=product.id, style_id=style_id)
-        db.add(product_style)
-    db.commit()
-    db.refresh(product)
+    # Reload with brand, styles and variants in one round-trip for serialization
+    product = db.execute(
+        _PRODUCT_BY_ID_STMT, {"product_id": product_id}
+    ).scalar_one()
 
     return product_to_schema(product)
 
 
 @app.put("/api/v1/brands/products/{product_id}", response_model=schemas.Product)
 @limiter.limit("30/minute")
-async def update_product(
+def update_product(
     request: Request,
     product_id: str,
     product_data: schemas.ProductUpdateRequest,
@@ -2712,7 +2763,9 @@ async def update_product(
     db: Session = Depends(get_db),
 ):
     """Update an existing product for the authenticated brand user"""
-    product = db.query(Product).filter(Product.id == product_id).first()
+    product = db.execute(
+        _PRODUCT_BY_ID_STMT, {"product_id": product_id}
+    ).scalar_one_or_none()
     if not product:
         raise HTTPException(
             status_code=404,
@@ -2745,8 +2798,22 @@ async def update_product(
         if consistency_err:
             raise HTTPException(status_code=400, detail=consistency_err)
 
+    update_data = product_data.model_dump(exclude_unset=True)
+
+    # Validate all style IDs in one query before anything is written
+    style_ids = list(dict.fromkeys(update_data.get("styles") or []))
+    if style_ids:
+        found_style_ids = {
+            r[0] for r in db.query(Style.id).filter(Style.id.in_(style_ids)).all()
+        }
+        for style_id in style_ids:
+            if style_id not in found_style_ids:
+                raise HTTPException(
+                    status_code=400, detail=f"Стиль с ID {style_id} не найден"
+                )
+
     # Update product fields
-    for field, value in product_data.dict(exclude_unset=True).items():
+    for field, value in update_data.items():
         if field == "color_variants":
             # Collect all variant IDs referenced by order_items across this product
             all_variant_ids = [
@@ -2768,6 +2835,10 @@ async def update_product(
 
             incoming_color_names = {cv_data["color_name"] for cv_data in value}
             existing_by_name = {cv.color_name: cv for cv in product.color_variants}
+            stale_color_variant_ids = []
+            stale_variant_ids = []
+            new_color_variant_rows = []
+            new_variant_rows = []
 
             # Remove color variants no longer in the incoming list
             for color_name, cv in existing_by_name.items():
@@ -2780,8 +2851,7 @@ async def update_product(
                         for v in cv.variants:
                             v.stock_quantity = 0
                     else:
-                        db.delete(cv)
-            db.flush()
+                        stale_color_variant_ids.append(cv.id)
 
             # Upsert incoming color variants
             for order_index, cv_data in enumerate(value):
@@ -2799,7 +2869,7 @@ async def update_product(
                     for size, v in existing_variants_by_size.items():
                         if size not in incoming_sizes:
                             if v.id not in referenced_variant_ids:
-                                db.delete(v)
+                                stale_variant_ids.append(v.id)
                             else:
                                 v.stock_quantity = 0
                     for v_data in cv_data.get("variants") or []:
@@ -2807,45 +2877,56 @@ async def update_product(
                         if existing_v:
                             existing_v.stock_quantity = v_data["stock_quantity"]
                         else:
-                            db.add(
-                                ProductVariant(
-                                    product_color_variant_id=cv.id,
-                                    size=v_data["size"],
-                                    stock_quantity=v_data["stock_quantity"],
-                                )
+                            new_variant_rows.append(
+                                {
+                                    "id": str(uuid.uuid4()),
+                                    "product_color_variant_id": cv.id,
+                                    "size": v_data["size"],
+                                    "stock_quantity": v_data["stock_quantity"],
+                                }
                             )
                 else:
                     # New color variant
-                    new_cv = ProductColorVariant(
-                        product_id=product.id,
-                        color_name=cv_data["color_name"],
-                        color_hex=cv_data["color_hex"],
-                        images=cv_data.get("images") or [],
-                        display_order=order_index,
+                    color_variant_id = str(uuid.uuid4())
+                    new_color_variant_rows.append(
+                        {
+                            "id": color_variant_id,
+                            "product_id": product.id,
+                            "color_name": cv_data["color_name"],
+                            "color_hex": cv_data["color_hex"],
+                            "images": cv_data.get("images") or [],
+                            "display_order": order_index,
+                        }
                     )
-                    db.add(new_cv)
-                    db.flush()
-                    for v_data in cv_data.get("variants") or []:
-                        db.add(
-                            ProductVariant(
-                                product_color_variant_id=new_cv.id,
-                                size=v_data["size"],
-                                stock_quantity=v_data["stock_quantity"],
-                            )
-                        )
-            db.commit()
+                    new_variant_rows.extend(
+                        {
+                            "id": str(uuid.uuid4()),
+                            "product_color_variant_id": color_variant_id,
+                            "size": v_data["size"],
+                            "stock_quantity": v_data["stock_quantity"],
+                        }
+                        for v_data in cv_data.get("variants") or []
+                    )
+
+            if stale_variant_ids:
+                db.query(ProductVariant).filter(
+                    ProductVariant.id.in_(stale_variant_ids)
+                ).delete(synchronize_session=False)
+            if stale_color_variant_ids:
+                # Size variants go with them via ON DELETE CASCADE
+                db.query(ProductColorVariant).filter(
+                    ProductColorVariant.id.in_(stale_color_variant_ids)
+                ).delete(synchronize_session=False)
+            db.bulk_insert_mappings(ProductColorVariant, new_color_variant_rows)
+            db.bulk_insert_mappings(ProductVariant, new_variant_rows)
         elif field == "styles":
             db.query(ProductStyle).filter(
                 ProductStyle.product_id == product.id
-            ).delete()
-            for style_id in value:
-                style = db.query(Style).filter(Style.id == style_id).first()
-                if not style:
-                    raise HTTPException(
-                        status_code=400, detail=f"Стиль с ID {style_id} не найден"
-                    )
-                product_style = ProductStyle(product_id=product.id, style_id=style_id)
-                db.add(product_style)
+            ).delete(synchronize_session=False)
+            db.bulk_insert_mappings(
+                ProductStyle,
+                [{"product_id": product.id, "style_id": style_id} for style_id in style_ids],
+            )
         elif field == "material":
             product.material = value
         elif field == "general_images":
@@ -2854,14 +2935,18 @@ async def update_product(
             setattr(product, field, value)
 
     db.commit()
-    db.refresh(product)
+    recommendation_service.invalidate_active_product_ids()
+
+    product = db.execute(
+        _PRODUCT_BY_ID_STMT, {"product_id": product_id}
+    ).scalar_one()
 
     return product_to_schema(product)
 
 
 @app.get("/api/v1/brands/products", response_model=List[schemas.Product])
 @limiter.limit("60/minute")
-async def get_brand_products(
+def get_brand_products(
     request: Request,
     current_user: User = Depends(get_current_brand_user),
     db: Session = Depends(get_db),
@@ -2873,24 +2958,23 @@ async def get_brand_products(
         .filter(Product.brand_id == current_user.id)
         .all()
     )
-    return [product_to_schema(p) for p in products]
+    return _model_list_response(
+        schemas.Product, [product_to_schema(p) for p in products]
+    )
 
 
 @app.get("/api/v1/brands/products/{product_id}", response_model=schemas.Product)
 @limiter.limit("60/minute")
-async def get_brand_product_details(
+def get_brand_product_details(
     request: Request,
     product_id: str,
     current_user: User = Depends(get_current_brand_user),
     db: Session = Depends(get_db),
 ):
     """Get details of a specific product for the authenticated brand user"""
-    product = (
-        db.query(Product)
-        .options(*_product_eager_options())
-        .filter(Product.id == product_id)
-        .first()
-    )
+    product = db.execute(
+        _PRODUCT_BY_ID_STMT, {"product_id": product_id}
+    ).scalar_one_or_none()
     if not product:
         raise HTTPException(
             status_code=404,
@@ -2905,7 +2989,7 @@ async def get_brand_product_details(
 
 @app.put("/api/v1/brands/orders/{order_id}/tracking", response_model=MessageResponse)
 @limiter.limit("30/minute")
-async def update_order_tracking(
+def update_order_tracking(
     request: Request,
     order_id: str,
     tracking_data: schemas.UpdateTrackingRequest,
@@ -2913,7 +2997,7 @@ async def update_order_tracking(
     db: Session = Depends(get_db),
 ):
     """Update tracking number and link for an order. Once both are set and order is PAID, status becomes SHIPPED."""
-    order = db.query(Order).filter(Order.id == order_id).first()
+    order = db.execute(_ORDER_BY_ID_STMT, {"order_id": order_id}).scalar_one_or_none()
     if not order:
         raise HTTPException(
             status_code=404,
@@ -2921,17 +3005,17 @@ async def update_order_tracking(
         )
 
     brand_id_filter = str(current_user.id)
-    order_belongs_to_brand = (
-        db.query(OrderItem)
-        .join(ProductVariant, OrderItem.product_variant_id == ProductVariant.id)
-        .join(
-            ProductColorVariant,
-            ProductVariant.product_color_variant_id == ProductColorVariant.id,
+    order_belongs_to_brand = db.execute(
+        select(
+            exists().where(
+                OrderItem.order_id == order_id,
+                ProductVariant.id == OrderItem.product_variant_id,
+                ProductColorVariant.id == ProductVariant.product_color_variant_id,
+                Product.id == ProductColorVariant.product_id,
+                Product.brand_id == brand_id_filter,
+            )
         )
-        .join(Product, ProductColorVariant.product_id == Product.id)
-        .filter(OrderItem.order_id == order_id, Product.brand_id == brand_id_filter)
-        .first()
-    )
+    ).scalar()
 
     if not order_belongs_to_brand:
         raise HTTPException(
@@ -2975,7 +3059,7 @@ class UpdateOrderItemSKURequest(BaseModel):
     "/api/v1/brands/order-items/{order_item_id}/sku", response_model=MessageResponse
 )
 @limiter.limit("30/minute")
-async def update_order_item_sku(
+def update_order_item_sku(
     request: Request,
     order_item_id: str,
     sku_data: UpdateOrderItemSKURequest,
@@ -2987,15 +3071,18 @@ async def update_order_item_sku(
     if not order_item:
         raise HTTPException(status_code=404, detail="Order item not found")
 
-    variant = (
-        db.query(ProductVariant)
-        .filter(ProductVariant.id == order_item.product_variant_id)
-        .first()
-    )
-    if not variant:
+    variant_brand = db.execute(
+        select(ProductVariant.id, Product.brand_id)
+        .outerjoin(
+            ProductColorVariant,
+            ProductVariant.product_color_variant_id == ProductColorVariant.id,
+        )
+        .outerjoin(Product, ProductColorVariant.product_id == Product.id)
+        .where(ProductVariant.id == order_item.product_variant_id)
+    ).first()
+    if not variant_brand:
         raise HTTPException(status_code=404, detail="Product variant not found")
-    product = variant.product
-    if not product or product.brand_id != str(current_user.id):
+    if variant_brand.brand_id != str(current_user.id):
         raise HTTPException(
             status_code=403, detail="Order item does not belong to your brand"
         )
@@ -3012,7 +3099,7 @@ async def update_order_item_sku(
 
 @app.get("/api/v1/user/profile/completion-status")
 @limiter.limit("60/minute")
-async def get_profile_completion_status(
+def get_profile_completion_status(
     request: Request,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db),
@@ -3027,12 +3114,13 @@ async def get_profile_completion_status(
         current_user.profile.gender is not None if current_user.profile else False
     )
     user_id = str(current_user.id)
-    is_brands_complete = (
-        db.query(UserBrand).filter(UserBrand.user_id == user_id).count() > 0
-    )
-    is_styles_complete = (
-        db.query(UserStyle).filter(UserStyle.user_id == user_id).count() > 0
-    )
+    # Presence only: both EXISTS checks in one round-trip instead of two COUNTs
+    is_brands_complete, is_styles_complete = db.execute(
+        select(
+            exists().where(UserBrand.user_id == user_id),
+            exists().where(UserStyle.user_id == user_id),
+        )
+    ).one()
 
     is_complete = is_gender_complete and is_brands_complete and is_styles_complete
 
@@ -3061,7 +3149,7 @@ async def get_profile_completion_status(
 
 @app.get("/api/v1/user/oauth-accounts")
 @limiter.limit("60/minute")
-async def get_oauth_accounts(
+def get_oauth_accounts(
     request: Request,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db),
@@ -3088,7 +3176,7 @@ async def get_oauth_accounts(
 # Enhanced User Profile Management
 @app.put("/api/v1/user/profile", response_model=schemas.UserProfileResponse)
 @limiter.limit("30/minute")
-async def update_user_profile(
+def update_user_profile(
     request: Request,
     profile_data: schemas.UserProfileUpdateRequest,
     current_user: User = Depends(get_current_user),
@@ -3106,14 +3194,14 @@ async def update_user_profile(
             )
         current_user.username = profile_data.username
     if profile_data.email is not None:
-        if (
-            db.query(AuthAccount)
-            .filter(
-                AuthAccount.email == profile_data.email,
-                AuthAccount.id != current_user.auth_account_id,
+        if db.execute(
+            select(
+                exists().where(
+                    AuthAccount.email == profile_data.email,
+                    AuthAccount.id != current_user.auth_account_id,
+                )
             )
-            .first()
-        ):
+        ).scalar():
             raise HTTPException(
                 status_code=400, detail="Email уже привязан к другому аккаунту"
             )
@@ -3121,15 +3209,14 @@ async def update_user_profile(
 
     current_user.updated_at = datetime.now(timezone.utc)  # type: ignore
     db.commit()
-    db.refresh(current_user)
 
-    # Return updated profile using get_user_profile logic
-    return await get_user_profile(request, current_user, db)
+    # Return updated profile (reloads the row with its relationships)
+    return _build_user_profile_response(current_user, db)
 
 
 @app.put("/api/v1/user/profile/data", response_model=schemas.ProfileResponse)
 @limiter.limit("30/minute")
-async def update_user_profile_data(
+def update_user_profile_data(
     request: Request,
     profile_data: schemas.ProfileUpdateRequest,
     current_user: User = Depends(get_current_user),
@@ -3163,10 +3250,9 @@ async def update_user_profile_data(
         profile.avatar_transform = profile_data.avatar_transform
 
     profile.updated_at = datetime.now(timezone.utc)  # type: ignore
-    db.commit()
-    db.refresh(profile)
-
-    return schemas.ProfileResponse(
+    # Flush so a newly created row has its column defaults applied before the snapshot
+    db.flush()
+    response = schemas.ProfileResponse(
         full_name=str(profile.full_name) if profile.full_name else None,  # type: ignore
         gender=profile.gender.value if profile.gender else None,  # type: ignore
         selected_size=str(profile.selected_size) if profile.selected_size else None,  # type: ignore
@@ -3179,6 +3265,9 @@ async def update_user_profile_data(
         if profile.avatar_transform
         else None,  # type: ignore
     )
+    db.commit()
+
+    return response
 
 
 @app.post(
@@ -3215,7 +3304,7 @@ async def get_avatar_presigned_url(
 
 @app.put("/api/v1/user/shipping", response_model=schemas.ShippingInfoResponse)
 @limiter.limit("30/minute")
-async def update_user_shipping_info(
+def update_user_shipping_info(
     request: Request,
     shipping_data: schemas.ShippingInfoUpdateRequest,
     current_user: User = Depends(get_current_user),
@@ -3251,10 +3340,9 @@ async def update_user_shipping_info(
         shipping_info.postal_code = shipping_data.postal_code
 
     shipping_info.updated_at = datetime.now(timezone.utc)  # type: ignore
-    db.commit()
-    db.refresh(shipping_info)
-
-    return schemas.ShippingInfoResponse(
+    # Flush so a newly created row has its column defaults applied before the snapshot
+    db.flush()
+    response = schemas.ShippingInfoResponse(
         delivery_email=str(shipping_info.delivery_email)
         if shipping_info.delivery_email
         else None,  # type: ignore
@@ -3271,11 +3359,14 @@ async def update_user_shipping_info(
         if shipping_info.postal_code
         else None,  # type: ignore
     )
+    db.commit()
+
+    return response
 
 
 @app.put("/api/v1/user/preferences", response_model=schemas.PreferencesResponse)
 @limiter.limit("30/minute")
-async def update_user_preferences(
+def update_user_preferences(
     request: Request,
     preferences_data: schemas.PreferencesUpdateRequest,
     current_user: User = Depends(get_current_user),
@@ -3309,10 +3400,9 @@ async def update_user_preferences(
         preferences.marketing_notifications = preferences_data.marketing_notifications
 
     preferences.updated_at = datetime.now(timezone.utc)  # type: ignore
-    db.commit()
-    db.refresh(preferences)
-
-    return schemas.PreferencesResponse(
+    # Flush so a newly created row has its column defaults applied before the snapshot
+    db.flush()
+    response = schemas.PreferencesResponse(
         size_privacy=preferences.size_privacy.value
         if preferences.size_privacy
         else None,
@@ -3325,35 +3415,70 @@ async def update_user_preferences(
         order_notifications=bool(preferences.order_notifications),  # type: ignore
         marketing_notifications=bool(preferences.marketing_notifications),  # type: ignore
     )
+    db.commit()
+
+    return response
+
+
+# In-memory cache for read-mostly reference lists, stored as encoded JSON bytes.
+# Writes that change a list invalidate it; the TTL bounds staleness across workers.
+_reference_cache: dict = {}  # name -> (body bytes, cached_at)
+REFERENCE_CACHE_TTL = 60 * 60  # 1 hour in seconds
+
+
+def invalidate_reference_cache(*names: str):
+    """Drop cached reference lists ("brands", "styles", "categories"); all when no names given"""
+    if not names:
+        _reference_cache.clear()
+    for name in names:
+        _reference_cache.pop(name, None)
+
+
+def _cached_reference_response(name: str, build) -> Response:
+    """Serve a cached reference list, or build() it and cache the encoded body."""
+    now = time.monotonic()
+    cached = _reference_cache.get(name)
+    if cached and now - cached[1] < REFERENCE_CACHE_TTL:
+        return Response(content=cached[0], media_type="application/json")
+    response = build()
+    _reference_cache[name] = (response.body, now)
+    return response
 
 
 # Brand Management
 @app.get("/api/v1/brands", response_model=List[BrandResponse])
 @limiter.limit("60/minute")
-async def get_brands(request: Request, db: Session = Depends(get_db)):
+def get_brands(request: Request, db: Session = Depends(get_db)):
     """Get all available brands"""
-    brands = db.query(Brand).filter(Brand.is_inactive == False).all()
-    return [
-        BrandResponse(
-            id=str(brand.id),
-            name=str(brand.name),  # type: ignore
-            slug=str(brand.slug),  # type: ignore
-            logo=str(brand.logo) if brand.logo else None,  # type: ignore
-            description=str(brand.description) if brand.description else None,  # type: ignore
-            shipping_price=float(brand.shipping_price)
-            if brand.shipping_price
-            else None,  # type: ignore
-            min_free_shipping=int(brand.min_free_shipping)
-            if brand.min_free_shipping
-            else None,  # type: ignore
-        )
-        for brand in brands
-    ]
+
+    def build():
+        brands = db.query(Brand).filter(Brand.is_inactive == False).all()
+        return _model_list_response(
+            BrandResponse,
+            [
+                BrandResponse(
+                    id=str(brand.id),
+                    name=str(brand.name),  # type: ignore
+                    slug=str(brand.slug),  # type: ignore
+                    logo=str(brand.logo) if brand.logo else None,  # type: ignore
+                    description=str(brand.description) if brand.description else None,  # type: ignore
+                    shipping_price=float(brand.shipping_price)
+                    if brand.shipping_price
+                    else None,  # type: ignore
+                    min_free_shipping=int(brand.min_free_shipping)
+                    if brand.min_free_shipping
+                    else None,  # type: ignore
+                )
+                for brand in brands
+            ],
+        )
+
+    return _cached_reference_response("brands", build)
 
 
 @app.post("/api/v1/user/brands")
 @limiter.limit("30/minute")
-async def update_user_brands(
+def update_user_brands(
     request: Request,
     brands_data: UserBrandsUpdate,
     current_user: User = Depends(get_current_user),
@@ -3364,20 +3489,28 @@ async def update_user_brands(
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not a user account")
     user_id = str(current_user.id)
 
-    # Batch-validate all brand IDs
-    found = db.query(Brand.id).filter(Brand.id.in_(brands_data.brand_ids)).all()
-    found_ids = {r[0] for r in found}
-    missing = set(brands_data.brand_ids) - found_ids
-    if missing:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail=f"Brands not found: {missing}",
-        )
+    brand_ids = list(dict.fromkeys(brands_data.brand_ids))
 
-    # Remove existing and add new
-    db.query(UserBrand).filter(UserBrand.user_id == user_id).delete()
-    for brand_id in brands_data.brand_ids:
-        db.add(UserBrand(user_id=user_id, brand_id=brand_id))
+    # Batch-validate all brand IDs (clearing the list needs no lookup)
+    if brand_ids:
+        found = db.query(Brand.id).filter(Brand.id.in_(brand_ids)).all()
+        found_ids = {r[0] for r in found}
+        missing = set(brand_ids) - found_ids
+        if missing:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Brands not found: {missing}",
+            )
+
+    # Remove existing and add new: one DELETE, one executemany INSERT
+    db.query(UserBrand).filter(UserBrand.user_id == user_id).delete(
+        synchronize_session=False
+    )
+    if brand_ids:
+        db.execute(
+            insert(UserBrand),
+            [{"user_id": user_id, "brand_id": brand_id} for brand_id in brand_ids],
+        )
 
     db.commit()
     return {"message": "Favorite brands updated successfully"}
@@ -3386,20 +3519,27 @@ async def update_user_brands(
 # Style Management
 @app.get("/api/v1/styles", response_model=List[schemas.StyleResponse])
 @limiter.limit("60/minute")
-async def get_styles(request: Request, db: Session = Depends(get_db)):
+def get_styles(request: Request, db: Session = Depends(get_db)):
     """Get all available styles"""
-    styles = db.query(Style).all()
-    return [
-        schemas.StyleResponse(
-            id=style.id, name=style.name, description=style.description
+
+    def build():
+        styles = db.query(Style).all()
+        return _model_list_response(
+            schemas.StyleResponse,
+            [
+                schemas.StyleResponse(
+                    id=style.id, name=style.name, description=style.description
+                )
+                for style in styles
+            ],
         )
-        for style in styles
-    ]
+
+    return _cached_reference_response("styles", build)
 
 
 @app.post("/api/v1/user/styles")
 @limiter.limit("30/minute")
-async def update_user_styles(
+def update_user_styles(
     request: Request,
     styles_data: UserStylesUpdate,
     current_user: User = Depends(get_current_user),
@@ -3410,45 +3550,59 @@ async def update_user_styles(
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not a user account")
     user_id = str(current_user.id)
 
-    # Batch-validate all style IDs
-    found = db.query(Style.id).filter(Style.id.in_(styles_data.style_ids)).all()
-    found_ids = {r[0] for r in found}
-    missing = set(styles_data.style_ids) - found_ids
-    if missing:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail=f"Styles not found: {missing}",
+    style_ids = list(dict.fromkeys(styles_data.style_ids))
+
+    # Batch-validate all style IDs (clearing the list needs no lookup)
+    if style_ids:
+        found = db.query(Style.id).filter(Style.id.in_(style_ids)).all()
+        found_ids = {r[0] for r in found}
+        missing = set(style_ids) - found_ids
+        if missing:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Styles not found: {missing}",
+            )
+
+    # Remove existing and add new: one DELETE, one executemany INSERT
+    db.query(UserStyle).filter(UserStyle.user_id == user_id).delete(
+        synchronize_session=False
+    )
+    if style_ids:
+        db.execute(
+            insert(UserStyle),
+            [{"user_id": user_id, "style_id": style_id} for style_id in style_ids],
         )
 
-    # Remove existing and add new
-    db.query(UserStyle).filter(UserStyle.user_id == user_id).delete()
-    for style_id in styles_data.style_ids:
-        db.add(UserStyle(user_id=user_id, style_id=style_id))
-
     db.commit()
     return {"message": "Favorite styles updated successfully"}
 
 
 @app.get("/api/v1/categories", response_model=List[CategoryResponse])
 @limiter.limit("60/minute")
-async def get_categories(request: Request, db: Session = Depends(get_db)):
+def get_categories(request: Request, db: Session = Depends(get_db)):
     """Get all available categories"""
-    categories = db.query(Category).all()
-    return [
-        CategoryResponse(
-            id=category.id, name=category.name, description=category.description
+
+    def build():
+        categories = db.query(Category).all()
+        return _model_list_response(
+            CategoryResponse,
+            [
+                CategoryResponse(
+                    id=category.id, name=category.name, description=category.description
+                )
+                for category in categories
+            ],
         )
-        for category in categories
-    ]
+
+    return _cached_reference_response("categories", build)
 
 
 @app.get("/api/v1/categories/{category_id}/sizes")
 @limiter.limit("60/minute")
-async def get_category_sizes(request: Request, category_id: str, db: Session = Depends(get_db)):
+def get_category_sizes(request: Request, category_id: str, db: Session = Depends(get_db)):
     """Get available size options for a category. Categories with multiple
     size_types let the brand choose per-product."""
-    category = db.query(Category).filter(Category.id == category_id).first()
-    if not category:
+    if not db.execute(select(exists().where(Category.id == category_id))).scalar():
         raise HTTPException(status_code=404, detail="Категория не найдена")
     allowed = get_size_types(category_id)
 
@@ -3460,7 +3614,6 @@ async def get_category_sizes(request: Request, category_id: str, db: Session = D
             info["waist_values"] = WAIST_VALUES
             info["length_values"] = LENGTH_VALUES
         elif st == "numeric_eu":
-            from size_config import EU_SHOE_SIZES
             info["values"] = EU_SHOE_SIZES
         return info
 
@@ -3473,7 +3626,7 @@ async def get_category_sizes(request: Request, category_id: str, db: Session = D
 # Liking Items Endpoint
 @app.post("/api/v1/user/favorites/toggle", response_model=MessageResponse)
 @limiter.limit("60/minute")
-async def toggle_favorite_item(
+def toggle_favorite_item(
     request: Request,
     toggle_data: ToggleFavoriteRequest,
     current_user: User = Depends(get_current_user),
@@ -3485,44 +3638,44 @@ async def toggle_favorite_item(
     product_id = toggle_data.product_id
     action = toggle_data.action
 
-    product = db.query(Product).filter(Product.id == product_id).first()
-    if not product:
+    product_exists = db.execute(select(exists().where(Product.id == product_id))).scalar()
+    if not product_exists:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="Product not found"
         )
 
-    existing_like = (
-        db.query(UserLikedProduct)
-        .filter(
-            UserLikedProduct.user_id == current_user.id,
-            UserLikedProduct.product_id == product_id,
-        )
-        .first()
-    )
-
+    # Single atomic statement per action; the unique (user_id, product_id)
+    # constraint makes concurrent likes collapse into one row.
     if action == "like":
-        if existing_like:
+        inserted = db.execute(
+            pg_insert(UserLikedProduct)
+            .values(user_id=current_user.id, product_id=product_id)
+            .on_conflict_do_nothing(constraint="uq_user_liked_product")
+            .returning(UserLikedProduct.id)
+        ).first()
+        db.commit()
+        if inserted is None:
             return {"message": "Item already liked."}
-        else:
-            user_liked_product = UserLikedProduct(
-                user_id=current_user.id, product_id=product_id
-            )
-            db.add(user_liked_product)
-            db.commit()
-            return {"message": "Item liked successfully."}
+        return {"message": "Item liked successfully."}
     elif action == "unlike":
-        if existing_like:
-            db.delete(existing_like)
-            db.commit()
-            return {"message": "Item unliked successfully."}
-        else:
+        deleted = db.execute(
+            delete(UserLikedProduct)
+            .where(
+                UserLikedProduct.user_id == current_user.id,
+                UserLikedProduct.product_id == product_id,
+            )
+            .returning(UserLikedProduct.id)
+        ).first()
+        db.commit()
+        if deleted is None:
             return {"message": "Item is not liked."}
+        return {"message": "Item unliked successfully."}
 
 
 # Get User Favorites Endpoint
 @app.get("/api/v1/user/favorites", response_model=List[schemas.Product])
 @limiter.limit("60/minute")
-async def get_user_favorites(
+def get_user_favorites(
     request: Request,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db),
@@ -3532,7 +3685,7 @@ async def get_user_favorites(
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not a user account")
     liked_products = (
         db.query(Product)
-        .options(*_product_eager_options())
+        .options(*_product_eager_options(brand_joined=True))
         .join(UserLikedProduct)
         .join(Brand)
         .filter(
@@ -3542,12 +3695,14 @@ async def get_user_favorites(
         .all()
     )
 
-    return [product_to_schema(p, is_liked=True) for p in liked_products]
+    return _model_list_response(
+        schemas.Product, [product_to_schema(p, is_liked=True) for p in liked_products]
+    )
 
 
 @app.get("/api/v1/users/{user_id}/likes", response_model=List[schemas.Product])
 @limiter.limit("30/minute")
-async def get_friend_liked_items(
+def get_friend_liked_items(
     request: Request,
     user_id: str,
     current_user: User = Depends(get_current_user),
@@ -3574,7 +3729,7 @@ async def get_friend_liked_items(
 
     liked_products = (
         db.query(Product)
-        .options(*_product_eager_options())
+        .options(*_product_eager_options(brand_joined=True))
         .join(UserLikedProduct)
         .join(Brand)
         .filter(
@@ -3584,14 +3739,19 @@ async def get_friend_liked_items(
         .all()
     )
 
-    viewer_liked_ids = {ulp.product_id for ulp in current_user.liked_products}
-    return [product_to_schema(p, is_liked=p.id in viewer_liked_ids) for p in liked_products]
+    viewer_liked_ids = _liked_product_ids(
+        db, current_user.id, (p.id for p in liked_products)
+    )
+    return _model_list_response(
+        schemas.Product,
+        [product_to_schema(p, is_liked=p.id in viewer_liked_ids) for p in liked_products],
+    )
 
 
 # Get Recent Swipes Endpoint
 @app.get("/api/v1/user/recent-swipes", response_model=List[schemas.Product])
 @limiter.limit("60/minute")
-async def get_recent_swipes(
+def get_recent_swipes(
     request: Request,
     limit: int = 5,
     current_user: User = Depends(get_current_user),
@@ -3616,7 +3776,7 @@ async def get_recent_swipes(
     products = (
         db.query(Product)
         .join(Brand)
-        .options(*_product_eager_options())
+        .options(*_product_eager_options(brand_joined=True))
         .filter(
             Product.id.in_(product_ids),
             Brand.is_inactive == False,
@@ -3629,7 +3789,7 @@ async def get_recent_swipes(
 
     # Build results in the order of swipes
     results = []
-    liked_product_ids = {ulp.product_id for ulp in current_user.liked_products}
+    liked_product_ids = _liked_product_ids(db, current_user.id, product_map)
 
     for product_id in product_ids:
         product = product_map.get(product_id)
@@ -3637,13 +3797,13 @@ async def get_recent_swipes(
             results.append(
                 product_to_schema(product, is_liked=product.id in liked_product_ids)
             )
-    return results
+    return _model_list_response(schemas.Product, results)
 
 
 # Item Recommendations Endpoints
 @app.get("/api/v1/recommendations/for_user", response_model=List[schemas.Product])
 @limiter.limit("30/minute")
-async def get_recommendations_for_user(
+def get_recommendations_for_user(
     request: Request,
     limit: int = 5,  # Default to 5 products
     current_user: User = Depends(get_current_user),
@@ -3655,8 +3815,13 @@ async def get_recommendations_for_user(
     products = recommendation_service.get_recommendations_for_user(
         db, current_user, limit
     )
-    liked_product_ids = {ulp.product_id for ulp in current_user.liked_products}
-    return [product_to_schema(p, is_liked=p.id in liked_product_ids) for p in products]
+    liked_product_ids = _liked_product_ids(
+        db, current_user.id, (p.id for p in products)
+    )
+    return _model_list_response(
+        schemas.Product,
+        [product_to_schema(p, is_liked=p.id in liked_product_ids) for p in products],
+    )
 
 
 @app.get(
@@ -3664,7 +3829,7 @@ async def get_recommendations_for_user(
     response_model=List[schemas.Product],
 )
 @limiter.limit("30/minute")
-async def get_recommendations_for_friend(
+def get_recommendations_for_friend(
     request: Request,
     friend_id: str,
     current_user: User = Depends(get_current_user),
@@ -3687,8 +3852,13 @@ async def get_recommendations_for_friend(
     products = recommendation_service.get_recommendations_for_friend(
         db, friend_user, current_user
     )
-    liked_product_ids = {ulp.product_id for ulp in current_user.liked_products}
-    return [product_to_schema(p, is_liked=p.id in liked_product_ids) for p in products]
+    liked_product_ids = _liked_product_ids(
+        db, current_user.id, (p.id for p in products)
+    )
+    return _model_list_response(
+        schemas.Product,
+        [product_to_schema(p, is_liked=p.id in liked_product_ids) for p in products],
+    )
 
 
 # In-memory cache for popular items with TTL
@@ -3702,12 +3872,12 @@ def invalidate_popular_items_cache():
     global _popular_items_cache, _popular_items_cache_time
     _popular_items_cache = None
     _popular_items_cache_time = None
-    print("Popular items cache invalidated")
+    logger.debug("Popular items cache invalidated")
 
 
 @app.get("/api/v1/products/popular", response_model=List[schemas.Product])
 @limiter.limit("30/minute")
-async def get_popular_products(
+def get_popular_products(
     request: Request,
     limit: int = 16,
     current_user: User = Depends(get_current_user),
@@ -3723,16 +3893,16 @@ async def get_popular_products(
     if _popular_items_cache and _popular_items_cache_time:
         cache_age = current_time - _popular_items_cache_time
         if cache_age < POPULAR_ITEMS_CACHE_TTL:
-            print(f"Returning cached popular items (age: {cache_age:.1f}s)")
-            return _popular_items_cache
+            logger.debug("Returning cached popular items (age: %.1fs)", cache_age)
+            return _model_list_response(schemas.Product, _popular_items_cache)
 
     # Cache expired or doesn't exist, fetch from database
-    print("Fetching fresh popular items from database")
+    logger.debug("Fetching fresh popular items from database")
     # Query products ordered by purchase_count descending, limit to top products
     products = (
         db.query(Product)
         .join(Brand)
-        .options(*_product_eager_options())
+        .options(*_product_eager_options(brand_joined=True))
         .filter(Brand.is_inactive == False)
         .order_by(
             Product.purchase_count.desc(),
@@ -3742,7 +3912,9 @@ async def get_popular_products(
         .all()
     )
 
-    liked_product_ids = {ulp.product_id for ulp in current_user.liked_products}
+    liked_product_ids = _liked_product_ids(
+        db, current_user.id, (p.id for p in products)
+    )
 
     results = [
         product_to_schema(p, is_liked=p.id in liked_product_ids) for p in products
@@ -3751,12 +3923,12 @@ async def get_popular_products(
     _popular_items_cache = results
     _popular_items_cache_time = current_time
 
-    return results
+    return _model_list_response(schemas.Product, results)
 
 
 @app.get("/api/v1/products/search", response_model=List[schemas.Product])
 @limiter.limit("30/minute")
-async def search_products(
+def search_products(
     request: Request,
     query: Optional[str] = None,
     category: Optional[str] = None,
@@ -3789,17 +3961,20 @@ async def search_products(
             + func.similarity(Product.description, query_stripped) * 0.5
         ).label("relevance")
 
+        # `%` is the indexable form of similarity() > threshold; every branch
+        # below is served by a GIN index, so the OR becomes a BitmapOr
+        db.execute(text("SET LOCAL pg_trgm.similarity_threshold = 0.15"))
         search_filter = or_(
             Product.search_vector.op('@@')(ts_combined),
-            func.similarity(Product.name, query_stripped) > 0.15,
-            func.similarity(Product.description, query_stripped) > 0.15,
+            Product.name.op('%')(query_stripped),
+            Product.description.op('%')(query_stripped),
             Product.article_number.ilike(f"%{query_stripped}%"),
         )
 
         products_query = (
             db.query(Product, relevance)
             .join(Brand)
-            .options(*_product_eager_options())
+            .options(*_product_eager_options(brand_joined=True))
             .filter(Brand.is_inactive == False)
             .filter(search_filter)
         )
@@ -3807,7 +3982,7 @@ async def search_products(
         products_query = (
             db.query(Product)
             .join(Brand)
-            .options(*_product_eager_options())
+            .options(*_product_eager_options(brand_joined=True))
             .filter(Brand.is_inactive == False)
         )
         if query:
@@ -3848,16 +4023,20 @@ async def search_products(
     products_query = products_query.offset(offset).limit(limit)
 
     rows = products_query.all()
-    liked_product_ids = {ulp.product_id for ulp in current_user.liked_products}
+    liked_product_ids = _liked_product_ids(
+        db, current_user.id, (r[0].id if use_hybrid else r.id for r in rows)
+    )
 
     if use_hybrid:
         return [product_to_schema(r[0], is_liked=r[0].id in liked_product_ids) for r in rows]
-    return [product_to_schema(p, is_liked=p.id in liked_product_ids) for p in rows]
+    return _model_list_response(
+        schemas.Product, [product_to_schema(p, is_liked=p.id in liked_product_ids) for p in rows]
+    )
 
 
 @app.get("/api/v1/products/{product_id}", response_model=schemas.Product)
 @limiter.limit("60/minute")
-async def get_product_details(
+def get_product_details(
     request: Request,
     product_id: str,
     current_user: User = Depends(get_current_user),
@@ -3866,12 +4045,9 @@ async def get_product_details(
     """Get details of a specific product for regular users"""
     if isinstance(current_user, Brand):
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not a user account")
-    product = (
-        db.query(Product)
-        .options(*_product_eager_options())
-        .filter(Product.id == product_id)
-        .first()
-    )
+    product = db.execute(
+        _PRODUCT_BY_ID_STMT, {"product_id": product_id}
+    ).scalar_one_or_none()
     if not product or product.brand.is_inactive:
         raise HTTPException(
             status_code=404,
@@ -3879,15 +4055,30 @@ async def get_product_details(
         )
 
     # Check if user has liked this product
-    is_liked = any(ulp.product_id == product.id for ulp in current_user.liked_products)
+    is_liked = db.execute(
+        _PRODUCT_LIKED_STMT, {"user_id": current_user.id, "product_id": product.id}
+    ).scalar()
 
     return product_to_schema(product, is_liked=is_liked)
 
 
 # Friend System Endpoints
+def _friendship_between(user_a, user_b):
+    """Match the friendship row for a pair, whichever direction it was stored in.
+
+    Compares the canonical (LEAST, GREATEST) ordering of both sides so Postgres
+    answers it with one probe of ix_friendships_pair_canonical.
+    """
+    return and_(
+        func.least(Friendship.user_id, Friendship.friend_id) == func.least(user_a, user_b),
+        func.greatest(Friendship.user_id, Friendship.friend_id)
+        == func.greatest(user_a, user_b),
+    )
+
+
 @app.post("/api/v1/friends/request", response_model=MessageResponse)
 @limiter.limit("20/minute")
-async def send_friend_request(
+def send_friend_request(
     request: Request,
     request_data: FriendRequestCreate,
     current_user: User = Depends(get_current_user),
@@ -3896,21 +4087,34 @@ async def send_friend_request(
     """Send a friend request to another user"""
     if isinstance(current_user, Brand):
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not a user account")
-    # Find recipient by username or email
-    recipient = None
+    # One round-trip: resolve the recipient and, via correlated EXISTS, whether the pair
+    # are already friends or have a pending request in either direction
+    is_friend = exists().where(_friendship_between(current_user.id, User.id))
+    has_pending_request = exists().where(
+        or_(
+            and_(
+                FriendRequest.sender_id == current_user.id,
+                FriendRequest.recipient_id == User.id,
+            ),
+            and_(
+                FriendRequest.sender_id == User.id,
+                FriendRequest.recipient_id == current_user.id,
+            ),
+        ),
+        FriendRequest.status == FriendRequestStatus.PENDING,
+    )
+    query = db.query(
+        User.id,
+        is_friend.label("is_friend"),
+        has_pending_request.label("has_pending_request"),
+    )
     if "@" in request_data.recipient_identifier:
-        recipient = (
-            db.query(User)
-            .join(AuthAccount)
-            .filter(AuthAccount.email == request_data.recipient_identifier)
-            .first()
+        query = query.join(AuthAccount, AuthAccount.id == User.auth_account_id).filter(
+            AuthAccount.email == request_data.recipient_identifier
         )
     else:
-        recipient = (
-            db.query(User)
-            .filter(User.username == request_data.recipient_identifier)
-            .first()
-        )
+        query = query.filter(User.username == request_data.recipient_identifier)
+    recipient = query.first()
 
     if not recipient:
         raise HTTPException(
@@ -3923,49 +4127,16 @@ async def send_friend_request(
             detail="Cannot send friend request to yourself",
         )
 
-    # Check if already friends
-    existing_friendship = (
-        db.query(Friendship)
-        .filter(
-            (
-                (Friendship.user_id == current_user.id)
-                & (Friendship.friend_id == recipient.id)
-            )
-            | (
-                (Friendship.user_id == recipient.id)
-                & (Friendship.friend_id == current_user.id)
-            )
-        )
-        .first()
-    )
-
-    if existing_friendship:
+    if recipient.is_friend:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST, detail="Already friends"
         )
 
-    # Check if friend request already exists
-    existing_request = (
-        db.query(FriendRequest)
-        .filter(
-            (
-                (FriendRequest.sender_id == current_user.id)
-                & (FriendRequest.recipient_id == recipient.id)
-            )
-            | (
-                (FriendRequest.sender_id == recipient.id)
-                & (FriendRequest.recipient_id == current_user.id)
-            )
+    if recipient.has_pending_request:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Friend request already pending",
         )
-        .first()
-    )
-
-    if existing_request:
-        if existing_request.status == FriendRequestStatus.PENDING:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Friend request already pending",
-            )
 
     # Create new friend request
     friend_request = FriendRequest(
@@ -3982,7 +4153,7 @@ async def send_friend_request(
 
 @app.get("/api/v1/friends/requests/sent", response_model=List[FriendRequestResponse])
 @limiter.limit("60/minute")
-async def get_sent_friend_requests(
+def get_sent_friend_requests(
     request: Request,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db),
@@ -4012,7 +4183,7 @@ async def get_sent_friend_requests(
     response_model=List[ReceivedFriendRequestResponse],
 )
 @limiter.limit("60/minute")
-async def get_received_friend_requests(
+def get_received_friend_requests(
     request: Request,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db),
@@ -4044,7 +4215,7 @@ async def get_received_friend_requests(
     "/api/v1/friends/requests/{request_id}/accept", response_model=MessageResponse
 )
 @limiter.limit("30/minute")
-async def accept_friend_request(
+def accept_friend_request(
     request: Request,
     request_id: str,
     current_user: User = Depends(get_current_user),
@@ -4053,33 +4224,42 @@ async def accept_friend_request(
     """Accept a friend request"""
     if isinstance(current_user, Brand):
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not a user account")
-    friend_request = (
-        db.query(FriendRequest)
-        .filter(
+    # Delete the pending request and create the friendship from its row in
+    # a single statement: WITH accepted AS (DELETE ... RETURNING), inserted AS
+    # (INSERT ... ON CONFLICT DO NOTHING) SELECT FROM accepted. If the pair is
+    # already friends the insert is a no-op and accepting still succeeds.
+    accepted = (
+        delete(FriendRequest)
+        .where(
             FriendRequest.id == request_id,
             FriendRequest.recipient_id == current_user.id,
             FriendRequest.status == FriendRequestStatus.PENDING,
         )
-        .first()
+        .returning(FriendRequest.sender_id, FriendRequest.recipient_id)
+        .cte("accepted")
+    )
+    inserted = (
+        pg_insert(Friendship)
+        .from_select(
+            ["id", "user_id", "friend_id", "created_at"],
+            select(
+                literal(str(uuid.uuid4())),
+                accepted.c.sender_id,
+                accepted.c.recipient_id,
+                literal(datetime.now(timezone.utc)),
+            ),
+        )
+        .on_conflict_do_nothing()
+        .returning(Friendship.id)
+        .cte("inserted")
     )
+    sender_id = db.execute(select(accepted.c.sender_id).add_cte(inserted)).scalar()
 
-    if not friend_request:
+    if sender_id is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Friend request not found or not pending",
         )
-
-    # Update request status
-    friend_request.status = FriendRequestStatus.ACCEPTED  # type: ignore
-    friend_request.updated_at = datetime.now(timezone.utc)  # type: ignore
-
-    # Create friendship
-    friendship = Friendship(
-        user_id=friend_request.sender_id, friend_id=friend_request.recipient_id
-    )
-
-    db.add(friendship)
-    db.delete(friend_request)  # Delete the friend request after acceptance
     db.commit()
 
     return {"message": "Friend request accepted."}
@@ -4089,7 +4269,7 @@ async def accept_friend_request(
     "/api/v1/friends/requests/{request_id}/reject", response_model=MessageResponse
 )
 @limiter.limit("30/minute")
-async def reject_friend_request(
+def reject_friend_request(
     request: Request,
     request_id: str,
     current_user: User = Depends(get_current_user),
@@ -4098,25 +4278,23 @@ async def reject_friend_request(
     """Reject a friend request"""
     if isinstance(current_user, Brand):
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not a user account")
-    friend_request = (
-        db.query(FriendRequest)
-        .filter(
+    # The request row is removed on rejection; one DELETE ... RETURNING both
+    # checks that it exists and is pending, and deletes it
+    deleted = db.execute(
+        delete(FriendRequest)
+        .where(
             FriendRequest.id == request_id,
             FriendRequest.recipient_id == current_user.id,
             FriendRequest.status == FriendRequestStatus.PENDING,
         )
-        .first()
-    )
+        .returning(FriendRequest.id)
+    ).first()
 
-    if not friend_request:
+    if not deleted:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Friend request not found or not pending",
         )
-
-    friend_request.status = FriendRequestStatus.REJECTED  # type: ignore
-    friend_request.updated_at = datetime.now(timezone.utc)  # type: ignore
-    db.delete(friend_request)  # Delete the friend request after rejection
     db.commit()
 
     return {"message": "Friend request rejected."}
@@ -4126,7 +4304,7 @@ async def reject_friend_request(
     "/api/v1/friends/requests/{request_id}/cancel", response_model=MessageResponse
 )
 @limiter.limit("30/minute")
-async def cancel_friend_request(
+def cancel_friend_request(
     request: Request,
     request_id: str,
     current_user: User = Depends(get_current_user),
@@ -4135,25 +4313,23 @@ async def cancel_friend_request(
     """Cancel a sent friend request"""
     if isinstance(current_user, Brand):
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not a user account")
-    friend_request = (
-        db.query(FriendRequest)
-        .filter(
+    # The request row is removed on cancellation; one DELETE ... RETURNING both
+    # checks that it exists and is pending, and deletes it
+    deleted = db.execute(
+        delete(FriendRequest)
+        .where(
             FriendRequest.id == request_id,
             FriendRequest.sender_id == current_user.id,
             FriendRequest.status == FriendRequestStatus.PENDING,
         )
-        .first()
-    )
+        .returning(FriendRequest.id)
+    ).first()
 
-    if not friend_request:
+    if not deleted:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Friend request not found or not pending",
         )
-
-    friend_request.status = FriendRequestStatus.CANCELLED  # type: ignore
-    friend_request.updated_at = datetime.now(timezone.utc)  # type: ignore
-    db.delete(friend_request)  # Delete the friend request after cancellation
     db.commit()
 
     return {"message": "Friend request cancelled."}
@@ -4161,7 +4337,7 @@ async def cancel_friend_request(
 
 @app.get("/api/v1/friends", response_model=List[FriendResponse])
 @limiter.limit("60/minute")
-async def get_friends_list(
+def get_friends_list(
     request: Request,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db),
@@ -4169,15 +4345,15 @@ async def get_friends_list(
     """Get user's friends list"""
     if isinstance(current_user, Brand):
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not a user account")
-    # Get friendships where current user is either user or friend
-    friendships = (
-        db.query(Friendship)
-        .options(
-            joinedload(Friendship.user).joinedload(User.profile),
-            joinedload(Friendship.user).joinedload(User.preferences),
-            joinedload(Friendship.friend).joinedload(User.profile),
-            joinedload(Friendship.friend).joinedload(User.preferences),
-        )
+    # Resolve the counterpart of every friendship in one query
+    other_id = case(
+        (Friendship.user_id == current_user.id, Friendship.friend_id),
+        else_=Friendship.user_id,
+    )
+    friend_users = (
+        db.query(User)
+        .join(Friendship, User.id == other_id)
+        .options(joinedload(User.profile), joinedload(User.preferences))
         .filter(
             (Friendship.user_id == current_user.id)
             | (Friendship.friend_id == current_user.id)
@@ -4186,43 +4362,38 @@ async def get_friends_list(
     )
 
     friends = []
-    for friendship in friendships:
-        friend_user = (
-            friendship.friend
-            if friendship.user_id == current_user.id  # type: ignore
-            else friendship.user
-        )
-        if friend_user:
-            avatar_url = friend_user.profile.avatar_url if friend_user.profile else None
-            can_view_recs = check_privacy_access(db, current_user, friend_user, "recommendations_privacy")
-            can_view_likes = check_privacy_access(db, current_user, friend_user, "likes_privacy")
-            can_view_size = check_privacy_access(db, current_user, friend_user, "size_privacy")
-            raw_size = friend_user.profile.selected_size if friend_user.profile else None
-            size_privacy_val = getattr(friend_user.preferences, "size_privacy", "friends") if friend_user.preferences else "friends"
-            selected_size = None
-            if can_view_size and friend_user.profile:
-                selected_size = friend_user.profile.selected_size
-            logger.info(
-                "friend_size_debug: friend=%s size_privacy=%s can_view=%s raw_size=%s returned_size=%s",
-                friend_user.username, size_privacy_val, can_view_size, raw_size, selected_size,
-            )
-            friends.append(
-                {
-                    "id": friend_user.id,
-                    "username": friend_user.username,
-                    "avatar_url": avatar_url,
-                    "can_view_recommendations": can_view_recs,
-                    "can_view_likes": can_view_likes,
-                    "selected_size": selected_size,
-                }
-            )
+    for friend_user in friend_users:
+        avatar_url = friend_user.profile.avatar_url if friend_user.profile else None
+        can_view_recs = _check_privacy_inline(friend_user, "recommendations_privacy", True)
+        can_view_likes = _check_privacy_inline(friend_user, "likes_privacy", True)
+        can_view_size = _check_privacy_inline(friend_user, "size_privacy", True)
+        raw_size = friend_user.profile.selected_size if friend_user.profile else None
+        size_privacy_val = getattr(friend_user.preferences, "size_privacy", "friends") if friend_user.preferences else "friends"
+        selected_size = None
+        if can_view_size and friend_user.profile:
+            selected_size = friend_user.profile.selected_size
+        logger.debug(
+            "friend_size_debug: friend=%s size_privacy=%s can_view=%s raw_size=%s returned_size=%s",
+            friend_user.username, size_privacy_val, can_view_size, raw_size, selected_size,
+        )
+        friends.append(
+            {
+                "id": friend_user.id,
+                "username": friend_user.username,
+                "avatar_url": avatar_url,
+                "can_view_recommendations": can_view_recs,
+                "can_view_likes": can_view_likes,
+                "selected_size": selected_size,
+            }
+        )
 
-    return friends
+    # Dicts are already FriendResponse-shaped; skip response_model re-validation
+    return ORJSONResponse(friends)
 
 
 @app.delete("/api/v1/friends/{friend_id}", response_model=MessageResponse)
 @limiter.limit("20/minute")
-async def remove_friend(
+def remove_friend(
     request: Request,
     friend_id: str,
     current_user: User = Depends(get_current_user),
@@ -4231,28 +4402,16 @@ async def remove_friend(
     """Remove a friend"""
     if isinstance(current_user, Brand):
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not a user account")
-    # Find the friendship entry
-    friendship = (
-        db.query(Friendship)
-        .filter(
-            (
-                (Friendship.user_id == current_user.id)
-                & (Friendship.friend_id == friend_id)
-            )
-            | (
-                (Friendship.user_id == friend_id)
-                & (Friendship.friend_id == current_user.id)
-            )
-        )
-        .first()
-    )
+    removed = db.execute(
+        delete(Friendship)
+        .where(_friendship_between(current_user.id, friend_id))
+        .returning(Friendship.id)
+    ).scalar()
 
-    if not friendship:
+    if removed is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="Friendship not found"
         )
-
-    db.delete(friendship)
     db.commit()
 
     return {"message": "Friend removed successfully"}
@@ -4260,7 +4419,7 @@ async def remove_friend(
 
 @app.get("/api/v1/users/search", response_model=List[UserSearchResponse])
 @limiter.limit("30/minute")
-async def search_users(
+def search_users(
     request: Request,
     query: str,
     current_user: User = Depends(get_current_user),
@@ -4275,77 +4434,55 @@ async def search_users(
             detail="Search query must be at least 2 characters",
         )
 
-    # Search by username or email (case insensitive)
-    users = (
-        db.query(User)
-        .options(joinedload(User.profile), joinedload(User.preferences))
+    # One round-trip: matched users plus their relationship to the caller,
+    # computed per row by correlated EXISTS checks
+    is_friend = exists().where(_friendship_between(current_user.id, User.id))
+    request_sent = exists().where(
+        FriendRequest.sender_id == current_user.id,
+        FriendRequest.recipient_id == User.id,
+        FriendRequest.status == FriendRequestStatus.PENDING,
+    )
+    request_received = exists().where(
+        FriendRequest.sender_id == User.id,
+        FriendRequest.recipient_id == current_user.id,
+        FriendRequest.status == FriendRequestStatus.PENDING,
+    )
+    friend_status = case(
+        (is_friend, "friend"),
+        (request_sent, "request_sent"),
+        (request_received, "request_received"),
+        else_="not_friend",
+    ).label("friend_status")
+
+    # Search by username or email (case insensitive). The two ILIKEs sit on
+    # different tables, so they are matched separately and unioned: each branch
+    # can then use its own trigram index instead of scanning the join.
+    # "_" is common in usernames, so typed wildcards are matched literally
+    escaped = query.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    pattern = f"%{escaped}%"
+    matched_ids = union(
+        select(User.id).where(User.username.ilike(pattern, escape="\\")),
+        select(User.id)
+        .join(AuthAccount, AuthAccount.id == User.auth_account_id)
+        .where(AuthAccount.email.ilike(pattern, escape="\\")),
+    )
+    rows = (
+        db.query(User, friend_status)
         .join(AuthAccount)
-        .filter(
-            (User.username.ilike(f"%{query}%") | AuthAccount.email.ilike(f"%{query}%"))
-            & (User.id != current_user.id)
+        .options(
+            contains_eager(User.auth_account),
+            joinedload(User.profile),
+            joinedload(User.preferences),
         )
+        .filter(User.id.in_(matched_ids), User.id != current_user.id)
         .limit(20)
         .all()
     )
 
-    user_ids = [u.id for u in users]
-
-    # Batch-fetch friendships
-    friend_rows = (
-        db.query(Friendship)
-        .filter(
-            (
-                (Friendship.user_id == current_user.id)
-                & (Friendship.friend_id.in_(user_ids))
-            )
-            | (
-                (Friendship.user_id.in_(user_ids))
-                & (Friendship.friend_id == current_user.id)
-            )
-        )
-        .all()
-    )
-    friend_ids = set()
-    for f in friend_rows:
-        friend_ids.add(f.friend_id if f.user_id == current_user.id else f.user_id)
-
-    # Batch-fetch pending sent requests
-    sent_rows = (
-        db.query(FriendRequest.recipient_id)
-        .filter(
-            FriendRequest.sender_id == current_user.id,
-            FriendRequest.recipient_id.in_(user_ids),
-            FriendRequest.status == FriendRequestStatus.PENDING,
-        )
-        .all()
-    )
-    sent_to = {r[0] for r in sent_rows}
-
-    # Batch-fetch pending received requests
-    recv_rows = (
-        db.query(FriendRequest.sender_id)
-        .filter(
-            FriendRequest.sender_id.in_(user_ids),
-            FriendRequest.recipient_id == current_user.id,
-            FriendRequest.status == FriendRequestStatus.PENDING,
-        )
-        .all()
-    )
-    received_from = {r[0] for r in recv_rows}
-
     result = []
-    for user in users:
-        if user.id in friend_ids:
-            friend_status = "friend"
-        elif user.id in sent_to:
-            friend_status = "request_sent"
-        elif user.id in received_from:
-            friend_status = "request_received"
-        else:
-            friend_status = "not_friend"
-
+    for user, friend_status in rows:
         avatar_url = user.profile.avatar_url if user.profile else None
-        is_friend = user.id in friend_ids
+        is_friend = friend_status == "friend"
         can_view_recs = _check_privacy_inline(user, "recommendations_privacy", is_friend)
         can_view_likes = _check_privacy_inline(user, "likes_privacy", is_friend)
         result.append(
@@ -4360,7 +4497,8 @@ async def search_users(
             }
         )
 
-    return result
+    # Dicts are already UserSearchResponse-shaped; skip response_model re-validation
+    return ORJSONResponse(result)
 
 
 def _check_privacy_inline(target_user, privacy_field, is_friend):
@@ -4387,20 +4525,14 @@ def check_privacy_access(db, viewer, target_user, privacy_field):
     if setting == "nobody":
         return False
     # "friends" — check friendship
-    return (
-        db.query(Friendship)
-        .filter(
-            ((Friendship.user_id == viewer.id) & (Friendship.friend_id == target_user.id))
-            | ((Friendship.user_id == target_user.id) & (Friendship.friend_id == viewer.id))
-        )
-        .first()
-        is not None
-    )
+    return db.query(
+        exists().where(_friendship_between(viewer.id, target_user.id))
+    ).scalar()
 
 
 @app.get("/api/v1/users/{user_id}/profile", response_model=PublicUserProfileResponse)
 @limiter.limit("60/minute")
-async def get_public_user_profile(
+def get_public_user_profile(
     request: Request,
     user_id: str,
     current_user: User = Depends(get_current_user),
@@ -4430,27 +4562,39 @@ async def get_public_user_profile(
     }
 
 
+# Everything but the timestamp is fixed for the life of the process
+_HEALTH_BASE = {
+    "status": "healthy",
+    "version": "1.0.0",
+    "database": "postgresql",
+    "oauth_providers": [
+        "google" if settings.GOOGLE_CLIENT_ID else None,
+        "facebook" if settings.FACEBOOK_CLIENT_ID else None,
+        "github" if settings.GITHUB_CLIENT_ID else None,
+        "apple" if settings.APPLE_CLIENT_ID else None,
+    ],
+}
+
+
+# Serialized /health body, rebuilt at most once per wall-clock second
+_health_cache = (0, b"")
+
+
 # Health check endpoint
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
-    return {
-        "status": "healthy",
-        "timestamp": datetime.now(timezone.utc),
-        "version": "1.0.0",
-        "database": "postgresql",
-        "oauth_providers": [
-            "google" if settings.GOOGLE_CLIENT_ID else None,
-            "facebook" if settings.FACEBOOK_CLIENT_ID else None,
-            "github" if settings.GITHUB_CLIENT_ID else None,
-            "apple" if settings.APPLE_CLIENT_ID else None,
-        ],
-    }
+    global _health_cache
+    now = int(time.time())
+    if _health_cache[0] != now:
+        payload = {**_HEALTH_BASE, "timestamp": datetime.fromtimestamp(now, timezone.utc)}
+        _health_cache = (now, orjson.dumps(payload))
+    return Response(content=_health_cache[1], media_type="application/json")
 
 
 @app.post("/api/v1/payments/create", response_model=PaymentCreateResponse)
 @limiter.limit("10/minute")
-async def create_payment_endpoint(
+def create_payment_endpoint(
     request: Request,
     payment_data: schemas.PaymentCreate,
     current_user: User = Depends(get_current_user),
@@ -4470,7 +4614,7 @@ async def create_payment_endpoint(
         )
         return PaymentCreateResponse(confirmation_url=confirmation_url, payment_id=payment_id)
     except ValidationError as e:
-        print(f"Pydantic Validation Error: {e.errors()}")
+        logger.warning("Pydantic validation error: %s", e.errors())
         raise HTTPException(
             status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=e.errors()
         )
@@ -4482,17 +4626,42 @@ async def create_payment_endpoint(
         )
 
 
-def _order_to_summary(order: Order) -> schemas.OrderSummaryResponse:
-    return schemas.OrderSummaryResponse(
-        id=str(order.id),  # type: ignore
-        number=str(order.order_number),  # type: ignore
-        total_amount=float(order.total_amount),  # type: ignore
-        currency="RUB",
-        date=order.created_at,  # type: ignore
-        status=order.status.value,
-        tracking_number=str(order.tracking_number) if order.tracking_number else None,  # type: ignore
-        tracking_link=str(order.tracking_link) if order.tracking_link else None,  # type: ignore
-        shipping_cost=float(order.shipping_cost or 0.0),  # type: ignore
+# Columns _order_summary_rows_response() needs; list queries select only these.
+_ORDER_SUMMARY_COLUMNS = (
+    Order.id,
+    Order.order_number,
+    Order.total_amount,
+    Order.created_at,
+    Order.status,
+    Order.tracking_number,
+    Order.tracking_link,
+    Order.shipping_cost,
+)
+
+
+def _order_summary_rows_response(rows) -> Response:
+    """Encode OrderSummaryResponse-shaped JSON straight from column rows.
+
+    Same fields as schemas.OrderSummaryResponse, but with no ORM instances or pydantic
+    models per row; OPT_UTC_Z keeps datetimes in pydantic's "Z" form.
+    """
+    payload = [
+        {
+            "id": str(r.id),
+            "number": str(r.order_number),
+            "total_amount": float(r.total_amount),
+            "currency": "RUB",
+            "date": r.created_at,
+            "status": r.status.value,
+            "tracking_number": str(r.tracking_number) if r.tracking_number else None,
+            "tracking_link": str(r.tracking_link) if r.tracking_link else None,
+            "shipping_cost": float(r.shipping_cost or 0.0),
+        }
+        for r in rows
+    ]
+    return Response(
+        content=orjson.dumps(payload, option=orjson.OPT_UTC_Z),
+        media_type="application/json",
     )
 
 
@@ -4656,7 +4825,7 @@ def _order_to_full_response(order: Order) -> schemas.OrderResponse:
 
 @app.post("/api/v1/orders/test", response_model=schemas.OrderTestCreateResponse)
 @limiter.limit("10/minute")
-async def create_order_test_endpoint(
+def create_order_test_endpoint(
     request: Request,
     order_data: schemas.OrderTestCreate,
     current_user: User = Depends(get_current_user),
@@ -4685,7 +4854,7 @@ async def create_order_test_endpoint(
 
 @app.post("/api/v1/orders/{order_id}/confirm-test", response_model=MessageResponse)
 @limiter.limit("10/minute")
-async def confirm_test_order(
+def confirm_test_order(
     request: Request,
     order_id: str,
     current_user: User = Depends(get_current_user),
@@ -4720,39 +4889,39 @@ async def confirm_test_order(
 
 @app.get("/api/v1/orders", response_model=List[schemas.OrderSummaryResponse])
 @limiter.limit("60/minute")
-async def get_orders(
+def get_orders(
     request: Request,
     current_user: any = Depends(get_current_user),
     db: Session = Depends(get_db),
 ):
     """Get order list. Users see Checkouts; brands see their Orders."""
-    is_brand = isinstance(current_user, Brand)
-
-    if is_brand:
-        orders = (
-            db.query(Order)
-            .filter(Order.brand_id == current_user.id)
-            .order_by(Order.created_at.desc())
-            .all()
-        )
-        return [_order_to_summary(o) for o in orders]
+    if isinstance(current_user, Brand):
+        owner_filter = Order.brand_id == current_user.id
     else:
-        orders = (
-            db.query(Order)
-            .filter(Order.user_id == str(current_user.id))
-            .order_by(Order.created_at.desc())
-            .all()
-        )
-        return [_order_to_summary(o) for o in orders]
-
-
-_order_load = (
-    joinedload(Order.checkout),
-    joinedload(Order.items)
+        owner_filter = Order.user_id == str(current_user.id)
+    rows = db.execute(
+        select(*_ORDER_SUMMARY_COLUMNS)
+        .where(owner_filter)
+        .order_by(Order.created_at.desc())
+    ).all()
+    return _order_summary_rows_response(rows)
+
+
+# Items are fetched with one selectin query per collection level; each item's
+# variant -> color -> product -> brand chain is many-to-one and rides along joined.
+_order_items_load = (
+    selectinload(Order.items)
     .joinedload(OrderItem.product_variant)
     .joinedload(ProductVariant.color_variant)
     .joinedload(ProductColorVariant.product)
-    .joinedload(Product.brand),
+    .joinedload(Product.brand)
+    .lazyload(Brand.auth_account)
+)
+
+_order_load = (
+    joinedload(Order.checkout),
+    joinedload(Order.brand).lazyload(Brand.auth_account),
+    _order_items_load,
 )
 
 
@@ -4771,7 +4940,7 @@ def _order_delivery(order: Order):
 
 @app.get("/api/v1/orders/{order_id}", response_model=schemas.OrderResponse)
 @limiter.limit("60/minute")
-async def get_order_by_id(
+def get_order_by_id(
     request: Request,
     order_id: str,
     current_user: any = Depends(get_current_user),
@@ -4816,7 +4985,7 @@ async def get_order_by_id(
 
 @app.delete("/api/v1/orders/{order_id}/cancel", response_model=MessageResponse)
 @limiter.limit("10/minute")
-async def buyer_cancel_order(
+def buyer_cancel_order(
     request: Request,
     order_id: str,
     current_user: User = Depends(get_current_user),
@@ -4907,12 +5076,10 @@ def admin_get_returns(
     # Batch-fetch most recent "returned" status event per order
     order_ids = list({order.id for _, order, *_ in rows})
     if order_ids:
-        from sqlalchemy import func as sa_func
-
         subq = (
             db.query(
                 OrderStatusEvent.order_id,
-                sa_func.max(OrderStatusEvent.created_at).label("max_created"),
+                func.max(OrderStatusEvent.created_at).label("max_created"),
             )
             .filter(
                 OrderStatusEvent.order_id.in_(order_ids),
@@ -5007,8 +5174,6 @@ def admin_log_return(
     db: Session = Depends(get_db),
 ):
     """Admin: mark order items as returned, update order status, notify brand."""
-    from models import OrderItem, ProductVariant
-
     order = db.query(Order).filter(Order.id == body.order_id).first()
     if not order:
         raise HTTPException(status_code=404, detail="Заказ не найден")
@@ -5019,31 +5184,42 @@ def admin_log_return(
             detail=f"Returns can only be logged for shipped orders. Current status: {order.status.value}",
         )
 
-    updated_count = 0
+    # Load every item of the order once and pick the requested ones out in Python
+    all_items = db.query(OrderItem).filter(OrderItem.order_id == body.order_id).all()
+    items_by_id = {i.id: i for i in all_items}
     for item_id in body.item_ids:
-        item = (
-            db.query(OrderItem)
-            .filter(
-                OrderItem.id == item_id,
-                OrderItem.order_id == body.order_id,
-            )
-            .first()
-        )
-        if not item:
+        if item_id not in items_by_id:
             raise HTTPException(
                 status_code=404, detail=f"Позиция {item_id} не найдена в заказе"
             )
-        if item.status == "returned":
-            continue  # already returned — skip silently
-        item.status = "returned"
-        updated_count += 1
-        # Restore stock for this item
-        variant = (
+    to_return = [
+        items_by_id[item_id]
+        for item_id in dict.fromkeys(body.item_ids)
+        if items_by_id[item_id].status != "returned"  # already returned — skip silently
+    ]
+
+    # Lock all affected variants in one statement (stable order), products via one IN load
+    variant_ids = {item.product_variant_id for item in to_return}
+    variants = {}
+    if variant_ids:
+        locked = (
             db.query(ProductVariant)
+            .options(
+                selectinload(ProductVariant.color_variant).selectinload(
+                    ProductColorVariant.product
+                )
+            )
+            .filter(ProductVariant.id.in_(variant_ids))
+            .order_by(ProductVariant.id)
             .with_for_update()
-            .filter(ProductVariant.id == item.product_variant_id)
-            .first()
+            .all()
         )
+        variants = {v.id: v for v in locked}
+
+    for item in to_return:
+        item.status = "returned"
+        # Restore stock for this item
+        variant = variants.get(item.product_variant_id)
         if variant:
             variant.stock_quantity += item.quantity
             product = variant.product
@@ -5052,7 +5228,6 @@ def admin_log_return(
                     0, product.purchase_count - item.quantity
                 )
     # Determine new order status
-    all_items = db.query(OrderItem).filter(OrderItem.order_id == body.order_id).all()
     all_returned = all(i.status == "returned" for i in all_items)
     if all_returned:
         payment_service.update_order_status(
@@ -5139,9 +5314,10 @@ def admin_record_withdrawal(
     )
     db.add(withdrawal)
     brand.amount_withdrawn = float(brand.amount_withdrawn or 0) + body.amount
+    db.flush()  # INSERT ... RETURNING fills withdrawal.id without a follow-up SELECT
+    response = {"id": withdrawal.id, "amount": withdrawal.amount}
     db.commit()
-    db.refresh(withdrawal)
-    return {"id": withdrawal.id, "amount": withdrawal.amount}
+    return response
 
 
 @app.get(
@@ -5276,17 +5452,14 @@ def admin_get_brand(
 def admin_create_brand(
     request: Request,
     body: schemas.AdminBrandCreate,
+    background_tasks: BackgroundTasks,
     admin: AuthAccount = Depends(get_current_admin),
     db: Session = Depends(get_db),
 ):
     """Admin: create a new brand with temporary password."""
-    if (
-        db.query(AuthAccount)
-        .filter(AuthAccount.email == body.email)
-        .first()
-    ):
+    if db.execute(select(exists().where(AuthAccount.email == body.email))).scalar():
         raise HTTPException(status_code=400, detail="Email уже зарегистрирован")
-    if db.query(Brand).filter(Brand.name == body.name).first():
+    if db.execute(select(exists().where(Brand.name == body.name))).scalar():
         raise HTTPException(status_code=400, detail="Бренд с таким названием уже существует")
 
     temp_password = secrets.token_urlsafe(12)
@@ -5300,7 +5473,9 @@ def admin_create_brand(
     db.flush()
 
     slug = generate_brand_slug(body.name, db)
+    brand_id = str(uuid.uuid4())
     brand = Brand(
+        id=brand_id,
         name=body.name,
         auth_account_id=acc.id,
         slug=slug,
@@ -5318,13 +5493,14 @@ def admin_create_brand(
     )
     db.add(brand)
     db.commit()
-    db.refresh(brand)
 
-    mail_service.send_brand_welcome_email(body.email, body.name, temp_password)
+    background_tasks.add_task(
+        mail_service.send_brand_welcome_email, body.email, body.name, temp_password
+    )
 
     return schemas.AdminBrandCreateResponse(
-        id=str(brand.id),
-        name=str(brand.name),
+        id=brand_id,
+        name=body.name,
         email=body.email,
         slug=slug,
         temporary_password=temp_password,
@@ -5347,17 +5523,22 @@ def admin_update_brand(
         raise HTTPException(status_code=404, detail="Бренд не найден")
 
     if body.name is not None:
-        if db.query(Brand).filter(Brand.name == body.name, Brand.id != brand_id).first():
+        if db.execute(
+            select(exists().where(Brand.name == body.name, Brand.id != brand_id))
+        ).scalar():
             raise HTTPException(status_code=400, detail="Бренд с таким названием уже существует")
         brand.name = body.name
         brand.slug = generate_brand_slug(body.name, db)
 
     if body.email is not None:
-        if (
-            db.query(AuthAccount)
-            .filter(AuthAccount.email == body.email, AuthAccount.id != brand.auth_account_id)
-            .first()
-        ):
+        if db.execute(
+            select(
+                exists().where(
+                    AuthAccount.email == body.email,
+                    AuthAccount.id != brand.auth_account_id,
+                )
+            )
+        ).scalar():
             raise HTTPException(status_code=400, detail="Email уже зарегистрирован")
         brand.auth_account.email = body.email
 
@@ -5385,9 +5566,7 @@ def admin_update_brand(
         brand.ogrn = body.ogrn
 
     brand.updated_at = datetime.now(timezone.utc)
-    db.commit()
-    db.refresh(brand)
-    return schemas.AdminBrandDetailResponse(
+    response = schemas.AdminBrandDetailResponse(
         id=str(brand.id),
         name=str(brand.name),
         email=brand.auth_account.email,
@@ -5416,6 +5595,10 @@ def admin_update_brand(
         created_at=brand.created_at,
         updated_at=brand.updated_at,
     )
+    db.commit()
+    invalidate_reference_cache("brands")
+
+    return response
 
 
 @app.put("/api/v1/admin/brands/{brand_id}/activate")
@@ -5456,6 +5639,8 @@ def admin_activate_brand(
         )
     brand.is_inactive = False
     db.commit()
+    invalidate_reference_cache("brands")
+    recommendation_service.invalidate_active_product_ids()
     return {"id": str(brand.id), "is_inactive": False}
 
 
@@ -5473,6 +5658,8 @@ def admin_deactivate_brand(
         raise HTTPException(status_code=404, detail="Бренд не найден")
     brand.is_inactive = True
     db.commit()
+    invalidate_reference_cache("brands")
+    recommendation_service.invalidate_active_product_ids()
     return {"id": str(brand.id), "is_inactive": True}
 
 
@@ -5516,21 +5703,24 @@ def admin_list_orders(
         except ValueError:
             pass
     orders = q.order_by(Order.created_at.desc()).all()
-    return [
-        schemas.AdminOrderSummaryResponse(
-            id=str(o.id),
-            number=str(o.order_number),
-            total_amount=float(o.total_amount),
-            currency="RUB",
-            date=o.created_at,
-            status=o.status.value,
-            tracking_number=str(o.tracking_number) if o.tracking_number else None,
-            tracking_link=str(o.tracking_link) if o.tracking_link else None,
-            shipping_cost=float(o.shipping_cost or 0.0),
-            brand_name=o.brand.name if o.brand else "—",
-        )
-        for o in orders
-    ]
+    return _model_list_response(
+        schemas.AdminOrderSummaryResponse,
+        [
+            schemas.AdminOrderSummaryResponse(
+                id=str(o.id),
+                number=str(o.order_number),
+                total_amount=float(o.total_amount),
+                currency="RUB",
+                date=o.created_at,
+                status=o.status.value,
+                tracking_number=str(o.tracking_number) if o.tracking_number else None,
+                tracking_link=str(o.tracking_link) if o.tracking_link else None,
+                shipping_cost=float(o.shipping_cost or 0.0),
+                brand_name=o.brand.name if o.brand else "—",
+            )
+            for o in orders
+        ],
+    )
 
 
 class OrderStatusEventResponse(BaseModel):
@@ -5547,7 +5737,7 @@ class OrderStatusEventResponse(BaseModel):
     "/api/v1/orders/{order_id}/history", response_model=List[OrderStatusEventResponse]
 )
 @limiter.limit("60/minute")
-async def get_order_status_history(
+def get_order_status_history(
     request: Request,
     order_id: str,
     current_user=Depends(get_current_user),
@@ -5555,7 +5745,7 @@ async def get_order_status_history(
 ):
     """Return status event history for an order. Brand sees own orders; admin sees all."""
 
-    order = db.query(Order).filter(Order.id == order_id).first()
+    order = db.execute(_ORDER_BY_ID_STMT, {"order_id": order_id}).scalar_one_or_none()
     if not order:
         raise HTTPException(status_code=404, detail="Заказ не найден")
     if isinstance(current_user, Brand):
@@ -5564,28 +5754,32 @@ async def get_order_status_history(
     else:
         if order.user_id != str(current_user.id):
             raise HTTPException(status_code=403, detail="Доступ запрещён")
-    from models import OrderStatusEvent as OSE
-
     events = (
-        db.query(OSE).filter(OSE.order_id == order_id).order_by(OSE.created_at).all()
+        db.query(OrderStatusEvent)
+        .filter(OrderStatusEvent.order_id == order_id)
+        .order_by(OrderStatusEvent.created_at)
+        .all()
+    )
+    return _model_list_response(
+        OrderStatusEventResponse,
+        [
+            OrderStatusEventResponse(
+                id=str(e.id),
+                from_status=e.from_status,
+                to_status=e.to_status,
+                actor_type=e.actor_type,
+                actor_id=e.actor_id,
+                note=e.note,
+                created_at=e.created_at,
+            )
+            for e in events
+        ],
     )
-    return [
-        OrderStatusEventResponse(
-            id=str(e.id),
-            from_status=e.from_status,
-            to_status=e.to_status,
-            actor_type=e.actor_type,
-            actor_id=e.actor_id,
-            note=e.note,
-            created_at=e.created_at,
-        )
-        for e in events
-    ]
 
 
 @app.get("/api/v1/checkouts/{checkout_id}", response_model=schemas.CheckoutResponse)
 @limiter.limit("60/minute")
-async def get_checkout_by_id(
+def get_checkout_by_id(
     request: Request,
     checkout_id: str,
     current_user: any = Depends(get_current_user),
@@ -5600,12 +5794,10 @@ async def get_checkout_by_id(
     checkout = (
         db.query(Checkout)
         .options(
-            joinedload(Checkout.orders)
-            .joinedload(Order.items)
-            .joinedload(OrderItem.product_variant)
-            .joinedload(ProductVariant.color_variant)
-            .joinedload(ProductColorVariant.product)
-            .joinedload(Product.brand),
+            selectinload(Checkout.orders).options(
+                joinedload(Order.brand).lazyload(Brand.auth_account),
+                _order_items_load,
+            ),
         )
         .filter(Checkout.id == checkout_id, Checkout.user_id == str(current_user.id))
         .first()
@@ -5665,6 +5857,22 @@ def mark_all_notifications_read(
     return None
 
 
+def _apply_payment_webhook(db: Session, event: str, order_id: str) -> None:
+    """Apply a YooKassa payment event to its order and commit."""
+    if event == "payment.succeeded":
+        payment_service.update_order_status(db, order_id, OrderStatus.PAID)
+        _order = db.query(Order).filter(Order.id == order_id).first()
+        if _order:
+            notification_service.send_brand_new_order_notification(
+                db=db,
+                brand_id=_order.brand_id,
+                order_id=str(_order.id),
+            )
+    else:
+        payment_service.update_order_status(db, order_id, OrderStatus.CANCELED)
+    db.commit()
+
+
 @app.post("/api/v1/payments/webhook")
 async def payment_webhook(request: Request, db: Session = Depends(get_db)):
     """Handle YooKassa payment webhooks"""
@@ -5675,34 +5883,20 @@ async def payment_webhook(request: Request, db: Session = Depends(get_db)):
             status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid IP address"
         )
 
-    request_body = await request.body()
-    payload = json.loads(request_body)
-    print(f"Webhook payload received: {payload}")
+    payload = orjson.loads(await request.body())
     event = payload.get("event")
-    print(f"Webhook event: {event}")
-    if event == "payment.succeeded":
-        payment = payload.get("object", {})
-        order_id = payment.get("metadata", {}).get("order_id")
-        print(f"Payment succeeded - Order ID: {order_id}")
-        if order_id:
-            payment_service.update_order_status(db, order_id, OrderStatus.PAID)
-            _order = db.query(Order).filter(Order.id == order_id).first()
-            if _order:
-                notification_service.send_brand_new_order_notification(
-                    db=db,
-                    brand_id=_order.brand_id,
-                    order_id=str(_order.id),
-                )
-    elif event == "payment.canceled":
+    logger.debug("Webhook event: %s", event)
+    if event in ("payment.succeeded", "payment.canceled"):
         payment = payload.get("object", {})
         order_id = payment.get("metadata", {}).get("order_id")
-        print(f"Payment canceled - Order ID: {order_id}")
+        logger.info("Payment %s - order_id=%s", event.split(".")[1], order_id)
         if order_id:
-            payment_service.update_order_status(db, order_id, OrderStatus.CANCELED)
-    db.commit()  # Added commit here
+            # Commit before acknowledging: YooKassa only redelivers when it doesn't get a
+            # 200, so a failed update must fail the request. The row-locking update runs
+            # in the threadpool rather than on the event loop.
+            await run_in_threadpool(_apply_payment_webhook, db, event, order_id)
     return {"status": "ok"}
 
-
 if __name__ == "__main__":
     import uvicorn
 
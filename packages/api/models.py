@@ -19,6 +19,8 @@ from sqlalchemy import (
     Text,
     TypeDecorator,
     UniqueConstraint,
+    func,
+    text,
 )
 from sqlalchemy import Enum as SQLEnum
 from sqlalchemy.dialects.postgresql import ARRAY, TSVECTOR
@@ -54,7 +56,22 @@ class AuthAccount(Base):
     """Shared auth credentials and verification for users and brands"""
 
     __tablename__ = "auth_accounts"
-    __table_args__ = {"extend_existing": True}
+    __table_args__ = (
+        # Partial: only accounts with a pending reset are indexed, so the index stays tiny
+        Index(
+            "ix_auth_accounts_password_reset_token",
+            "password_reset_token",
+            unique=True,
+            postgresql_where=text("password_reset_token IS NOT NULL"),
+        ),
+        Index(
+            "idx_auth_accounts_email_trgm",
+            "email",
+            postgresql_using="gin",
+            postgresql_ops={"email": "gin_trgm_ops"},
+        ),
+        {"extend_existing": True},
+    )
 
     id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
     email = Column(String(255), unique=True, nullable=False, index=True)
@@ -74,7 +91,7 @@ class AuthAccount(Base):
         DateTime(timezone=True), nullable=True
     )  # Expires 5 min from send
     otp_session_token = Column(
-        String(64), nullable=True
+        String(64), nullable=True, unique=True, index=True
     )  # secrets.token_hex(32) — ties OTP to login session; cleared after verify
     failed_otp_attempts = Column(
         Integer, default=0, nullable=False
@@ -90,7 +107,7 @@ class AuthAccount(Base):
     )  # When current resend window started
     failed_login_attempts = Column(Integer, default=0, nullable=False)
     login_locked_until = Column(DateTime(timezone=True), nullable=True)
-    refresh_token_hash = Column(String(255), nullable=True)
+    refresh_token_hash = Column(String(255), nullable=True, unique=True, index=True)
     refresh_token_expires_at = Column(DateTime(timezone=True), nullable=True)
     created_at = Column(DateTime(timezone=True), default=_utcnow)
     updated_at = Column(DateTime(timezone=True), default=_utcnow, onupdate=_utcnow)
@@ -114,7 +131,15 @@ class User(Base):
     """User model"""
 
     __tablename__ = "users"
-    __table_args__ = {"extend_existing": True}
+    __table_args__ = (
+        Index(
+            "idx_users_username_trgm",
+            "username",
+            postgresql_using="gin",
+            postgresql_ops={"username": "gin_trgm_ops"},
+        ),
+        {"extend_existing": True},
+    )
 
     id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
     username = Column(String(50), unique=True, nullable=False, index=True)
@@ -366,6 +391,16 @@ class Brand(Base):
         "AuthAccount", back_populates="brand", uselist=False, lazy="joined"
     )
 
+    @property
+    def email(self):
+        """Login email from the linked AuthAccount (lets BrandResponse validate from the ORM row)."""
+        return self.auth_account.email
+
+    @property
+    def two_factor_enabled(self):
+        """2FA flag from the linked AuthAccount."""
+        return bool(self.auth_account.two_factor_enabled)
+
 
 class Style(Base):
     """Style model"""
@@ -536,6 +571,12 @@ class Product(Base):
             postgresql_using="gin",
             postgresql_ops={"description": "gin_trgm_ops"},
         ),
+        Index(
+            "idx_products_article_number_trgm",
+            "article_number",
+            postgresql_using="gin",
+            postgresql_ops={"article_number": "gin_trgm_ops"},
+        ),
     )
 
 
@@ -693,6 +734,7 @@ class Friendship(Base):
     __tablename__ = "friendships"
     __table_args__ = (
         UniqueConstraint("user_id", "friend_id", name="uq_friendship_pair"),
+        Index("ix_friendships_friend_id_user_id", "friend_id", "user_id"),
         {"extend_existing": True},
     )
 
@@ -709,6 +751,15 @@ class Friendship(Base):
     friend = relationship("User", foreign_keys=[friend_id], back_populates="friends")
 
 
+# One row per unordered pair, whichever direction it was stored in
+Index(
+    "ix_friendships_pair_canonical",
+    func.least(Friendship.user_id, Friendship.friend_id),
+    func.greatest(Friendship.user_id, Friendship.friend_id),
+    unique=True,
+)
+
+
 # Add products relationship to Style model
 Style.products = relationship(
     "ProductStyle", back_populates="style", cascade="all, delete-orphan"
@@ -159,7 +159,8 @@ class OAuthService:
                 'provider_user_id': decoded.get('sub'),
                 'email': decoded.get('email'),
                 'avatar_url': None,
-                'is_verified': True
+                'is_verified': True,
+                'token_exp': decoded.get('exp'),
             }
         except Exception as e:
             print(f"Error verifying Apple token: {e}")
@@ -1,10 +1,13 @@
 import ipaddress
+import logging
 import os
 import random
 import string
+import time
 import uuid
 from datetime import datetime, timedelta, timezone
-from typing import List, Optional
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
 
 import models
 import schemas
@@ -36,6 +39,8 @@ from yookassa import Configuration, Payment
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 Configuration.account_id = os.getenv("YOOKASSA_SHOP_ID")
 Configuration.secret_key = os.getenv("YOOKASSA_SECRET_KEY")
 
@@ -50,12 +55,26 @@ YOOKASSA_IP_ADDRESSES = [
 ]
 
 
-def verify_webhook_ip(ip: str) -> bool:
-    ip_address = ipaddress.ip_address(ip)
-    for network in YOOKASSA_IP_ADDRESSES:
-        if ip_address in network:
-            return True
-    return False
+# Split by IP version so a lookup only walks networks it can actually match
+_YOOKASSA_NETWORKS_BY_VERSION: Dict[int, Tuple] = {
+    version: tuple(n for n in YOOKASSA_IP_ADDRESSES if n.version == version)
+    for version in (4, 6)
+}
+
+
+@lru_cache(maxsize=1024)
+def verify_webhook_ip(ip: Optional[str]) -> bool:
+    """Whether ip belongs to YooKassa's published webhook ranges (memoized per host)."""
+    if not ip:
+        return False
+    try:
+        ip_address = ipaddress.ip_address(ip)
+    except ValueError:
+        return False
+    return any(
+        ip_address in network
+        for network in _YOOKASSA_NETWORKS_BY_VERSION[ip_address.version]
+    )
 
 
 def record_status_event(
@@ -432,13 +451,27 @@ def get_payment(payment_id: str):
     return Payment.find_one(payment_id)
 
 
+# Short-lived cache of YooKassa statuses: clients poll payment status every
+# second or two, so bursts for the same payment collapse to one upstream call.
+PAYMENT_STATUS_CACHE_TTL = 2  # seconds
+PAYMENT_STATUS_CACHE_MAX_SIZE = 10_000
+_payment_status_cache: Dict[str, Tuple[float, str]] = {}
+
+
 def get_yookassa_payment_status(payment_id: str):
+    now = time.monotonic()
+    cached = _payment_status_cache.get(payment_id)
+    if cached and now - cached[0] < PAYMENT_STATUS_CACHE_TTL:
+        return cached[1]
     try:
         yookassa_payment = Payment.find_one(payment_id)
-        return yookassa_payment.status
     except Exception as e:
-        print(f"Error fetching YooKassa payment status for {payment_id}: {e}")
+        logger.warning("Error fetching YooKassa payment status for %s: %s", payment_id, e)
         return None
+    if len(_payment_status_cache) >= PAYMENT_STATUS_CACHE_MAX_SIZE:
+        _payment_status_cache.clear()
+    _payment_status_cache[payment_id] = (now, yookassa_payment.status)
+    return yookassa_payment.status
 
 
 def update_order_status(
@@ -449,11 +482,10 @@ def update_order_status(
     actor_id: Optional[str] = None,
     note: Optional[str] = None,
 ):
-    print(f"Attempting to update order {order_id} to status {status.value}")
     order = db.query(Order).with_for_update().filter(Order.id == order_id).first()
     if order:
-        print(
-            f"Found order {order_id}. Current status: {order.status.value}. New status: {status.value}"
+        logger.debug(
+            "Updating order %s status %s -> %s", order_id, order.status.value, status.value
         )
         old_status = order.status
 
@@ -475,9 +507,6 @@ def update_order_status(
         if old_status != status:
             if status == OrderStatus.PAID and old_status != OrderStatus.PAID:
                 # Order is being marked as PAID - increment purchase_count for all products in this order
-                print(
-                    f"Incrementing purchase_count for products in paid order {order_id}"
-                )
                 for item in order.items:
                     variant = variant_map.get(item.product_variant_id)
                     if variant:
@@ -485,9 +514,6 @@ def update_order_status(
                         if product:
                             quantity = getattr(item, "quantity", 1)
                             product.purchase_count += quantity
-                            print(
-                                f"Incremented purchase_count for product {product.id} by {quantity} (new count: {product.purchase_count})"
-                            )
 
             elif old_status == OrderStatus.PAID and status not in (
                 OrderStatus.PAID,
@@ -495,9 +521,6 @@ def update_order_status(
                 OrderStatus.PARTIALLY_RETURNED,
             ):
                 # Order was PAID but is now being changed to non-PAID (canceled, etc.) - decrement purchase_count
-                print(
-                    f"Decrementing purchase_count for products in order {order_id} (was PAID, now {status.value})"
-                )
                 for item in order.items:
                     variant = variant_map.get(item.product_variant_id)
                     if variant:
@@ -507,27 +530,22 @@ def update_order_status(
                             product.purchase_count = max(
                                 0, product.purchase_count - quantity
                             )
-                            print(
-                                f"Decremented purchase_count for product {product.id} by {quantity} (new count: {product.purchase_count})"
-                            )
 
         # If order is being cancelled, restore stock quantities
         # (RETURNED stock is handled per-item in admin_log_return)
         if status == OrderStatus.CANCELED and old_status != OrderStatus.CANCELED:
-            print(f"Restoring stock for cancelled order {order_id}")
+            logger.debug("Restoring stock for cancelled order %s", order_id)
             for item in order.items:
                 variant = variant_map.get(item.product_variant_id)
                 if variant:
                     quantity = getattr(item, "quantity", 1)
                     variant.stock_quantity += quantity
-                    print(f"Restored {quantity} units to product variant {variant.id}")
 
         record_status_event(db, order, status, actor_type, actor_id, note)
         order.status = status
         # db.commit() # Removed commit from here - commit is done by caller
-        print(f"Order {order_id} status updated to {order.status.value}")
     else:
-        print(f"Order {order_id} not found in database.")
+        logger.warning("Order %s not found while updating status", order_id)
 
 
 def expire_pending_orders(db: Session) -> int:
@@ -17,7 +17,7 @@ from typing import Dict, List, Optional, Set, Tuple
 logger = logging.getLogger(__name__)
 
 from sqlalchemy import func, exists, and_
-from sqlalchemy.orm import Session, joinedload
+from sqlalchemy.orm import Session, joinedload, selectinload
 
 from models import (
     Brand,
@@ -152,6 +152,50 @@ class CandidateRow:
 # Phase 1: SQL pre-filter
 # ---------------------------------------------------------------------------
 
+# Module-level cache of active product ids: (timestamp, ids)
+_active_ids_cache: Optional[Tuple[float, List[str]]] = None
+_active_ids_lock = threading.Lock()
+_ACTIVE_IDS_TTL = 5 * 60  # 5 minutes
+_CANDIDATE_SAMPLE_FACTOR = 4
+
+
+def _active_product_ids(db: Session) -> List[str]:
+    global _active_ids_cache
+    now = time.time()
+    with _active_ids_lock:
+        cached = _active_ids_cache
+        if cached and (now - cached[0]) < _ACTIVE_IDS_TTL:
+            return cached[1]
+
+    ids = [
+        pid
+        for (pid,) in db.query(Product.id)
+        .join(Brand, Brand.id == Product.brand_id)
+        .filter(Brand.is_inactive == False)  # noqa: E712
+        .all()
+    ]
+    with _active_ids_lock:
+        _active_ids_cache = (now, ids)
+    return ids
+
+
+def invalidate_active_product_ids() -> None:
+    """Drop the cached active product ids (call when products or brand activity change)"""
+    global _active_ids_cache
+    with _active_ids_lock:
+        _active_ids_cache = None
+
+
+def _sample_product_ids(db: Session, pool_size: int) -> Optional[List[str]]:
+    """Random subset of active product ids to shuffle in SQL, or None when the
+    catalog is small enough to shuffle whole."""
+    ids = _active_product_ids(db)
+    k = pool_size * _CANDIDATE_SAMPLE_FACTOR
+    if len(ids) <= k:
+        return None
+    return random.sample(ids, k)
+
+
 def _fetch_candidates(
     db: Session,
     exclude_user_id: str,
@@ -171,23 +215,7 @@ def _fetch_candidates(
         .subquery()
     )
 
-    q = (
-        db.query(
-            Product.id,
-            Product.brand_id,
-            Product.category_id,
-            Product.price,
-            Product.purchase_count,
-            Product.created_at,
-        )
-        .join(Brand, Brand.id == Product.brand_id)
-        .filter(
-            Brand.is_inactive == False,  # noqa: E712
-            ~Product.id.in_(swiped_sub),
-        )
-    )
-
-    # If user has a size, prefer products that have it in stock
+    size_exists = None
     if user_size:
         size_exists = (
             exists()
@@ -200,17 +228,9 @@ def _fetch_candidates(
                 )
             )
         )
-        # Order products with user's size first, then others
-        q = q.order_by(size_exists.desc(), func.random())
-    else:
-        q = q.order_by(func.random())
 
-    rows = q.limit(pool_size).all()
-
-    # If everything was swiped, retry without the swipe exclusion
-    if not rows:
-        logger.info("[reco] all candidates swiped — bypassing swipe filter for user=%s", exclude_user_id[:8])
-        q_all = (
+    def _query(exclude_swiped: bool, sample: Optional[List[str]]):
+        q = (
             db.query(
                 Product.id,
                 Product.brand_id,
@@ -222,22 +242,29 @@ def _fetch_candidates(
             .join(Brand, Brand.id == Product.brand_id)
             .filter(Brand.is_inactive == False)  # noqa: E712
         )
-        if user_size:
-            size_exists = (
-                exists()
-                .where(
-                    and_(
-                        ProductColorVariant.product_id == Product.id,
-                        ProductVariant.product_color_variant_id == ProductColorVariant.id,
-                        ProductVariant.size == user_size,
-                        ProductVariant.stock_quantity > 0,
-                    )
-                )
-            )
-            q_all = q_all.order_by(size_exists.desc(), func.random())
+        if exclude_swiped:
+            q = q.filter(~Product.id.in_(swiped_sub))
+        if sample is not None:
+            q = q.filter(Product.id.in_(sample))
+        # Order products with user's size first, then others
+        if size_exists is not None:
+            q = q.order_by(size_exists.desc(), func.random())
         else:
-            q_all = q_all.order_by(func.random())
-        rows = q_all.limit(pool_size).all()
+            q = q.order_by(func.random())
+        return q.limit(pool_size).all()
+
+    # Shuffle a bounded random slice of the catalog instead of the whole table. For a
+    # user who has swiped most of the catalog the slice can hold too few unswiped
+    # products, so fall back to the whole catalog whenever it can't fill the pool.
+    sample = _sample_product_ids(db, pool_size)
+    rows = _query(exclude_swiped=True, sample=sample)
+    if len(rows) < pool_size and sample is not None:
+        rows = _query(exclude_swiped=True, sample=None)
+
+    # If everything was swiped, retry without the swipe exclusion
+    if not rows:
+        logger.info("[reco] all candidates swiped — bypassing swipe filter for user=%s", exclude_user_id[:8])
+        rows = _query(exclude_swiped=False, sample=sample)
 
     if not rows:
         return []
@@ -463,8 +490,8 @@ def get_recommendations_for_user(
     products = (
         db.query(Product)
         .options(
-            joinedload(Product.styles),
-            joinedload(Product.color_variants).joinedload(ProductColorVariant.variants),
+            selectinload(Product.styles),
+            selectinload(Product.color_variants).selectinload(ProductColorVariant.variants),
             joinedload(Product.brand),
         )
         .filter(Product.id.in_(top_ids))
@@ -526,8 +553,8 @@ def get_recommendations_for_friend(
     products = (
         db.query(Product)
         .options(
-            joinedload(Product.styles),
-            joinedload(Product.color_variants).joinedload(ProductColorVariant.variants),
+            selectinload(Product.styles),
+            selectinload(Product.color_variants).selectinload(ProductColorVariant.variants),
             joinedload(Product.brand),
         )
         .filter(Product.id.in_(top_ids))
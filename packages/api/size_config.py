@@ -1,6 +1,7 @@
 """Category-specific size configuration, validation, and sort logic."""
 
 import re
+from functools import lru_cache
 from typing import List, Optional
 
 # Size type constants
@@ -25,6 +26,7 @@ EU_SHOE_SIZES = [s / 2 for s in range(70, 101)]  # 35.0-50.0 in 0.5 steps
 
 _STANDARD_ORDER = {s: i for i, s in enumerate(STANDARD_SIZES)}
 _WAIST_LENGTH_RE = re.compile(r"^(\d{2,3})\s*[×x]\s*(\d{2,3})$")
+_ASCII_X_RE = re.compile(r"(?<=\d)\s*x\s*(?=\d)")
 
 
 def get_size_types(category_id: str) -> List[str]:
@@ -56,7 +58,7 @@ def normalize_size(size: str, category_id: str) -> str:
         return size
     allowed = get_size_types(category_id)
     if WAIST_LENGTH in allowed:
-        return re.sub(r"(?<=\d)\s*x\s*(?=\d)", "×", size)
+        return _ASCII_X_RE.sub("×", size)
     return size
 
 
@@ -127,6 +129,9 @@ def validate_size_consistency(category_id: str, sizes: List[str]) -> Optional[st
     return None
 
 
+# Sizes come from a small fixed vocabulary, so listings keep sorting the same
+# few (size, category) pairs; cache their parsed keys.
+@lru_cache(maxsize=1024)
 def get_size_sort_key(size: str, category_id: str = "") -> tuple:
     """Return sort key tuple for correct ordering."""
     if size == "One Size":
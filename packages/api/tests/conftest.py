@@ -41,7 +41,8 @@ from sqlalchemy.pool import NullPool  # noqa: E402
 
 from database import get_db  # noqa: E402
 from models import Base  # noqa: E402
-from main import app  # noqa: E402
+from main import app, invalidate_reference_cache  # noqa: E402
+from recommendation_service import invalidate_active_product_ids  # noqa: E402
 
 # ---------------------------------------------------------------------------
 # 3. Engine — NullPool so each session gets its own connection
@@ -76,6 +77,9 @@ def _truncate_all():
 def setup_db(setup_schema):
     """Truncate all tables before each test for a clean slate."""
     _truncate_all()
+    # Factories write straight to the DB, so drop lists cached by earlier tests
+    invalidate_reference_cache()
+    invalidate_active_product_ids()
     yield
 
 
@@ -1,7 +1,8 @@
-"""Login, lockout, token refresh, email verification tests (14 tests)."""
+"""Login, lockout, token refresh, email verification, password reset tests (19 tests)."""
 
 import uuid
 from datetime import datetime, timedelta, timezone
+from unittest.mock import patch
 
 from factories import register_and_login
 
@@ -50,6 +51,19 @@ def test_login_nonexistent_user(client):
     assert resp.status_code == 401
 
 
+def test_login_nonexistent_user_still_checks_hash(client):
+    """Unknown identifiers spend one bcrypt check, same as a wrong password."""
+    import bcrypt
+
+    with patch("auth_service.bcrypt.checkpw", wraps=bcrypt.checkpw) as checkpw:
+        resp = client.post(
+            "/api/v1/auth/login",
+            json={"identifier": "nobody-timing@test.com", "password": "NoPass123"},
+        )
+    assert resp.status_code == 401
+    assert checkpw.call_count == 1
+
+
 def test_login_unverified_resends_code(client, mock_mail):
     email = f"unverified-{uuid.uuid4().hex[:6]}@test.com"
     register_and_login(client, email=email)
@@ -192,6 +206,7 @@ def test_verify_email_wrong_code(client):
         json={"email": email, "code": "000000"},
     )
     assert resp.status_code == 400
+    assert resp.json()["detail"] == "Неверный email или код"
 
 
 def test_verify_email_expired_code(client, db):
@@ -210,6 +225,7 @@ def test_verify_email_expired_code(client, db):
         json={"email": email, "code": code},
     )
     assert resp.status_code == 400
+    assert resp.json()["detail"] == "Код подтверждения истёк"
 
 
 def test_login_after_verification(client, db):
@@ -226,3 +242,40 @@ def test_login_after_verification(client, db):
     )
     assert resp.status_code == 200
     assert resp.json()["user"]["is_email_verified"] is True
+
+
+# ---------- Password reset link ----------
+
+
+def _set_reset_token(db, email, expires_in):
+    import hashlib
+
+    from models import AuthAccount
+
+    acc = db.query(AuthAccount).filter(AuthAccount.email == email).first()
+    token = uuid.uuid4().hex
+    acc.password_reset_token = hashlib.sha256(token.encode()).hexdigest()
+    acc.password_reset_expires = datetime.now(timezone.utc) + expires_in
+    db.commit()
+    return token
+
+
+def test_reset_password_invalid_token(client):
+    resp = client.post(
+        "/api/v1/auth/reset-password",
+        json={"token": "not-a-token", "new_password": "NewPass123"},
+    )
+    assert resp.status_code == 400
+    assert resp.json()["detail"] == "Недействительная ссылка"
+
+
+def test_reset_password_expired_token(client, db):
+    email = f"rstexp-{uuid.uuid4().hex[:6]}@test.com"
+    register_and_login(client, email=email)
+    token = _set_reset_token(db, email, timedelta(minutes=-1))
+    resp = client.post(
+        "/api/v1/auth/reset-password",
+        json={"token": token, "new_password": "NewPass123"},
+    )
+    assert resp.status_code == 400
+    assert resp.json()["detail"] == "Ссылка для сброса пароля истекла"
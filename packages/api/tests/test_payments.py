@@ -1,4 +1,4 @@
-"""Order lifecycle, stock integrity, webhooks (17 tests)."""
+"""Order lifecycle, stock integrity, webhooks, payment status cache."""
 
 import json
 from datetime import datetime, timedelta, timezone
@@ -260,6 +260,39 @@ def test_webhook_payment_canceled(client, db):
     assert variant.stock_quantity == 10  # restored
 
 
+def test_webhook_update_failure_is_not_acknowledged(client, db):
+    from fastapi.testclient import TestClient
+
+    from main import app
+
+    user = create_test_user(db)
+    brand, product, variant = create_test_brand_with_product(db, stock=10)
+    order = create_order_in_db(db, user, brand, variant, qty=1, price=1000)
+
+    payload = json.dumps(
+        {
+            "event": "payment.succeeded",
+            "object": {"metadata": {"order_id": order.id}},
+        }
+    )
+    with _mock_webhook_ip(), patch(
+        "payment_service.update_order_status", side_effect=RuntimeError("db down")
+    ), TestClient(app, raise_server_exceptions=False) as failing_client:
+        resp = failing_client.post("/api/v1/payments/webhook", content=payload)
+    # A non-2xx answer makes YooKassa redeliver the event
+    assert resp.status_code == 500
+
+    db.refresh(order)
+    assert order.status != OrderStatus.PAID
+
+    # The redelivery then goes through
+    with _mock_webhook_ip():
+        resp = client.post("/api/v1/payments/webhook", content=payload)
+    assert resp.status_code == 200
+    db.refresh(order)
+    assert order.status == OrderStatus.PAID
+
+
 def test_webhook_invalid_ip_rejected(client):
     with patch("payment_service.verify_webhook_ip", return_value=False):
         resp = client.post(
@@ -309,3 +342,18 @@ def test_expired_order_restores_stock(db):
     assert variant.stock_quantity == 10
     db.refresh(order)
     assert order.status == OrderStatus.CANCELED
+
+
+# ---------- YooKassa status cache ----------
+
+
+def test_yookassa_status_cached_between_polls():
+    import payment_service
+
+    payment_service._payment_status_cache.clear()
+    fake_payment = type("FakePayment", (), {"status": "pending"})()
+    with patch("payment_service.Payment.find_one", return_value=fake_payment) as find_one:
+        assert payment_service.get_yookassa_payment_status("pay-1") == "pending"
+        assert payment_service.get_yookassa_payment_status("pay-1") == "pending"
+    assert find_one.call_count == 1
+    payment_service._payment_status_cache.clear()
@@ -4,6 +4,7 @@ from factories import (
     auth_header as _auth,
     create_test_brand_with_product,
     create_test_category,
+    create_test_style,
     create_test_user,
     create_product_with_styles,
     make_brand_token,
@@ -127,3 +128,122 @@ def test_brand_cannot_see_other_brand_product(client, db):
     token = make_brand_token(brand2)
     resp = client.get(f"/api/v1/brands/products/{product.id}", headers=_auth(token))
     assert resp.status_code == 403
+
+
+def _product_create_payload(brand, category, styles=None):
+    return {
+        "name": "Bulk Test Shirt",
+        "price": 1500,
+        "brand_id": brand.id,
+        "category_id": category.id,
+        "styles": styles or [],
+        "color_variants": [
+            {
+                "color_name": "Black",
+                "color_hex": "#000000",
+                "images": ["https://img.test/black.jpg"],
+                "variants": [
+                    {"size": "S", "stock_quantity": 3},
+                    {"size": "M", "stock_quantity": 5},
+                ],
+            },
+            {
+                "color_name": "White",
+                "color_hex": "#FFFFFF",
+                "images": ["https://img.test/white.jpg"],
+                "variants": [{"size": "L", "stock_quantity": 2}],
+            },
+        ],
+    }
+
+
+def test_brand_create_product_with_variants_and_styles(client, db):
+    brand, _, _ = create_test_brand_with_product(db)
+    cat = create_test_category(db)
+    style1 = create_test_style(db)
+    style2 = create_test_style(db)
+    token = make_brand_token(brand)
+    payload = _product_create_payload(brand, cat, styles=[style1.id, style2.id])
+    resp = client.post("/api/v1/brands/products", json=payload, headers=_auth(token))
+    assert resp.status_code == 201
+    data = resp.json()
+    assert sorted(data["styles"]) == sorted([style1.id, style2.id])
+    colors = {cv["color_name"]: cv for cv in data["color_variants"]}
+    assert set(colors) == {"Black", "White"}
+    assert sorted(v["size"] for v in colors["Black"]["variants"]) == ["M", "S"]
+    assert [v["stock_quantity"] for v in colors["White"]["variants"]] == [2]
+
+
+def test_brand_create_product_unknown_style_400(client, db):
+    brand, _, _ = create_test_brand_with_product(db)
+    cat = create_test_category(db)
+    style = create_test_style(db)
+    token = make_brand_token(brand)
+    payload = _product_create_payload(brand, cat, styles=[style.id, "missing-style"])
+    resp = client.post("/api/v1/brands/products", json=payload, headers=_auth(token))
+    assert resp.status_code == 400
+    assert "missing-style" in resp.json()["detail"]
+
+
+def test_brand_create_product_retries_article_number_collision(client, db, monkeypatch):
+    import main
+
+    brand, existing, _ = create_test_brand_with_product(db)
+    existing.article_number = "TAKEN-0001"
+    db.commit()
+    cat = create_test_category(db)
+    token = make_brand_token(brand)
+    numbers = iter(["TAKEN-0001", "FRESH-0002"])
+    monkeypatch.setattr(main, "generate_article_number", lambda *_: next(numbers))
+
+    payload = _product_create_payload(brand, cat)
+    resp = client.post("/api/v1/brands/products", json=payload, headers=_auth(token))
+    assert resp.status_code == 201
+    assert resp.json()["article_number"] == "FRESH-0002"
+
+
+def test_brand_update_product_replaces_variants_and_styles(client, db):
+    brand, _, _ = create_test_brand_with_product(db)
+    cat = create_test_category(db)
+    old_style = create_test_style(db)
+    new_style = create_test_style(db)
+    token = make_brand_token(brand)
+    payload = _product_create_payload(brand, cat, styles=[old_style.id])
+    created = client.post("/api/v1/brands/products", json=payload, headers=_auth(token))
+    assert created.status_code == 201
+    product_id = created.json()["id"]
+
+    update = {
+        "styles": [new_style.id],
+        "color_variants": [
+            {
+                "color_name": "Black",
+                "color_hex": "#111111",
+                "images": ["https://img.test/black.jpg"],
+                "variants": [
+                    {"size": "M", "stock_quantity": 7},
+                    {"size": "XL", "stock_quantity": 1},
+                ],
+            },
+            {
+                "color_name": "Red",
+                "color_hex": "#FF0000",
+                "images": ["https://img.test/red.jpg"],
+                "variants": [{"size": "S", "stock_quantity": 4}],
+            },
+        ],
+    }
+    resp = client.put(
+        f"/api/v1/brands/products/{product_id}", json=update, headers=_auth(token)
+    )
+    assert resp.status_code == 200
+    data = resp.json()
+    assert data["styles"] == [new_style.id]
+    colors = {cv["color_name"]: cv for cv in data["color_variants"]}
+    assert set(colors) == {"Black", "Red"}
+    assert colors["Black"]["color_hex"] == "#111111"
+    assert {v["size"]: v["stock_quantity"] for v in colors["Black"]["variants"]} == {
+        "M": 7,
+        "XL": 1,
+    }
+    assert [v["size"] for v in colors["Red"]["variants"]] == ["S"]
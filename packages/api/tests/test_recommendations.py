@@ -12,6 +12,8 @@ from factories import (
     create_test_brand_with_product,
     create_test_user,
     create_user_like,
+    create_user_swipe,
+    make_brand_token,
     make_token,
 )
 from recommendation_service import (
@@ -180,6 +182,50 @@ def test_context_reflects_likes(db):
     assert ctx.median_price == 2000.0
 
 
+def test_fetch_candidates_fills_pool_when_sample_is_mostly_swiped(db):
+    user = create_test_user(db)
+    products = [create_test_brand_with_product(db)[1] for _ in range(12)]
+    swiped, unswiped = products[:10], products[10:]
+    for product in swiped:
+        create_user_swipe(db, user, product)
+
+    # pool_size=2 samples 8 ids; hand it a slice with a single unswiped product
+    sample = [p.id for p in swiped[:7]] + [unswiped[0].id]
+    with patch.object(recommendation_service.random, "sample", return_value=sample):
+        candidates = recommendation_service._fetch_candidates(db, user.id, None, pool_size=2)
+
+    assert {c.id for c in candidates} == {p.id for p in unswiped}
+
+
+def test_active_product_ids_cache_invalidated_on_product_create(client, db):
+    brand, existing, _ = create_test_brand_with_product(db)
+    assert recommendation_service._active_product_ids(db) == [existing.id]
+
+    resp = client.post(
+        "/api/v1/brands/products",
+        headers=_auth(make_brand_token(brand)),
+        json={
+            "name": "Fresh Drop",
+            "price": 1500,
+            "brand_id": brand.id,
+            "category_id": existing.category_id,
+            "color_variants": [
+                {
+                    "color_name": "Black",
+                    "color_hex": "#000000",
+                    "images": ["https://img.test/black.jpg"],
+                    "variants": [{"size": "M", "stock_quantity": 1}],
+                }
+            ],
+        },
+    )
+    assert resp.status_code == 201
+    assert set(recommendation_service._active_product_ids(db)) == {
+        existing.id,
+        resp.json()["id"],
+    }
+
+
 # ---------------------------------------------------------------------------
 # Integration tests — HTTP endpoints (mock recommendation_service to avoid
 # PG-specific SQL in _fetch_candidates)
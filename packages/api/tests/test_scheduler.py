@@ -39,7 +39,7 @@ def _create_brand_for_deletion(db, scheduled_deletion_at=None):
         password_hash="hashed",
         is_email_verified=True,
         otp_code="123456",
-        refresh_token_hash="tok",
+        refresh_token_hash=f"tok-{uuid.uuid4().hex}",
         password_history=["old_hash"],
     )
     db.add(auth)
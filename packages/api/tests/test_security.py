@@ -1,8 +1,11 @@
-"""Security tests: malicious input, auth bypass, IDOR (10 tests)."""
+"""Security tests: malicious input, auth bypass, IDOR (15 tests)."""
 
+import time
+import uuid
 from datetime import datetime, timedelta, timezone
 
 import jwt as pyjwt
+from freezegun import freeze_time
 
 from factories import (
     auth_header as _auth,
@@ -105,6 +108,95 @@ def test_tampered_token_rejected(client):
     assert resp.status_code == 401
 
 
+def test_cached_token_payload_honours_expiry():
+    from auth_service import auth_service
+
+    expires_at = datetime.now(timezone.utc) + timedelta(minutes=5)
+    token = auth_service.create_access_token(
+        data={"sub": "user-123"}, expires_at=expires_at
+    )
+    assert auth_service.verify_token_payload(token)["sub"] == "user-123"
+    # The second lookup would come from the payload cache; it must still expire
+    with freeze_time(expires_at + timedelta(seconds=1)):
+        assert auth_service.verify_token_payload(token) is None
+
+
+def test_oauth_user_info_cache_hit_and_ttl(db):
+    import asyncio
+    from unittest.mock import AsyncMock, patch
+
+    from auth_service import auth_service
+
+    user_info = {
+        "provider": "google",
+        "provider_user_id": f"g-{uuid.uuid4().hex}",
+        "email": f"oauth-{uuid.uuid4().hex[:8]}@test.com",
+        "avatar_url": None,
+        "is_verified": True,
+    }
+    fetch = AsyncMock(return_value=user_info)
+    token = f"google-token-{uuid.uuid4().hex}"
+    with patch("oauth_service.oauth_service.get_google_user_info", fetch):
+        assert asyncio.run(auth_service.handle_oauth_login(db, "google", token))
+        assert asyncio.run(auth_service.handle_oauth_login(db, "google", token))
+        assert fetch.await_count == 1
+        with freeze_time(datetime.now(timezone.utc) + timedelta(minutes=16)):
+            assert asyncio.run(auth_service.handle_oauth_login(db, "google", token))
+        assert fetch.await_count == 2
+
+
+def test_oauth_user_info_cache_stops_at_token_expiry(db):
+    import asyncio
+    from unittest.mock import AsyncMock, patch
+
+    from auth_service import auth_service
+
+    exp = int(time.time()) + 60
+    user_info = {
+        "provider": "apple",
+        "provider_user_id": f"a-{uuid.uuid4().hex}",
+        "email": f"oauth-{uuid.uuid4().hex[:8]}@test.com",
+        "avatar_url": None,
+        "is_verified": True,
+        "token_exp": exp,
+    }
+    verify = AsyncMock(return_value=user_info)
+    token = f"apple-token-{uuid.uuid4().hex}"
+    with patch("oauth_service.oauth_service.verify_apple_token", verify):
+        assert asyncio.run(auth_service.handle_oauth_login(db, "apple", token))
+        # Well inside the 15-minute TTL, but past the token's own exp
+        with freeze_time(datetime.fromtimestamp(exp + 1, timezone.utc)):
+            asyncio.run(auth_service.handle_oauth_login(db, "apple", token))
+        assert verify.await_count == 2
+
+
+def test_rate_limit_key_is_per_account_when_authenticated(db):
+    from starlette.requests import Request
+
+    from main import _rate_limit_key
+
+    def _request(token=None):
+        headers = [(b"authorization", f"Bearer {token}".encode())] if token else []
+        return Request({"type": "http", "headers": headers, "client": ("10.0.0.1", 1234)})
+
+    user_a = create_test_user(db)
+    user_b = create_test_user(db)
+    assert _rate_limit_key(_request(_get_token(user_a))) == f"user:{user_a.id}"
+    assert _rate_limit_key(_request(_get_token(user_b))) == f"user:{user_b.id}"
+    assert _rate_limit_key(_request("not-a-jwt")) == "10.0.0.1"
+    assert _rate_limit_key(_request()) == "10.0.0.1"
+
+
+def test_password_reuse_check_reports_first_match():
+    from auth_service import auth_service
+
+    hashes = [auth_service.hash_password(p) for p in ("current", "old-1", "old-2")]
+    assert auth_service.find_matching_hash("current", hashes) == 0
+    assert auth_service.find_matching_hash("old-2", hashes) == 2
+    assert auth_service.find_matching_hash("brand-new", hashes) is None
+    assert auth_service.find_matching_hash("current", []) is None
+
+
 def test_brand_cannot_create_order(client, db):
     brand, product, variant = create_test_brand_with_product(db)
     from auth_service import auth_service
@@ -1,5 +1,7 @@
 """Tests for social features: favorites, swipes, friends."""
 
+import uuid
+
 from factories import (
     auth_header as _auth,
     create_friend_pair,
@@ -8,7 +10,7 @@ from factories import (
     create_user_like,
     make_token,
 )
-from models import FriendRequest, Friendship
+from models import FriendRequest, Friendship, UserSwipe
 
 
 # ---------- favorites ----------
@@ -40,6 +42,20 @@ def test_toggle_like_off(client, db):
     assert resp.status_code == 200
 
 
+def test_toggle_like_twice_is_idempotent(client, db):
+    user = create_test_user(db)
+    _, product, _ = create_test_brand_with_product(db)
+    create_user_like(db, user, product)
+    token = make_token(user)
+    resp = client.post(
+        "/api/v1/user/favorites/toggle",
+        headers=_auth(token),
+        json={"product_id": product.id, "action": "like"},
+    )
+    assert resp.status_code == 200
+    assert resp.json()["message"] == "Item already liked."
+
+
 def test_get_favorites_list(client, db):
     user = create_test_user(db)
     _, product, _ = create_test_brand_with_product(db)
@@ -74,6 +90,36 @@ def test_track_swipe(client, db):
     assert resp.status_code == 200
 
 
+def test_track_swipe_counts_each_swipe(client, db):
+    user = create_test_user(db)
+    _, product, _ = create_test_brand_with_product(db)
+    token = make_token(user)
+    for _ in range(3):
+        resp = client.post(
+            "/api/v1/user/swipe",
+            headers=_auth(token),
+            json={"product_id": product.id},
+        )
+        assert resp.status_code == 200
+
+    db.refresh(user)
+    assert user.items_swiped == 3
+    assert db.query(UserSwipe).filter(UserSwipe.user_id == user.id).count() == 3
+
+
+def test_track_swipe_unknown_product(client, db):
+    user = create_test_user(db)
+    token = make_token(user)
+    resp = client.post(
+        "/api/v1/user/swipe",
+        headers=_auth(token),
+        json={"product_id": str(uuid.uuid4())},
+    )
+    assert resp.status_code == 404
+    db.refresh(user)
+    assert not user.items_swiped
+
+
 def test_recent_swipes(client, db):
     user = create_test_user(db)
     _, product, _ = create_test_brand_with_product(db)
@@ -155,6 +201,33 @@ def test_accept_friend_request(client, db):
     assert friendship is not None
 
 
+def test_accept_friend_request_when_already_friends(client, db):
+    user1 = create_test_user(db)
+    user2 = create_test_user(db)
+    create_friend_pair(db, user2, user1)
+    fr = FriendRequest(sender_id=user1.id, recipient_id=user2.id)
+    db.add(fr)
+    db.commit()
+    request_id = fr.id
+
+    resp = client.post(
+        f"/api/v1/friends/requests/{request_id}/accept",
+        headers=_auth(make_token(user2)),
+    )
+    assert resp.status_code == 200
+
+    db.expire_all()
+    assert db.query(FriendRequest).count() == 0
+    assert db.query(Friendship).count() == 1
+
+    # The request is consumed; accepting it again is a 404
+    resp = client.post(
+        f"/api/v1/friends/requests/{request_id}/accept",
+        headers=_auth(make_token(user2)),
+    )
+    assert resp.status_code == 404
+
+
 def test_list_friends(client, db):
     user1 = create_test_user(db)
     user2 = create_test_user(db)
@@ -201,3 +274,14 @@ def test_send_friend_request_nonexistent_user(client, db):
         json={"recipient_identifier": "ghost_user_999"},
     )
     assert resp.status_code == 400
+
+
+def test_search_users_treats_underscore_literally(client, db):
+    me = create_test_user(db)
+    tag = uuid.uuid4().hex[:6]
+    match = create_test_user(db, username=f"ab_{tag}")
+    create_test_user(db, username=f"abx{tag}")
+    token = make_token(me)
+    resp = client.get(f"/api/v1/users/search?query=ab_{tag}", headers=_auth(token))
+    assert resp.status_code == 200
+    assert [u["id"] for u in resp.json()] == [match.id]
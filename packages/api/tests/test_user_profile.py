@@ -20,6 +20,22 @@ def test_get_profile_200(client, db):
     assert data["username"] == user.username
 
 
+def test_get_profile_etag_304(client, db):
+    user = create_test_user(db)
+    token = make_token(user)
+    first = client.get("/api/v1/user/profile", headers=_auth(token))
+    assert first.status_code == 200
+    etag = first.headers["etag"]
+    assert "no-cache" in first.headers["cache-control"]
+
+    resp = client.get(
+        "/api/v1/user/profile",
+        headers={**_auth(token), "If-None-Match": etag},
+    )
+    assert resp.status_code == 304
+    assert resp.content == b""
+
+
 def test_get_profile_unauthenticated(client):
     resp = client.get("/api/v1/user/profile")
     assert resp.status_code in (401, 403)
@@ -96,6 +112,24 @@ def test_update_preferences(client, db):
     assert resp.status_code == 200
 
 
+def test_update_single_preference_returns_defaults_for_the_rest(client, db):
+    user = create_test_user(db)
+    token = make_token(user)
+    resp = client.put(
+        "/api/v1/user/preferences",
+        headers=_auth(token),
+        json={"likes_privacy": "everyone"},
+    )
+    assert resp.status_code == 200
+    assert resp.json() == {
+        "size_privacy": "friends",
+        "recommendations_privacy": "friends",
+        "likes_privacy": "everyone",
+        "order_notifications": True,
+        "marketing_notifications": True,
+    }
+
+
 # ---------- completion status ----------
 
 